@@ -0,0 +1,162 @@
+import argparse
+import numpy as np
+from game import GameSession
+from gamelog import open_logs
+
+# Counters are indexed by the number of players of the table
+_TABLES = max(GameSession.allowed_players) + 1
+_OUTCOMES = (b'W', b'L', b'N')
+# Passes numbered from 1, index 0 counts the rounds where it stayed closed
+_PASSES = GameSession.total_cards // min(GameSession.allowed_players) + 1
+
+
+class LogStats:
+    """
+    This class accumulates statistics of logged rounds. The counters are
+    NumPy arrays updated a whole block of records at a time, so any
+    number of log files can be added without holding them in memory.
+    Success rates leave out the invalid ('N') rounds.
+
+    Attributes:
+        rounds (ndarray) - rounds by table size
+        outcomes (ndarray) - (table size, 'W'/'L'/'N') round outcomes
+        bids (ndarray) - (table size, wager) rounds played at a wager
+        bid_wins (ndarray) - (table size, wager) rounds won at a wager
+        goats (ndarray) - goat rounds by table size, goat_wins won
+        open_goats (ndarray) - open goat rounds, open_goat_wins won
+        trump_open (ndarray) - (table size, pass) pass where the trump
+                               was opened, 0 if it was not
+        jackies (ndarray) - rounds after which a jackie was given
+    """
+    def __init__(self):
+        shape = (_TABLES, GameSession.total_points + 1)
+        self.rounds = np.zeros(_TABLES, np.int64)
+        self.outcomes = np.zeros((_TABLES, len(_OUTCOMES)), np.int64)
+        self.bids = np.zeros(shape, np.int64)
+        self.bid_wins = np.zeros(shape, np.int64)
+        self.goats = np.zeros(_TABLES, np.int64)
+        self.goat_wins = np.zeros(_TABLES, np.int64)
+        self.open_goats = np.zeros(_TABLES, np.int64)
+        self.open_goat_wins = np.zeros(_TABLES, np.int64)
+        self.trump_open = np.zeros((_TABLES, _PASSES), np.int64)
+        self.jackies = np.zeros(_TABLES, np.int64)
+
+    def add(self, records, block=1 << 20):
+        """
+        Add the statistics of an array of log records
+
+        Parameters:
+            records (ndarray) - records of gamelog.RECORD, e.g. a memory
+                                mapped log file
+            block (int) - records read at once
+        """
+        for start in range(0, len(records), block):
+            self._add_block(records[start:start + block])
+        return self
+
+    def _add_block(self, records):
+        """Add the statistics of a block of records"""
+        tables = records["no_players"].astype(np.intp)
+        outcome = records["outcome"]
+        won = outcome == b'W'
+        valid = outcome != b'N'
+        open_goat = records["open_goat"]
+        goat = records["goat"] & ~open_goat
+        self.rounds += np.bincount(tables, minlength=_TABLES)
+        for i, code in enumerate(_OUTCOMES):
+            self.outcomes[:, i] += np.bincount(tables[outcome == code],
+                                               minlength=_TABLES)
+        # Bid levels, the open goat is counted on its own
+        bid = valid & ~open_goat
+        level = tables * self.bids.shape[1] + records["wager"]
+        size = self.bids.size
+        self.bids += np.bincount(level[bid], minlength=size).reshape(
+                                                        self.bids.shape)
+        self.bid_wins += np.bincount(level[bid & won], minlength=size).reshape(
+                                                        self.bids.shape)
+        self.goats += np.bincount(tables[goat & valid], minlength=_TABLES)
+        self.goat_wins += np.bincount(tables[goat & won], minlength=_TABLES)
+        self.open_goats += np.bincount(tables[open_goat & valid],
+                                       minlength=_TABLES)
+        self.open_goat_wins += np.bincount(tables[open_goat & won],
+                                           minlength=_TABLES)
+        opened = np.maximum(records["trump_open_pass"], 0).astype(np.intp)
+        self.trump_open += np.bincount(
+                    tables * _PASSES + opened,
+                    minlength=self.trump_open.size).reshape(
+                                                    self.trump_open.shape)
+        self.jackies += np.bincount(tables[records["jackie"]],
+                                    minlength=_TABLES)
+
+    def merge(self, other):
+        """Merge the statistics of another LogStats into this one"""
+        for name, counter in vars(other).items():
+            getattr(self, name)[...] += counter
+        return self
+
+    def summary(self):
+        """
+        Return the statistics of every table size
+
+        Returns:
+            summary (dict) - maps the number of players to a dict of
+                             the rates of the rounds played
+        """
+        summary = {}
+        for table in np.flatnonzero(self.rounds):
+            rounds = self.rounds[table]
+            bids = self.bids[table]
+            levels = np.flatnonzero(bids)
+            summary[int(table)] = {
+                "rounds": int(rounds),
+                "outcomes": {code.decode(): self.outcomes[table, i] / rounds
+                             for i, code in enumerate(_OUTCOMES)},
+                "invalid_rate": self.outcomes[table, 2] / rounds,
+                "bid_success": {
+                    int(level): (int(bids[level]),
+                                 self.bid_wins[table, level] / bids[level])
+                    for level in levels},
+                "goat_success": (int(self.goats[table]),
+                                 self.goat_wins[table] /
+                                 max(self.goats[table], 1)),
+                "open_goat_success": (int(self.open_goats[table]),
+                                      self.open_goat_wins[table] /
+                                      max(self.open_goats[table], 1)),
+                "trump_open_pass": self.trump_open[table] / rounds,
+                "jackie_rate": self.jackies[table] / rounds}
+        return summary
+
+
+def analyse(pattern):
+    """Return the LogStats of every log file matching a glob pattern"""
+    stats = LogStats()
+    for records in open_logs(pattern):
+        stats.add(records)
+    return stats
+
+
+def print_summary(summary):
+    """Print the summary of a LogStats"""
+    for table, stats in summary.items():
+        print("{} players: {} rounds".format(table, stats["rounds"]))
+        print("  outcomes  " + "  ".join(
+                "{} {:.3f}".format(code, rate)
+                for code, rate in stats["outcomes"].items()))
+        print("  jackies per round {:.4f}".format(stats["jackie_rate"]))
+        print("  bid success")
+        for level, (count, rate) in stats["bid_success"].items():
+            print("    {:>2}  {:>9}  {:.3f}".format(level, count, rate))
+        print("  goat       {:>9}  {:.3f}".format(*stats["goat_success"]))
+        print("  open goat  {:>9}  {:.3f}".format(
+                                            *stats["open_goat_success"]))
+        print("  trump opened at pass (0 = never)")
+        for pass_no, rate in enumerate(stats["trump_open_pass"]):
+            print("    {:>2}  {:.3f}".format(pass_no, rate))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        description="Print statistics of game log files")
+    parser.add_argument("pattern", help="glob pattern of the log files")
+    args = parser.parse_args()
+    print_summary(analyse(args.pattern).summary())
@@ -0,0 +1,172 @@
+import argparse
+import glob
+import hashlib
+import os
+import numpy as np
+from PIL import Image
+from PIL.ImageTk import PhotoImage
+from game import GameSession
+
+CARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir, "cards")
+CACHE_DIR = os.path.join(CARD_DIR, ".cache")
+# Size of the suit images displayed as the trump
+SUIT_SIZE = (70, 85)
+# Changing the layout of the atlas invalidates the cached atlases
+ATLAS_VERSION = 1
+# Decoded atlases and sprite boxes by card size
+_atlases = {}
+
+
+def _sources(card_size):
+    """
+    Return the sprites of an atlas in the order they are placed
+
+    Returns:
+        sources (list) - (name, image path, size) of the sprites. Cards
+                         are named (suit, key), the suits by their name
+                         and the back of the cards "back"
+    """
+    sources = []
+    for suit in GameSession.suits_map:
+        for key in GameSession.key_map:
+            sources.append(((suit, key),
+                            os.path.join(CARD_DIR, suit.lower(),
+                                         suit[0] + key + ".png"),
+                            card_size))
+    sources.append(("back", os.path.join(CARD_DIR, "misc", "gray_back.png"),
+                    card_size))
+    for suit in GameSession.suits_map:
+        sources.append((suit, os.path.join(CARD_DIR, "suits", suit + ".png"),
+                        SUIT_SIZE))
+    return sources
+
+
+def _layout(sources):
+    """Return the boxes of the sprites placed side by side and the size"""
+    boxes = {}
+    width = height = 0
+    for name, _, (sprite_wd, sprite_ht) in sources:
+        boxes[name] = (width, 0, width + sprite_wd, sprite_ht)
+        width += sprite_wd
+        height = max(height, sprite_ht)
+    return boxes, (width, height)
+
+
+def _source_key(sources):
+    """Return the hash of the source images and sizes of an atlas"""
+    digest = hashlib.sha1(str(ATLAS_VERSION).encode())
+    for name, path, size in sources:
+        digest.update(repr((name, size)).encode())
+        with open(path, "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+def _cache_path(card_size, key):
+    """Return the path of a cached atlas"""
+    return os.path.join(CACHE_DIR, "atlas_{}x{}_{}.npy".format(
+                                            card_size[0], card_size[1], key))
+
+
+def build_atlas(card_size):
+    """
+    Resize the card, back and suit images of a card size into one image
+
+    Parameters:
+        card_size (tuple) - (width, height) of the cards
+
+    Returns:
+        atlas (Image) - RGBA image holding every sprite
+    """
+    sources = _sources(card_size)
+    boxes, size = _layout(sources)
+    atlas = Image.new("RGBA", size)
+    for name, path, sprite_size in sources:
+        with Image.open(path) as image:
+            atlas.paste(image.convert("RGBA").resize(sprite_size,
+                                                     Image.LANCZOS),
+                        boxes[name][:2])
+    return atlas
+
+
+def load_atlas(card_size):
+    """
+    Return the atlas of a card size. It is read from the disk cache if
+    the source images have not changed, else built and cached.
+
+    Parameters:
+        card_size (tuple) - (width, height) of the cards
+
+    Returns:
+        atlas (Image) - RGBA image holding every sprite
+        boxes (dict) - maps the sprite names to their box in the atlas
+    """
+    card_size = tuple(card_size)
+    if card_size not in _atlases:
+        sources = _sources(card_size)
+        boxes, _ = _layout(sources)
+        path = _cache_path(card_size, _source_key(sources))
+        if os.path.exists(path):
+            pixels = np.load(path)
+        else:
+            pixels = np.asarray(build_atlas(card_size))
+            _write_cache(card_size, path, pixels)
+        _atlases[card_size] = (Image.fromarray(pixels, "RGBA"), boxes)
+    return _atlases[card_size]
+
+
+def _write_cache(card_size, path, pixels):
+    """Replace the cached atlases of a card size"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        for old in glob.glob(_cache_path(card_size, "*")):
+            os.remove(old)
+        with open(path + ".tmp", "wb") as cache:
+            np.save(cache, pixels)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        # The atlas is built again next time if the cache is read-only
+        pass
+
+
+class SpriteAtlas:
+    """
+    This class gives the PhotoImage of the cards, the back of the cards
+    and the suits at a card size. The atlas is loaded when the first
+    sprite is requested and every sprite is cropped from it once.
+
+    Attributes:
+        card_size (tuple) - (width, height) of the cards
+    """
+    def __init__(self, card_size):
+        """
+        Constructor for the SpriteAtlas class
+
+        Parameters:
+            card_size (tuple) - (width, height) of the cards
+        """
+        self.card_size = tuple(card_size)
+        self.__photos = {}
+
+    def __getitem__(self, name):
+        """
+        Return the PhotoImage of a card (suit, key), of a suit name or
+        of the back of the cards "back"
+        """
+        photo = self.__photos.get(name)
+        if photo is None:
+            atlas, boxes = load_atlas(self.card_size)
+            photo = PhotoImage(atlas.crop(boxes[name]))
+            self.__photos[name] = photo
+        return photo
+
+
+if __name__ == "__main__":
+    from frontend import GameGUI
+    parser = argparse.ArgumentParser(
+                        description="Build the cached card sprite atlases")
+    parser.parse_args()
+    for size in sorted(set(GameGUI.card_size.values())):
+        load_atlas(size)
+        print("atlas {}x{} cached".format(*size))
@@ -0,0 +1,310 @@
+import numpy as np
+import game
+from game import GameSession
+
+# Outcome codes of the rounds in a batch
+ONGOING = 0
+WIN = 1
+LOSS = 2
+INVALID = 3
+OUTCOME_CODES = {'W': WIN, 'L': LOSS, 'N': INVALID}
+OUTCOME_NAMES = {WIN: 'W', LOSS: 'L', INVALID: 'N'}
+
+NO_KEYS = len(GameSession.key_map)
+NO_SUITS = len(GameSession.suits_map)
+# Card ids follow the suit*6 + heirarchy numbering of deal_cards
+CARD_SUIT = np.arange(GameSession.total_cards) // NO_KEYS
+CARD_RANK = np.arange(GameSession.total_cards) % NO_KEYS
+CARD_POINTS = np.array([GameSession.point_table[GameSession.key_map[k]]
+                        for k in CARD_RANK], dtype=np.int16)
+# suit_cards[s, c] is True if the card id c belongs to the suit index s
+SUIT_CARDS = CARD_SUIT[None, :] == np.arange(NO_SUITS)[:, None]
+# TRICK_POWER[trump active, trump, suit in play, card] of game.TRICK_POWER
+TRICK_POWER = np.array(game.TRICK_POWER, np.int8).reshape(
+                        2, NO_SUITS, NO_SUITS, GameSession.total_cards)
+
+
+class BatchRounds:
+    """
+    This class plays a batch of rounds in lockstep. The state of every
+    round is held in NumPy arrays and each pass is resolved for all
+    the rounds at once with the same rules as Round.process_pass.
+    Suits are stored as suit indices and cards as card ids.
+
+    Attributes:
+        no_players (int) - number of players in every round
+        batch (int) - number of rounds in the batch
+        hands (ndarray) - (batch, players, cards) cards held by the players
+        trump (ndarray) - trump suit of each round
+        trump_open (ndarray) - has the trump been revealed
+        trump_open_pass (ndarray) - pass in which the trump was revealed
+        trump_open_plr (ndarray) - player who asked for the trump
+        suit_in_play (ndarray) - suit of the current pass, -1 if none
+        team_pts (ndarray) - (batch, teams) points of each team
+        team_trumps (ndarray) - (batch, teams) trump cards won by each team
+        outcome (ndarray) - outcome code of each round
+    """
+    def __init__(self, no_players, batch):
+        """
+        Constructor for the BatchRounds class
+
+        Parameters:
+            no_players (int) - number of players in every round
+            batch (int) - number of rounds in the batch
+        """
+        assert no_players in GameSession.allowed_players, \
+            "Invalid number of players"
+        self.no_players = no_players
+        self.batch = batch
+        self.no_passes = GameSession.total_cards // no_players
+        self.plr_team = np.arange(no_players) % GameSession.no_teams
+        self._rows = np.arange(batch)
+        self.hands = np.zeros(
+                        (batch, no_players, GameSession.total_cards), bool)
+        self.trump = np.zeros(batch, np.int8)
+        self.trump_open = np.zeros(batch, bool)
+        self.trump_open_pass = np.full(batch, -1, np.int8)
+        self.trump_open_plr = np.full(batch, -1, np.int8)
+        self.suit_in_play = np.full(batch, -1, np.int8)
+        self.start_player = np.zeros(batch, np.int8)
+        self.next_player = np.zeros(batch, np.int8)
+        self.passes_done = np.zeros(batch, np.int8)
+        self.wager = np.zeros(batch, np.int16)
+        self.wager_player = np.zeros(batch, np.int8)
+        self.wager_team = np.zeros(batch, np.int8)
+        self.goat = np.zeros(batch, bool)
+        self.open_goat = np.zeros(batch, bool)
+        self.team_pts = np.zeros((batch, GameSession.no_teams), np.int16)
+        self.team_trumps = np.zeros((batch, GameSession.no_teams), np.int16)
+        self.outcome = np.zeros(batch, np.int8)
+        # Cards and players of the current pass in the order of play
+        self.trick_cards = np.full((batch, no_players), -1, np.int8)
+        self.trick_plrs = np.full((batch, no_players), -1, np.int8)
+        self.trick_len = np.zeros(batch, np.int8)
+
+    def reset(self, hands, trump, start_player, wager, wager_player,
+              goat=False, open_goat=False, rows=None):
+        """
+        Start a new round in every slot of the batch or in some slots
+
+        Parameters:
+            hands (ndarray) - (rounds, players, cards_per_player) card ids
+            trump (ndarray) - trump suit index of each round
+            start_player (ndarray) - player starting the first pass
+            wager (ndarray) - wager of each round
+            wager_player (ndarray) - player holding the wager
+            rows (ndarray) - mask of the slots to reset, all if None
+        """
+        idx = self._rows if rows is None else np.flatnonzero(rows)
+        self.hands[idx] = False
+        plrs = np.arange(self.no_players)[None, :, None]
+        self.hands[idx[:, None, None], plrs, hands] = True
+        self.trump[idx] = trump
+        self.trump_open[idx] = False
+        self.trump_open_pass[idx] = -1
+        self.trump_open_plr[idx] = -1
+        self.suit_in_play[idx] = -1
+        self.start_player[idx] = start_player
+        self.next_player[idx] = start_player
+        self.passes_done[idx] = 0
+        self.wager[idx] = wager
+        self.wager_player[idx] = wager_player
+        self.wager_team[idx] = self.plr_team[self.wager_player[idx]]
+        self.goat[idx] = goat
+        self.open_goat[idx] = open_goat
+        self.team_pts[idx] = 0
+        self.team_trumps[idx] = 0
+        self.outcome[idx] = ONGOING
+        self.trick_cards[idx] = -1
+        self.trick_plrs[idx] = -1
+        self.trick_len[idx] = 0
+
+    def set_round(self, index, round_):
+        """
+        Copy the state of a Round at the start of a pass into a slot
+
+        Parameters:
+            index (int) - slot of the batch to overwrite
+            round_ (Round) - round whose session holds the player's hands
+        """
+        assert not round_.play_history[-1], "Pass already in progress"
+        session = round_.session
+        self.hands[index] = False
+        for plr in session.players:
+            for card in plr.cards:
+                self.hands[index, plr.index,
+                           session.suits[card[0]] * NO_KEYS +
+                           session.heirarchy[card[1]]] = True
+        self.trump[index] = session.suits[round_.trump]
+        self.trump_open[index] = round_.trump_open
+        if round_.trump_open:
+            self.trump_open_pass[index] = round_.trump_open_at[0]
+            self.trump_open_plr[index] = round_.trump_open_at[1]
+        else:
+            self.trump_open_pass[index] = -1
+            self.trump_open_plr[index] = -1
+        self.suit_in_play[index] = -1
+        self.start_player[index] = round_.start_player
+        self.next_player[index] = round_.next_player
+        self.passes_done[index] = round_.passes_done
+        self.wager[index] = round_.wager
+        self.wager_player[index] = round_.wager_player
+        self.wager_team[index] = round_.wager_team
+        self.goat[index] = round_.goat
+        self.open_goat[index] = round_.open_goat
+        self.team_pts[index] = round_.team_pts
+        self.team_trumps[index] = round_.team_trumps
+        self.outcome[index] = ONGOING
+        self.trick_cards[index] = -1
+        self.trick_plrs[index] = -1
+        self.trick_len[index] = 0
+
+    @property
+    def active(self):
+        """Mask of the rounds which are not over"""
+        return self.outcome == ONGOING
+
+    def legal_moves(self):
+        """
+        Return the legal moves of the next player in every round with the
+        rules of Player.get_play_card
+
+        Returns:
+            moves (ndarray) - (batch, cards) mask of the playable cards
+            ask_trump (ndarray) - the player has to ask for the trump
+        """
+        hand = self.hands[self._rows, self.next_player]
+        trump_cards = SUIT_CARDS[self.trump]
+        leading = self.suit_in_play < 0
+        # Cards to start a pass, the wager player can not start with
+        # a hidden trump
+        hide = ((self.wager_player == self.next_player) &
+                ~self.trump_open)[:, None]
+        moves = np.where(leading[:, None], hand & ~(hide & trump_cards),
+                         hand & SUIT_CARDS[np.maximum(self.suit_in_play, 0)])
+        has_move = moves.any(axis=1)
+        ask_trump = ~leading & ~has_move
+        moves[ask_trump] = hand[ask_trump] & trump_cards[ask_trump]
+        empty = ~moves.any(axis=1)
+        moves[empty] = hand[empty]
+        return moves, ask_trump
+
+    def ask_trump(self, mask):
+        """Reveal the trump for the next player of the rounds in the mask"""
+        opening = mask & ~self.trump_open & self.active
+        self.trump_open_pass[opening] = self.passes_done[opening] + 1
+        self.trump_open_plr[opening] = self.next_player[opening]
+        self.trump_open[opening] = True
+
+    def play(self, cards, ask_trump=None, rows=None):
+        """
+        Play a card for the next player of every active round
+
+        Parameters:
+            cards (ndarray) - card id played in each round
+            ask_trump (ndarray) - rounds in which the player asks for the
+                                  trump, by default the player asks when
+                                  the suit in play is not in the hand
+            rows (ndarray) - mask of the rounds to play, all if None
+        """
+        active = self.active if rows is None else rows & self.active
+        idx = np.flatnonzero(active)
+        pos = self.trick_len[idx]
+        assert (pos < self.no_players).all(), "Pass is complete"
+        plrs = self.next_player[idx]
+        cards = np.asarray(cards, np.int8)[idx]
+        assert self.hands[idx, plrs, cards].all(), "Card not in hand"
+        if ask_trump is None:
+            lead = self.suit_in_play[idx]
+            hand = self.hands[idx, plrs]
+            ask_trump = np.zeros(self.batch, bool)
+            ask_trump[idx] = (lead >= 0) & ~(
+                        hand & SUIT_CARDS[np.maximum(lead, 0)]).any(axis=1)
+        self.ask_trump(ask_trump & active)
+        self.hands[idx, plrs, cards] = False
+        leading = pos == 0
+        self.suit_in_play[idx[leading]] = CARD_SUIT[cards[leading]]
+        self.trick_cards[idx, pos] = cards
+        self.trick_plrs[idx, pos] = plrs
+        self.next_player[idx] = (plrs + 1) % self.no_players
+        self.trick_len[idx] += 1
+
+    def resolve_pass(self, rows=None):
+        """
+        Determine the winner of the current pass in every active round
+        and check the rounds for a win, loss or an invalid round
+
+        Parameters:
+            rows (ndarray) - mask of the rounds to resolve, by default
+                             all the active rounds which must have
+                             completed the pass
+
+        Returns:
+            outcome (ndarray) - outcome code of each round
+        """
+        complete = self.trick_len == self.no_players
+        if rows is None:
+            active = self.active
+            assert complete[active].all(), \
+                "All players have not played their hand"
+        else:
+            active = rows & self.active & complete
+        self.passes_done[active] += 1
+        cards = self.trick_cards.astype(np.intp)
+        plrs = self.trick_plrs
+        suit = CARD_SUIT[cards]
+        lead = suit[:, 0]
+        # The trump is active for cards played after it was revealed.
+        # The player who asked for the trump in this pass can use it,
+        # but a start player asking for trump does not change the pass
+        opened_here = ((self.trump_open_pass == self.passes_done)[:, None] &
+                       (plrs == self.trump_open_plr[:, None]))
+        opened_here[:, 0] = False
+        trump_used = ((self.trump_open &
+                       (self.trump_open_pass < self.passes_done))[:, None] |
+                      np.logical_or.accumulate(opened_here, axis=1))
+        # Power of each card read from the table, the highest power wins
+        is_trump = suit == self.trump[:, None]
+        lead_trump = lead == self.trump
+        power = TRICK_POWER[trump_used.astype(np.intp),
+                            self.trump[:, None], lead[:, None], cards]
+        win_pos = power.argmax(axis=1)
+        winner = plrs[self._rows, win_pos]
+        win_team = self.plr_team[winner]
+        # Add the points and trumps to the teams
+        points = CARD_POINTS[cards].sum(axis=1)
+        card_team = self.plr_team[plrs]
+        for team in range(GameSession.no_teams):
+            self.team_pts[active, team] += np.where(
+                                    win_team == team, points, 0)[active]
+            self.team_trumps[active, team] += (
+                    is_trump & (card_team == team)).sum(axis=1)[active]
+        # Check for the end of the round
+        wt_pts = self.team_pts[self._rows, self.wager_team]
+        ot_pts = self.team_pts[self._rows, 1 - self.wager_team]
+        total = GameSession.total_points
+        invalid = ((self.team_trumps.max(axis=1) == NO_KEYS) |
+                   (lead_trump & (self.team_trumps.min(axis=1) == 0)))
+        goat_lost = self.open_goat & (winner != self.wager_player)
+        won = (((wt_pts >= self.wager) & ~self.goat & (ot_pts > 0)) |
+               (wt_pts == total))
+        lost = ((ot_pts > 0) & self.goat) | ((total - ot_pts) < self.wager)
+        # Round.process_pass checks the teams in the order of their index
+        first = np.where(self.wager_team == 0, won, lost)
+        second = np.where(self.wager_team == 0, lost, won)
+        first_code = np.where(self.wager_team == 0, WIN, LOSS)
+        second_code = np.where(self.wager_team == 0, LOSS, WIN)
+        outcome = np.where(invalid, INVALID,
+                           np.where(goat_lost, LOSS,
+                                    np.where(first, first_code,
+                                             np.where(second, second_code,
+                                                      ONGOING))))
+        self.outcome[active] = outcome[active]
+        # Process variables for the next pass
+        self.start_player[active] = winner[active]
+        self.next_player[active] = winner[active]
+        self.suit_in_play[active] = -1
+        self.trick_cards[active] = -1
+        self.trick_plrs[active] = -1
+        self.trick_len[active] = 0
+        return self.outcome
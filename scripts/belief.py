@@ -0,0 +1,225 @@
+from bisect import bisect_right
+from math import factorial
+import numpy as np
+from game import GameSession
+from bitboard import (FULL_DECK, NO_KEYS, NO_SUITS, SUIT_MASKS, card_id,
+                      cards_to_mask, iter_ids)
+
+_FACTORIALS = [factorial(n) for n in range(GameSession.total_cards + 1)]
+
+
+def _splits(no_cards, owners, left):
+    """
+    Iterate over the ways to give a number of cards to the owners
+    without exceeding the cards each owner has left to receive
+
+    Returns:
+        split (tuple) - (owner, cards given) pairs
+    """
+    if not owners:
+        if no_cards == 0:
+            yield ()
+        return
+    plr = owners[0]
+    rest = owners[1:]
+    capacity = sum(left[p] for p in rest)
+    for given in range(max(0, no_cards - capacity),
+                       min(no_cards, left[plr]) + 1):
+        for split in _splits(no_cards - given, rest, left):
+            yield ((plr, given),) + split
+
+
+class BeliefTracker:
+    """
+    This class follows a round from the view of one player and keeps
+    which hidden cards each of the other players can hold. A player who
+    does not follow the suit in play is void in it, and a player who can
+    use the trump and does not play one is void in the trump. Hidden
+    hands are drawn exactly from the deals consistent with what is known:
+    cards with the same possible owners are interchangeable, so the deals
+    are counted by how many cards of each group every player holds.
+
+    Attributes:
+        observer (int) - index of the player following the round
+        no_players (int) - number of players in the round
+        hand (int) - bitmask of the observer's cards
+        played (int) - bitmask of the cards played so far
+        sizes (list) - number of cards held by each player
+        voids (list) - bitmask of the cards each player can not hold
+        trump (int) - trump suit index, None while unknown to the observer
+    """
+    def __init__(self, session, observer):
+        """
+        Constructor for the BeliefTracker class
+
+        Parameters:
+            session (GameSession) - session in which the round is played
+            observer (int) - index of the player following the round
+        """
+        self.observer = observer
+        self.no_players = session.no_players
+        self.hand = cards_to_mask(session.players[observer].cards)
+        self.played = 0
+        no_passes = session.total_cards // session.no_players
+        self.sizes = [no_passes] * session.no_players
+        self.voids = [0] * session.no_players
+        self.trump = None
+        self._synced = (0, 0)   # (pass index, cards) already followed
+        self._groups = None     # cached deal counts of the sampler
+
+    @property
+    def hidden(self):
+        """Mask of the cards not seen by the observer"""
+        return FULL_DECK & ~self.hand & ~self.played
+
+    def possible(self, plr):
+        """Return the mask of the cards a player can hold"""
+        if plr == self.observer:
+            return self.hand
+        return self.hidden & ~self.voids[plr]
+
+    def matrix(self):
+        """
+        Return the (players, cards) boolean matrix of the cards each
+        player can hold
+        """
+        masks = np.array([self.possible(p) for p in range(self.no_players)],
+                         dtype=np.int64)
+        return (masks[:, None] >> np.arange(GameSession.total_cards)) & 1 > 0
+
+    def update(self, round_):
+        """
+        Follow the cards played in a round since the last update
+
+        Parameters:
+            round_ (Round) - round followed by the tracker
+        """
+        session = round_.session
+        if self.trump is None and (
+                round_.trump_open or
+                session.players[self.observer].stake_player):
+            self.trump = session.suits[round_.trump]
+        history = round_.play_history
+        pass_index, pos = self._synced
+        while True:
+            pass_ = history[pass_index]
+            for plr, card in pass_[pos:]:
+                self._observe(round_, pass_index + 1, pass_, plr, card)
+            if pass_index == len(history) - 1:
+                break
+            pass_index += 1
+            pos = 0
+        self._synced = (pass_index, len(history[pass_index]))
+
+    def _observe(self, round_, pass_no, pass_, plr, card):
+        """Remove a played card from the hidden cards and infer voids"""
+        index = card_id(card)
+        self.played |= 1 << index
+        if plr == self.observer:
+            self.hand &= ~(1 << index)
+        self.sizes[plr] -= 1
+        self._groups = None
+        lead = card_id(pass_[0][1]) // NO_KEYS
+        suit = index // NO_KEYS
+        if suit == lead:
+            return
+        # Player did not follow the suit in play
+        self.voids[plr] |= SUIT_MASKS[lead]
+        # Player who could use the trump and did not play a trump
+        trump = self.trump
+        if (trump is not None and suit != trump and round_.trump_open and
+                (round_.trump_open_at[0] < pass_no or
+                 round_.trump_open_at == (pass_no, plr))):
+            self.voids[plr] |= SUIT_MASKS[trump]
+
+    def _count(self, use_voids):
+        """
+        Count the consistent deals group by group. For every group and
+        cards left to give to each player, the splits of the group among
+        its owners are kept with the running total of their deals.
+
+        Returns:
+            groups (list) - cards of each group
+            table (dict) - (group, cards left) to (total, running totals,
+                           splits)
+            total (int) - number of consistent deals
+        """
+        others = [p for p in range(self.no_players) if p != self.observer]
+        hidden = self.hidden
+        by_owners = {}
+        for card in iter_ids(hidden):
+            owners = tuple(p for p in others
+                           if not (use_voids and self.voids[p] >> card & 1))
+            by_owners.setdefault(owners, []).append(card)
+        groups = list(by_owners.items())
+        table = {}
+
+        def count(g, left):
+            if g == len(groups):
+                return 0 if any(left) else 1
+            key = (g, left)
+            if key not in table:
+                owners, cards = groups[g]
+                total = 0
+                totals, splits = [], []
+                for split in _splits(len(cards), owners, left):
+                    rest = list(left)
+                    ways = _FACTORIALS[len(cards)]
+                    for plr, given in split:
+                        rest[plr] -= given
+                        ways //= _FACTORIALS[given]
+                    ways *= count(g + 1, tuple(rest))
+                    if ways:
+                        total += ways
+                        totals.append(total)
+                        splits.append(split)
+                table[key] = (total, totals, splits)
+            return table[key][0]
+
+        left = list(self.sizes)
+        left[self.observer] = 0
+        return groups, table, count(0, tuple(left))
+
+    def sample(self, rng):
+        """
+        Draw the hidden hands uniformly among the deals consistent with
+        the inferred voids, or with the cards seen only if the voids do
+        not fit the deal, e.g. when a user has not followed the rules of
+        the bots
+
+        Parameters:
+            rng (random.Random) - generator used for the draw
+
+        Returns:
+            hands (list) - bitmask of the cards held by each player
+        """
+        if self._groups is None:
+            groups, table, total = self._count(True)
+            if not total:
+                groups, table, total = self._count(False)
+            self._groups = (groups, table)
+        groups, table = self._groups
+        hands = [0] * self.no_players
+        hands[self.observer] = self.hand
+        left = list(self.sizes)
+        left[self.observer] = 0
+        left = tuple(left)
+        for g, (owners, cards) in enumerate(groups):
+            total, totals, splits = table[(g, left)]
+            split = splits[bisect_right(totals, rng.randrange(total))]
+            cards = rng.sample(cards, len(cards))
+            start = 0
+            rest = list(left)
+            for plr, given in split:
+                for card in cards[start:start + given]:
+                    hands[plr] |= 1 << card
+                start += given
+                rest[plr] -= given
+            left = tuple(rest)
+        return hands
+
+    def sample_trump(self, rng):
+        """Return the trump suit index, drawn at random if unknown"""
+        if self.trump is None:
+            return rng.randrange(NO_SUITS)
+        return self.trump
@@ -0,0 +1,199 @@
+from game import GameSession
+
+# Cards are numbered as suit index * 6 + heirarchy of the card key so that
+# the bits of a suit are contiguous and ordered by the power of the card.
+# The same numbering is used by deal_cards.
+NO_KEYS = len(GameSession.key_map)
+NO_SUITS = len(GameSession.suits_map)
+FULL_DECK = (1 << GameSession.total_cards) - 1
+SUIT_MASKS = tuple(((1 << NO_KEYS) - 1) << (NO_KEYS * i)
+                   for i in range(NO_SUITS))
+# Points of every card id
+CARD_POINTS = tuple(GameSession.point_table[GameSession.key_map[i % NO_KEYS]]
+                    for i in range(GameSession.total_cards))
+# Points of every combination of cards within a suit
+SUIT_POINTS = tuple(sum(CARD_POINTS[i] for i in range(NO_KEYS) if m >> i & 1)
+                    for m in range(1 << NO_KEYS))
+# Number of set bits in every combination of cards within a suit
+SUIT_COUNTS = tuple(bin(m).count("1") for m in range(1 << NO_KEYS))
+
+
+def card_id(card):
+    """Return the index of a (suit, key) card tuple"""
+    return (GameSession.suits[card[0]] * NO_KEYS +
+            GameSession.heirarchy[card[1]])
+
+
+def card_from_id(index):
+    """Return the (suit, key) card tuple of a card index"""
+    return (GameSession.suits_map[index // NO_KEYS],
+            GameSession.key_map[index % NO_KEYS])
+
+
+def cards_to_mask(cards):
+    """Convert an iterable of (suit, key) card tuples to a bitmask"""
+    mask = 0
+    for card in cards:
+        mask |= 1 << card_id(card)
+    return mask
+
+
+def mask_to_cards(mask):
+    """Convert a bitmask to a list of (suit, key) card tuples"""
+    return [card_from_id(index) for index in iter_ids(mask)]
+
+
+def iter_ids(mask):
+    """Iterate over the card indices in a bitmask in increasing order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    """Return the number of cards in a bitmask"""
+    count = 0
+    while mask:
+        count += SUIT_COUNTS[mask & 0x3F]
+        mask >>= NO_KEYS
+    return count
+
+
+def mask_points(mask):
+    """Return the total points of the cards in a bitmask"""
+    points = 0
+    while mask:
+        points += SUIT_POINTS[mask & 0x3F]
+        mask >>= NO_KEYS
+    return points
+
+
+def lead_moves(hand, trump, trump_open, stake_player):
+    """
+    Return the mask of cards that can be played to start a pass
+
+    Parameters:
+        hand (int) - bitmask of the cards in the player's hand
+        trump (int) - index of the trump suit or None
+        trump_open (bool) - has the trump been revealed
+        stake_player (bool) - has the player set the active wager
+    """
+    if trump is None or trump_open or not stake_player:
+        return hand
+    # The wager player can not start with a hidden trump unless
+    # the player has only trump cards
+    return (hand & ~SUIT_MASKS[trump]) or hand
+
+
+def follow_moves(hand, suit_in_play):
+    """Return the mask of cards matching the suit in play"""
+    return hand & SUIT_MASKS[suit_in_play]
+
+
+def trump_ask_moves(hand, trump):
+    """
+    Return the mask of cards for a player who has asked for the trump
+    because the player does not have the suit in play
+    """
+    return (hand & SUIT_MASKS[trump]) or hand
+
+
+def legal_moves(hand, suit_in_play, trump, trump_open, stake_player):
+    """
+    Return the legal moves of a player with the same rules as
+    Player.get_play_card, the cards a user can select with
+    Player.playable_cards are derived from it
+
+    Returns:
+        moves (int) - bitmask of the cards that can be played
+        ask_trump (bool) - the player has to ask for the trump
+    """
+    if suit_in_play is None:
+        return lead_moves(hand, trump, trump_open, stake_player), False
+    moves = hand & SUIT_MASKS[suit_in_play]
+    if moves:
+        return moves, False
+    return trump_ask_moves(hand, trump), True
+
+
+class BitHand:
+    """
+    This class stores a set of cards, a hand or a deck, as a 24 bit integer
+
+    Attributes:
+        mask (int) - bitmask of the cards in the set
+    """
+    __slots__ = ("mask",)
+
+    def __init__(self, mask=0):
+        self.mask = mask
+
+    @classmethod
+    def from_cards(cls, cards):
+        """Create a set from (suit, key) card tuples"""
+        return cls(cards_to_mask(cards))
+
+    @classmethod
+    def full_deck(cls):
+        """Create a set containing all the cards in the game"""
+        return cls(FULL_DECK)
+
+    def to_cards(self):
+        """Return the cards as a list of (suit, key) tuples"""
+        return mask_to_cards(self.mask)
+
+    def add(self, card):
+        """Add a (suit, key) card to the set"""
+        self.mask |= 1 << card_id(card)
+
+    def remove(self, card):
+        """Remove a (suit, key) card from the set"""
+        bit = 1 << card_id(card)
+        assert self.mask & bit, "Card not in the set"
+        self.mask ^= bit
+
+    def suit_mask(self, suit):
+        """Return the bitmask of the cards of a suit index"""
+        return self.mask & SUIT_MASKS[suit]
+
+    def has_suit(self, suit):
+        """Check if the set has any card of a suit index"""
+        return bool(self.mask & SUIT_MASKS[suit])
+
+    def count(self, suit=None):
+        """Return the number of cards in the set or in a suit index"""
+        if suit is None:
+            return popcount(self.mask)
+        return SUIT_COUNTS[(self.mask >> (NO_KEYS * suit)) & 0x3F]
+
+    def points(self):
+        """Return the total points of the cards in the set"""
+        return mask_points(self.mask)
+
+    def legal_moves(self, round_, stake_player):
+        """Return the legal moves in the current state of a Round"""
+        suits = GameSession.suits
+        suit_in_play = (None if round_.suit_in_play is None
+                        else suits[round_.suit_in_play])
+        trump = None if round_.trump is None else suits[round_.trump]
+        return legal_moves(self.mask, suit_in_play, trump,
+                           round_.trump_open, stake_player)
+
+    def __contains__(self, card):
+        return bool(self.mask >> card_id(card) & 1)
+
+    def __len__(self):
+        return popcount(self.mask)
+
+    def __iter__(self):
+        return iter(self.to_cards())
+
+    def __eq__(self, other):
+        return isinstance(other, BitHand) and self.mask == other.mask
+
+    def __hash__(self):
+        return hash(self.mask)
+
+    def __repr__(self):
+        return "BitHand({})".format(self.to_cards())
@@ -0,0 +1,175 @@
+import copy
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from game import Player
+
+# Card chosen by a bot and whether it asked for the trump or a goat
+Decision = namedtuple("Decision", "card ask_trump goat")
+
+
+def snapshot(session):
+    """
+    Return a copy of a game session a bot can play on. The rounds
+    already finished are shared with the session as they are not
+    changed, the log and the event subscribers are left out.
+    """
+    memo = {id(round_): round_ for round_ in session.rounds[:-1]}
+    if session.log is not None:
+        memo[id(session.log)] = None
+    return copy.deepcopy(session, memo)
+
+
+def decide(session, plr_index, policy=None, time_limit=None):
+    """
+    Let a player choose its card on a snapshot of the session
+
+    Parameters:
+        session (GameSession) - snapshot the player plays on
+        plr_index (int) - index of the player to play
+        policy (type) - Player class whose get_play_card is used instead
+                        of the player's own
+        time_limit (float) - time in seconds the search of a player with
+                             a time_limit, like ISMCTSPlayer, may take
+
+    Returns:
+        decision (Decision) - card played and the calls made with it
+    """
+    round_ = session.rounds[-1]
+    player = session.players[plr_index]
+    if (time_limit is not None and
+            getattr(player, "time_limit", None) is not None):
+        # Only the snapshot's player is changed
+        player.time_limit = min(player.time_limit, time_limit)
+    trump_open, goat = round_.trump_open, round_.goat
+    if policy is None:
+        player.get_play_card(round_)
+    else:
+        policy.get_play_card(player, round_)
+    card = round_.play_history[-1][-1][1]
+    return Decision(card, round_.trump_open and not trump_open,
+                    round_.goat and not goat)
+
+
+def apply_decision(round_, plr_index, decision):
+    """Play the decision of a bot in the round of the session"""
+    if decision.ask_trump:
+        round_.ask_trump(plr_index)
+    if decision.goat:
+        round_.set_goat()
+    round_.session.players[plr_index].cards.remove(decision.card)
+    round_.set_play_card(plr_index, decision.card)
+
+
+class BotService:
+    """
+    This class computes the cards played by bots away from the Tk main
+    thread. A snapshot of the session is sent to a thread or process
+    pool and the future is polled with root.after, the callback gets the
+    decision on the Tk thread. A search bot is given a share of the
+    deadline as its time limit. A bot which still misses its deadline is
+    replaced for the move by the rules of the base Player, and the
+    default pool is replaced so the next bots do not wait behind it.
+
+    Attributes:
+        root (tk.Tk) - Tk root used to poll the futures
+        executor (Executor) - pool the bots run on
+        deadline (float) - time in seconds a bot has to choose a card
+        poll_ms (int) - wait between the checks of a future
+    """
+    # Share of the deadline a search bot may spend on its search
+    budget = 0.8
+
+    def __init__(self, root, executor=None, deadline=5.0, poll_ms=20):
+        """
+        Constructor for the BotService class
+
+        Parameters:
+            root (tk.Tk) - Tk root used to poll the futures
+            executor (Executor) - pool the bots run on, a single worker
+                                  thread by default. A ProcessPoolExecutor
+                                  keeps the bots off the GIL
+            deadline (float) - time in seconds a bot has to choose a card
+            poll_ms (int) - wait between the checks of a future
+        """
+        self.root = root
+        self.executor = executor or ThreadPoolExecutor(1)
+        self.deadline = deadline
+        self.poll_ms = poll_ms
+        self.__own_executor = executor is None
+        self.__pending = {}     # future -> (session, plr, callback, end)
+        self.__job = None
+
+    def request_card(self, session, plr_index, callback):
+        """
+        Ask a bot for the card to play without blocking
+
+        Parameters:
+            session (GameSession) - session in which the bot plays
+            plr_index (int) - index of the bot to play
+            callback (function) - called with the Decision on the Tk thread
+        """
+        future = self._submit(snapshot(session), plr_index)
+        self.__pending[future] = (session, plr_index, callback,
+                                  time.monotonic() + self.deadline)
+        if self.__job is None:
+            self.__job = self.root.after(self.poll_ms, self._poll)
+
+    def _submit(self, session, plr_index):
+        """Start a bot on a snapshot in the pool"""
+        return self.executor.submit(decide, session, plr_index, None,
+                                    self.deadline * self.budget)
+
+    def _replace_executor(self):
+        """
+        Move the requests waiting in the pool to a new pool, the bot
+        running past its deadline is left to finish in the old one
+        """
+        old = self.executor
+        self.executor = ThreadPoolExecutor(1)
+        for future, request in list(self.__pending.items()):
+            if future.cancel():
+                del self.__pending[future]
+                session, plr_index = request[:2]
+                self.__pending[self._submit(snapshot(session),
+                                            plr_index)] = request
+        old.shutdown(wait=False)
+
+    def _poll(self):
+        """Pass the decisions ready or overdue to their callbacks"""
+        self.__job = None
+        now = time.monotonic()
+        for future, (session, plr_index, callback, end) in list(
+                                                self.__pending.items()):
+            if future not in self.__pending:
+                continue        # Moved to a new pool
+            if future.done():
+                decision = future.result()
+            elif now >= end:
+                decision = None
+            else:
+                continue
+            del self.__pending[future]
+            if decision is None:
+                # A running bot can not be cancelled, the next bots are
+                # not left waiting behind it
+                if not future.cancel() and self.__own_executor:
+                    self._replace_executor()
+                decision = decide(snapshot(session), plr_index, Player)
+            callback(decision)
+        if self.__pending and self.__job is None:
+            self.__job = self.root.after(self.poll_ms, self._poll)
+
+    def cancel(self):
+        """Drop the pending requests, their callbacks are not called"""
+        for future in self.__pending:
+            future.cancel()
+        self.__pending.clear()
+        if self.__job is not None:
+            self.root.after_cancel(self.__job)
+            self.__job = None
+
+    def shutdown(self):
+        """Cancel the pending requests and stop the pool"""
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
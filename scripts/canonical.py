@@ -0,0 +1,114 @@
+import itertools
+from bitboard import NO_KEYS, NO_SUITS
+from searchstate import SearchState
+
+# A suit permutation is a tuple giving the original suit index held in
+# each canonical suit slot. Masks are permuted a whole suit at a time.
+_SUIT_BITS = (1 << NO_KEYS) - 1
+IDENTITY = tuple(range(NO_SUITS))
+ALL_PERMS = tuple(itertools.permutations(IDENTITY))
+
+
+def apply_perm(mask, perm):
+    """Return a card bitmask with the suits moved into canonical slots"""
+    out = 0
+    for slot, suit in enumerate(perm):
+        out |= ((mask >> (NO_KEYS * suit)) & _SUIT_BITS) << (NO_KEYS * slot)
+    return out
+
+
+def invert_perm(perm):
+    """Return the permutation which undoes a permutation"""
+    inverse = [0] * len(perm)
+    for slot, suit in enumerate(perm):
+        inverse[suit] = slot
+    return tuple(inverse)
+
+
+def to_canonical_card(card, perm):
+    """Map a card id to its canonical card id"""
+    return perm.index(card // NO_KEYS) * NO_KEYS + card % NO_KEYS
+
+
+def to_original_card(card, perm):
+    """Map a canonical card id, e.g. a move, back to the original card id"""
+    return perm[card // NO_KEYS] * NO_KEYS + card % NO_KEYS
+
+
+def _sort_suits(suits, signature, trump):
+    """
+    Order the suits by their signature, highest first. The trump suit,
+    if any, always takes the first slot.
+    """
+    free = sorted((s for s in suits if s != trump),
+                  key=signature, reverse=True)
+    return tuple(free) if trump is None else (trump,) + tuple(free)
+
+
+def canonical_hand(hand, trump=None):
+    """
+    Return the canonical form of a hand. Before a trump is chosen all the
+    suits are interchangeable, after it the three other suits are.
+
+    Parameters:
+        hand (int) - bitmask of the cards in the hand
+        trump (int) - trump suit index, None if not chosen
+
+    Returns:
+        mask (int) - bitmask of the canonical hand
+        perm (tuple) - permutation from the hand to the canonical hand
+    """
+    perm = _sort_suits(
+                IDENTITY,
+                lambda s: (hand >> (NO_KEYS * s)) & _SUIT_BITS, trump)
+    return apply_perm(hand, perm), perm
+
+
+def orbit(hand):
+    """
+    Return all the distinct hands obtained by permuting the suits of a
+    hand, with the permutation from the hand to each of them
+    """
+    hands = {}
+    for perm in ALL_PERMS:
+        hands.setdefault(apply_perm(hand, perm), perm)
+    return hands
+
+
+def canonical_state(state):
+    """
+    Return a key identifying a SearchState up to the relabeling of the
+    non-trump suits. The trump takes the first slot, so states which
+    differ only in the choice of trump share a key as well.
+
+    Parameters:
+        state (SearchState) - state to canonicalize
+
+    Returns:
+        key (tuple) - hashable canonical key of the state
+        perm (tuple) - permutation from the state to the canonical state
+    """
+    hands = state.hands
+    trick = state.trick
+
+    def signature(suit):
+        shift = NO_KEYS * suit
+        return (tuple((hand >> shift) & _SUIT_BITS for hand in hands) +
+                tuple(card % NO_KEYS if card // NO_KEYS == suit else -1
+                      for _, card in trick))
+
+    perm = _sort_suits(IDENTITY, signature, state.trump)
+    key = (tuple(apply_perm(hand, perm) for hand in hands),
+           tuple((plr, to_canonical_card(card, perm))
+                 for plr, card in trick),
+           state.next_player, state.trump_open, state.trump_open_pass,
+           state.trump_open_plr, state.team_pts, state.team_trumps)
+    return key, perm
+
+
+def canonical_round(round_):
+    """
+    Return the canonical key and permutation of a Round with the hands
+    held by the players of its session
+    """
+    return canonical_state(SearchState.from_round(round_))
@@ -0,0 +1,287 @@
+import argparse
+import multiprocessing as mp
+import os
+from math import comb
+import numpy as np
+from game import GameSession, Player
+from bitboard import NO_SUITS, cards_to_mask, iter_ids
+from canonical import canonical_hand, orbit
+from searchstate import SearchState
+from solver import DoubleDummySolver
+
+# Bid levels of the table, the last level is the open goat
+BID_LEVELS = tuple(range(GameSession.base_bet[4],
+                         GameSession.total_points + 1)) + ("Open Goat",)
+# Probabilities are stored as 0-254, 255 marks an entry not yet computed
+PROB_SCALE = 254
+NOT_DONE = 255
+# Binomial coefficients for ranking hands
+_BINOM = [[comb(n, k) for k in range(GameSession.total_cards + 1)]
+          for n in range(GameSession.total_cards + 1)]
+# Default folder of the table files
+equity_dir = os.path.normpath(os.path.join(
+                os.path.dirname(os.path.abspath(__file__)), os.pardir,
+                "equity"))
+
+
+def no_hands(no_players):
+    """Return the number of distinct hands in a game"""
+    return comb(GameSession.total_cards,
+                GameSession.total_cards // no_players)
+
+
+def hand_rank(hand):
+    """
+    Return the combinatorial (colex) rank of a hand among the hands
+    with the same number of cards
+
+    Parameters:
+        hand (int) - bitmask of the cards in the hand
+    """
+    rank = 0
+    for i, card in enumerate(iter_ids(hand), 1):
+        rank += _BINOM[card][i]
+    return rank
+
+
+def hand_unrank(rank, no_cards):
+    """Return the bitmask of the hand with a combinatorial rank"""
+    hand = 0
+    for i in range(no_cards, 0, -1):
+        card = i - 1
+        while _BINOM[card + 1][i] <= rank:
+            card += 1
+        rank -= _BINOM[card][i]
+        hand |= 1 << card
+    return hand
+
+
+def table_path(no_players, folder=None):
+    """Return the path of the table file of a game"""
+    folder = equity_dir if folder is None else folder
+    return os.path.join(folder, "equity_{}.npy".format(no_players))
+
+
+def bid_won(wager, outcome, open_goat):
+    """
+    Return if a round outcome gains points for the wager team, the rule
+    the session score is updated with. An invalid round 'N' gains the
+    points of a plain bid and loses an open goat.
+    """
+    return GameSession.round_points(wager, outcome, False, open_goat) > 0
+
+
+def estimate_hand(hand, no_players, samples, rng, solver):
+    """
+    Estimate the win probability of a hand for every trump and bid level.
+    The hidden cards are dealt at random and every deal is solved double
+    dummy at every bid level with the bidder starting the round. The
+    outcome is found with the rules of process_pass and scored with
+    bid_won, a plain bid being played without a goat call.
+
+    Parameters:
+        hand (int) - bitmask of the bidder's cards
+        no_players (int) - number of players in the game
+        samples (int) - number of deals per trump suit
+        rng (numpy.random.Generator) - generator for the deals
+        solver (DoubleDummySolver) - solver used for the deals
+
+    Returns:
+        probs (ndarray) - (suits, bid levels) win probabilities
+    """
+    cards_per_plr = GameSession.total_cards // no_players
+    others = np.array([card for card in range(GameSession.total_cards)
+                       if not hand >> card & 1])
+    wins = np.zeros((NO_SUITS, len(BID_LEVELS)))
+    for _ in range(samples):
+        deal = rng.permutation(others).reshape(no_players - 1, cards_per_plr)
+        hands = [hand] + [sum(1 << int(card) for card in plr_cards)
+                          for plr_cards in deal]
+        for trump in range(NO_SUITS):
+            for level, bid in enumerate(BID_LEVELS):
+                open_goat = bid == "Open Goat"
+                wager = GameSession.total_points if open_goat else bid
+                state = SearchState(no_players, hands, trump, wager, 0, 0,
+                                    open_goat=open_goat)
+                wins[trump, level] += bid_won(
+                        wager, solver.solve_outcome(state), open_goat)
+    return wins / samples
+
+
+def _estimate_chunk(task):
+    """Worker function estimating the rows of a range of hand ranks"""
+    no_players, ranks, samples, seed = task
+    solver = DoubleDummySolver()
+    no_cards = GameSession.total_cards // no_players
+    rows = np.empty((len(ranks), NO_SUITS, len(BID_LEVELS)), np.uint8)
+    for i, rank in enumerate(ranks):
+        # Seed from the hand so a row does not depend on the build order
+        rng = np.random.default_rng(
+                        np.random.SeedSequence(seed, spawn_key=(rank,)))
+        probs = estimate_hand(hand_unrank(rank, no_cards), no_players,
+                              samples, rng, solver)
+        rows[i] = np.rint(probs * PROB_SCALE)
+    return ranks, rows
+
+
+def build_table(no_players, samples=32, path=None, processes=None,
+                chunk_size=64, seed=0, ranks=None):
+    """
+    Build or resume the equity table of a game over a process pool.
+    Rows are written to the memory mapped file as they are computed so
+    an interrupted build continues with the rows not yet done. Hands
+    which differ only by a permutation of the suits share their row, up
+    to the order of the trumps, so only canonical hands are estimated and
+    their row is copied to every hand of their orbit. A partial build
+    also fills the hands of ranks whose canonical hand is outside ranks.
+
+    Parameters:
+        no_players (int) - number of players in the game
+        samples (int) - number of deals per hand and trump suit
+        path (str) - path of the table file
+        processes (int) - size of the process pool
+        chunk_size (int) - hands estimated by a worker per task
+        seed (int) - seed of the build, every hand has its own stream
+        ranks (range) - hand ranks to compute, by default all the hands
+    """
+    assert no_players in GameSession.allowed_players, \
+        "Invalid number of players"
+    path = table_path(no_players) if path is None else path
+    shape = (no_hands(no_players), NO_SUITS, len(BID_LEVELS))
+    if os.path.exists(path):
+        table = np.load(path, mmap_mode='r+')
+        assert table.shape == shape, "Table file does not match the game"
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        table = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                          shape=shape)
+        table[:] = NOT_DONE
+    ranks = range(shape[0]) if ranks is None else ranks
+    no_cards = GameSession.total_cards // no_players
+    done = (table[ranks.start:ranks.stop] != NOT_DONE).all(axis=(1, 2))
+    # Only the canonical hand of every suit permutation is estimated
+    todo = set()
+    for rank in range(ranks.start, ranks.stop):
+        if done[rank - ranks.start]:
+            continue
+        canonical = hand_rank(canonical_hand(hand_unrank(rank,
+                                                         no_cards))[0])
+        if table[canonical, 0, 0] != NOT_DONE:
+            # The orbit of an earlier partial build is completed
+            _fill_orbit(table, canonical, table[canonical], no_cards)
+        else:
+            todo.add(canonical)
+    todo = sorted(todo)
+    tasks = [(no_players, todo[i:i + chunk_size], samples, seed)
+             for i in range(0, len(todo), chunk_size)]
+    with mp.Pool(processes) as pool:
+        for chunk, rows in pool.imap_unordered(_estimate_chunk, tasks):
+            for rank, row in zip(chunk, rows):
+                _fill_orbit(table, rank, row, no_cards)
+            table.flush()
+    return table
+
+
+def _fill_orbit(table, rank, row, no_cards):
+    """Copy the row of a canonical hand to the hands with permuted suits"""
+    row = np.array(row)
+    for hand, perm in orbit(hand_unrank(rank, no_cards)).items():
+        table[hand_rank(hand)] = row[list(perm)]
+
+
+class EquityTable:
+    """
+    This class reads the win probabilities of hands from a table file
+    through a memory map
+
+    Attributes:
+        no_players (int) - number of players in the game
+        table (ndarray) - (hands, suits, bid levels) memory mapped table
+    """
+    def __init__(self, no_players, path=None):
+        path = table_path(no_players) if path is None else path
+        self.no_players = no_players
+        self.table = np.load(path, mmap_mode='r')
+
+    def win_probs(self, hand):
+        """
+        Return the (suits, bid levels) win probabilities of a hand or
+        None if the hand has not been computed
+        """
+        row = self.table[hand_rank(hand)]
+        if row[0, 0] == NOT_DONE:
+            return None
+        return row / PROB_SCALE
+
+
+# Tables loaded by the players, by number of players
+_tables = {}
+
+
+def load_table(no_players):
+    """Return the default table of a game or None if it is not built"""
+    if no_players not in _tables:
+        path = table_path(no_players)
+        _tables[no_players] = (EquityTable(no_players, path)
+                               if os.path.exists(path) else None)
+    return _tables[no_players]
+
+
+class EquityPlayer(Player):
+    """
+    This class creates a bot which bids with a lookup in the equity table.
+    It raises to the bid and trump with the best expected round points.
+
+    Attributes:
+        min_gain (float) - expected points needed to make a bid
+    """
+    min_gain = 0.0
+
+    def get_wager(self, wager_history):
+        """
+        Return a wager when requested
+        """
+        session = self.session
+        table = load_table(session.no_players)
+        probs = None
+        if table is not None:
+            probs = table.win_probs(cards_to_mask(self.cards))
+        if probs is None:
+            return super().get_wager(wager_history)
+        # Expected round points of every trump and bid level
+        gains = np.zeros_like(probs)
+        for i, bid in enumerate(BID_LEVELS):
+            open_goat = bid == "Open Goat"
+            wager = GameSession.total_points if open_goat else bid
+            gains[:, i] = (
+                probs[:, i] * session.round_points(
+                                        wager, 'W', False, open_goat) +
+                (1 - probs[:, i]) * session.round_points(
+                                        wager, 'L', False, open_goat))
+        current, wager_plr, wager_team = wager_history[-1]
+        level = BID_LEVELS.index(current) if current in BID_LEVELS else 0
+        self.trump_choice = session.suits_map[int(probs[:, level].argmax())]
+        # Do not raise the wager of a team mate
+        if wager_team == self.team[2] and wager_plr != self.index:
+            return False, None
+        allowed = [i for i, bid in enumerate(BID_LEVELS)
+                   if bid == "Open Goat" or bid > current]
+        trump, i = np.unravel_index(gains[:, allowed].argmax(),
+                                    (NO_SUITS, len(allowed)))
+        if gains[trump, allowed[i]] <= self.min_gain:
+            return False, None
+        self.trump_choice = session.suits_map[int(trump)]
+        return True, BID_LEVELS[allowed[i]]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        description="Build the bidding equity tables")
+    parser.add_argument("-p", "--players", type=int, default=4,
+                        choices=GameSession.allowed_players)
+    parser.add_argument("-s", "--samples", type=int, default=32)
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    build_table(args.players, args.samples, processes=args.processes,
+                seed=args.seed)
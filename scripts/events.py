@@ -0,0 +1,142 @@
+import queue
+from collections import namedtuple
+
+# Events emitted by the rounds of a game session. Every field is a plain
+# value, so events can be put on a thread or process queue as they are.
+Deal = namedtuple("Deal", "round_no hands")
+Bid = namedtuple("Bid", "round_no player wager open_goat")
+TrumpSet = namedtuple("TrumpSet", "round_no player trump")
+CardPlayed = namedtuple("CardPlayed", "round_no pass_no player card")
+TrumpOpened = namedtuple("TrumpOpened", "round_no pass_no player trump")
+Goat = namedtuple("Goat", "round_no player")
+PassResolved = namedtuple("PassResolved",
+                          "round_no pass_no winner team_pts outcome")
+RoundScored = namedtuple("RoundScored",
+                         "round_no outcome wager_team score jackie_given")
+EVENT_TYPES = (Deal, Bid, TrumpSet, CardPlayed, TrumpOpened, Goat,
+               PassResolved, RoundScored)
+
+
+class EventBus:
+    """
+    This class passes the events of a game session to its subscribers.
+    The engine tests the bus before building an event, so a session
+    without subscribers, e.g. a headless simulation, pays nothing.
+    Copies of the bus drop the subscribers, a search working on a copy
+    of the session does not notify the GUI.
+
+    Attributes:
+        subscribers (list) - (callback, event types) in subscription order
+    """
+    def __init__(self):
+        """Constructor for the EventBus class"""
+        self.subscribers = []
+
+    def __bool__(self):
+        return bool(self.subscribers)
+
+    def subscribe(self, callback, *kinds):
+        """
+        Call a function with every event of the given types
+
+        Parameters:
+            callback (function) - called with the event
+            kinds - event types wanted, every event if none is given
+
+        Returns:
+            token (tuple) - subscription to pass to unsubscribe
+        """
+        for kind in kinds:
+            assert kind in EVENT_TYPES, "Unknown event type"
+        token = (callback, kinds or EVENT_TYPES)
+        self.subscribers.append(token)
+        return token
+
+    def unsubscribe(self, token):
+        """Remove a subscription made with subscribe"""
+        self.subscribers.remove(token)
+
+    def emit(self, event):
+        """Pass an event to the subscribers of its type"""
+        for callback, kinds in list(self.subscribers):
+            if type(event) in kinds:
+                callback(event)
+
+    def __getstate__(self):
+        return {"subscribers": []}
+
+    def __deepcopy__(self, memo):
+        return EventBus()
+
+
+class QueueSink:
+    """
+    This class forwards events to a queue.Queue or multiprocessing.Queue
+    so they are consumed by another thread or process. Events are put in
+    lists of batch_size events. When the queue is full a batch is dropped
+    unless the sink blocks, the engine never waits for a slow consumer.
+
+    Attributes:
+        queue - queue the batches are put on
+        batch_size (int) - events put on the queue at once
+        block (bool) - wait for room in the queue instead of dropping
+        pending (list) - events of the batch being filled
+        dropped (int) - number of events dropped
+    """
+    def __init__(self, queue_, batch_size=1, block=False):
+        """
+        Constructor for the QueueSink class
+
+        Parameters:
+            queue_ - queue the batches are put on
+            batch_size (int) - events put on the queue at once
+            block (bool) - wait for room in the queue instead of dropping
+        """
+        assert batch_size > 0, "Invalid batch size"
+        self.queue = queue_
+        self.batch_size = batch_size
+        self.block = block
+        self.pending = []
+        self.dropped = 0
+
+    def __call__(self, event):
+        self.pending.append(event)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Put the pending events on the queue"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            self.queue.put(batch, self.block)
+        except queue.Full:
+            self.dropped += len(batch)
+
+
+def drain(queue_, callback, max_batches=None):
+    """
+    Pass the events waiting on a queue fed by a QueueSink to a function
+    without blocking, e.g. from a GUI timer
+
+    Parameters:
+        queue_ - queue fed by a QueueSink
+        callback (function) - called with every event in order
+        max_batches (int) - batches taken at most, all if None
+
+    Returns:
+        count (int) - number of events passed
+    """
+    count = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            batch = queue_.get_nowait()
+        except queue.Empty:
+            break
+        for event in batch:
+            callback(event)
+        count += len(batch)
+        batches += 1
+    return count
@@ -1,12 +1,12 @@
 import tkinter as tk
-import os
 from tkinter import ttk, Menu
 from tkinter import messagebox as msg
 from game import GameSession
 from roundhandler import ManageRound
 from popups import SelectDialog
-from PIL import Image
-from PIL.ImageTk import PhotoImage
+from assets import SpriteAtlas
+from botservice import BotService
+from hints import HintEngine
 
 
 class GameGUI:
@@ -31,26 +31,29 @@ class GameGUI:
                 8: ((-0.175, 0), (-0.08, -0.1), (0, -0.1), (0.08, -0.1),
                     (0.175, 0), (0.08, 0.1), (0, 0.1), (-0.08, 0.1))}
 
-    img_path = os.path.dirname(__file__) + '/../cards'
     game_mode_options = ("Bot vs Users", "User vs Bots", "Bots Only")
+    # Playback speed of the rounds, factor applied to the waits
+    speed_options = {"Pause": 0, "1x": 1, "4x": 4, "Instant": float('inf')}
 
     def __init__(self):
         self.game_sess = None
-        self.round_sess = None
+        self.round = None
         self.root = tk.Tk()
         self.root.protocol("WM_DELETE_WINDOW", self._quit)
         self.root.title("Jackie - Welcome")
         self.root.iconbitmap('Jackie.ico')
         self.root.geometry('300x300')
+        self.bots = BotService(self.root)   # Computes the bot moves
         self.__cur_frame = None
         self.plr_count = 0
         self.game_mode = []
-        # variables to load images
-        self.__card_imgs = {}
-        self.__suit_imgs = {}
-        self.__card_back = None
-        self.usr_sel_done = tk.BooleanVar()
-        self.blvar = tk.BooleanVar()
+        # Images of the cards and suits
+        self.__sprites = None
+        self.speed = tk.StringVar(value="1x")
+        self.show_hints = tk.BooleanVar(value=False)
+        self.usr_card_callback = None
+        self.__hints = None         # HintEngine of the user's turn
+        self.__hint_job = None
 
         self._create_menu()             # Create the menu widgets
         self._start_screen()            # Start the application
@@ -61,14 +64,71 @@ class GameGUI:
                               "Are you sure that you want to close " +
                               "the application?")
         if answer:
-            self.blvar.set(not self.blvar.get())
-            self.usr_sel_done.set(not self.usr_sel_done.get())
-            if self.round_sess is not None:
-                self.root.after_cancel(self.round_sess)
+            if self.round is not None:
+                self.round.cancel()
+            self._stop_hints()
+            self.bots.shutdown()
             self.root.quit()
             self.root.destroy()
             exit()
 
+    def _set_speed(self):
+        """Apply a new playback speed to the round being played"""
+        if self.round is not None:
+            self.round.set_speed()
+
+    def _toggle_hints(self):
+        """Show or hide the hints of the user's turn"""
+        if self.show_hints.get():
+            self._start_hints()
+        else:
+            self._stop_hints()
+
+    def _start_hints(self):
+        """Start ranking the cards enabled for the user"""
+        self._stop_hints()
+        if not self.show_hints.get() or self.usr_card_callback is None:
+            return
+        plr_index = self.active_player
+        plr = self.game_sess.players[plr_index]
+        cards = [plr.cards[i]
+                 for i, card_obj in enumerate(self.plr_cards[plr_index])
+                 if card_obj['state'] == 'normal']
+        if not cards:
+            # The user has to ask for the trump first
+            return
+        self.__hints = HintEngine(self.game_sess, plr_index, cards).start()
+        self.hint_text['text'] = "Thinking..."
+        self.hint_panel.place(
+                              anchor='ne', relwidth=0.1, relheight=0.22,
+                              relx=0.99, rely=0.15)
+        self.__hint_job = self.root.after(250, self._show_hints)
+
+    def _show_hints(self):
+        """Display the latest ranking of the hint engine"""
+        ranking = self.__hints.ranking()
+        if ranking:
+            self.hint_text['text'] = "\n".join(
+                    "{} {}  {:.0%}".format(key, suit, prob)
+                    for (suit, key), prob in ranking) + \
+                "\n\n{} samples".format(self.__hints.samples)
+        self.__hint_job = self.root.after(250, self._show_hints)
+
+    def _stop_hints(self):
+        """Cancel the analysis of the user's turn and hide the hints"""
+        if self.__hints is None:
+            return
+        self.__hints.cancel()
+        self.__hints = None
+        if self.__hint_job is not None:
+            self.root.after_cancel(self.__hint_job)
+            self.__hint_job = None
+        self.hint_panel.place_forget()
+
+    def playback_speed(self):
+        """Return the factor applied to the waits, 0 if paused"""
+        return self.speed_options[self.speed.get()]
+
     def _about(self):
         msg.showinfo('About',
                      "This game was created by Mohith Sakthivel in 2020")
@@ -78,6 +138,10 @@ class GameGUI:
                               "Are you sure that you want to cancel the "
                               "current session and start a new game?")
         if answer:
+            if self.round is not None:
+                self.round.cancel()
+            self._stop_hints()
+            self.bots.shutdown()
             self.__init__()
 
     def _create_menu(self):
@@ -89,6 +153,17 @@ class GameGUI:
         self.file_menu.add_command(label="New Game", command=self._new_game)
         self.file_menu.add_command(label="Exit", command=self._quit)
         self.menu_bar.add_cascade(label="File", menu=self.file_menu)
+        self.speed_menu = Menu(self.menu_bar, tearoff=0)
+        for label in self.speed_options:
+            self.speed_menu.add_radiobutton(
+                                label=label, variable=self.speed,
+                                value=label, command=self._set_speed)
+        self.menu_bar.add_cascade(label="Speed", menu=self.speed_menu)
+        self.view_menu = Menu(self.menu_bar, tearoff=0)
+        self.view_menu.add_checkbutton(
+                            label="Show Hints", variable=self.show_hints,
+                            command=self._toggle_hints)
+        self.menu_bar.add_cascade(label="View", menu=self.view_menu)
         self.help_menu = Menu(self.menu_bar, tearoff=0)
         self.help_menu.add_command(label="About", command=self._about)
         self.menu_bar.add_cascade(label="Help", menu=self.help_menu)
@@ -297,6 +372,7 @@ class GameGUI:
         self.rnd_pts[1].grid(row=5, column=2)
         # Load images of the cards
         self._load_cards()
+        self._create_card_pools()
         # Build the trump display area
         self.trump_data = tk.LabelFrame(
                                         self.__cur_frame, text="Trump",
@@ -310,6 +386,15 @@ class GameGUI:
                                    font=('Helvetica', 10, 'bold'),
                                    command=self.show_trump)
         self.cur_trump = tk.Label(self.trump_data)
+        # Panel ranking the cards of the user when hints are shown
+        self.hint_panel = tk.LabelFrame(
+                                        self.__cur_frame, text="Hints",
+                                        font=('Helvetica', 11, 'bold'),
+                                        bd=8, labelanchor='n')
+        self.hint_text = tk.Label(
+                                  self.hint_panel, justify=tk.LEFT,
+                                  font=('Helvetica', 10, 'normal'))
+        self.hint_text.pack(expand=True)
         # Button for going for goat
         self.goat_btn = tk.Button(
                                   self.__cur_frame, text="Goat",
@@ -324,8 +409,7 @@ class GameGUI:
         """
         self.start_round.place_forget()
         self.round = ManageRound(self, self.game_sess)
-        # self.round.start_round()
-        self.round_sess = self.root.after(0, self.round.start_round)
+        self.round.start_round()
 
     def update_round_no(self, no):
         """Updates round number on the screen"""
@@ -345,23 +429,19 @@ class GameGUI:
         if self.get_trump in self.trump_data.pack_slaves():
             self.get_trump.pack_forget()
         trump = self.active_round.ask_trump(self.active_player)
-        self.cur_trump['image'] = self.__suit_imgs[trump]
+        self.cur_trump['image'] = self.__sprites[trump]
         self.cur_trump.pack(expand=True)
-        # Disable nontrump cards if player has trump
-        has_trump = False
+        # Enable the cards playable once the trump is open
         player = self.game_sess.players[self.active_player]
-        for card in player.cards:
-            if card[0] == trump:
-                has_trump = True
-                break
-        if has_trump:
-            for i, card_obj in enumerate(self.plr_cards[self.active_player]):
-                if player.cards[i][0] != trump:
-                    card_obj['state'] = 'disabled'
+        playable = player.playable_cards(self.active_round)
+        for i, card_obj in enumerate(self.plr_cards[self.active_player]):
+            card_obj['state'] = 'normal' if i in playable else 'disabled'
+        # Rank the cards left enabled
+        self._start_hints()
 
     def update_trump(self, trump):
         """Updates the opened trump in the GUI when trump is opened by a bot"""
-        self.cur_trump['image'] = self.__suit_imgs[trump]
+        self.cur_trump['image'] = self.__sprites[trump]
         self.cur_trump.pack(expand=True)
 
     def show_get_trump(self):
@@ -376,73 +456,67 @@ class GameGUI:
             str(self.cur_wager_pts['text']) + " (Goat)"
         self.goat_btn['state'] = 'disabled'
 
-    def _play_card(self, obj, card):
+    def _play_card(self, obj):
         """
-        Delete the card played by the user from the GUI and
+        Hide the card played by the user from the GUI and
         return the card details to the program
         """
         obj.pack_forget()
-        obj.destroy()
-        self.usr_card = card
-        self.usr_sel_done.set(True)
-
-    def display_cards(self):
-        """Display the cards in the game screeen"""
-        start = self.game_sess.start_player
-        self.played_cards = []
-        count = 0
-        no_cards = self.game_sess.rounds[-1].no_passes
+        self._post_user_play(self.__pool_cards[obj])
+
+    def _create_card_pools(self):
+        """
+        Create the card widgets of the player spaces and of the played
+        cards once for the game. The rounds show, hide and change the
+        image of these widgets instead of creating new ones.
+        """
+        no_cards = self.game_sess.total_cards // self.plr_count
+        self.__hand_pool = []
+        self.__trick_slots = []
+        self.__pool_cards = {}      # Card shown by each card button
+        for i, plr in enumerate(self.game_sess.players):
+            pool = []
+            for _ in range(no_cards):
+                if plr.user_control and self.game_mode == "User vs Bots":
+                    card_obj = tk.Button(self.plr_space[i], state='disabled')
+                    # Define the function to invoke on clicking the card
+                    card_obj['command'] = \
+                        lambda obj=card_obj: self._play_card(obj)
+                else:
+                    card_obj = tk.Label(self.plr_space[i])
+                pool.append(card_obj)
+            self.__hand_pool.append(pool)
+            self.__trick_slots.append(tk.Label(self.__cur_frame))
         self.plr_cards = [[] for _ in range(self.plr_count)]
-        while (count < 2):
-            for i in range(start, start + self.plr_count):
-                i = i % self.plr_count
-                plr = self.game_sess.players[i]
-                for j in range(int(count*(no_cards//2)), len(plr.cards)):
-                    if (not plr.user_control or
-                            (self.game_mode != "User vs Bots")):
-                        self.plr_cards[i].append(tk.Label(
-                                                    self.plr_space[i],
-                                                    image=self.__card_back))
-                    else:
-                        self.plr_cards[i].append(tk.Button(
-                                        self.plr_space[i],
-                                        image=self.__card_imgs[plr.cards[j]]))
-                        # Define the function to invoke on clicking the card
-                        self.plr_cards[i][j]['command'] = \
-                            lambda obj=self.plr_cards[i][j], cd=plr.cards[j]: \
-                            self._play_card(obj, cd)
-                        self.plr_cards[i][j]['state'] = 'disabled'
-                    self.plr_cards[i][j].pack(
-                                              side=tk.LEFT,
-                                              padx=1, pady=1)
-                    if (j+1) == (no_cards//2):
-                        break
-                self.add_wait_time(250)     # Add a wait while dealing cards
-            self.add_wait_time(250)     # Add a wait while dealing cards
-            count = count+1
-
-    def add_wait_time(self, time_ms):
-        self.root.after(time_ms, lambda: self.blvar.set(not self.blvar.get()))
-        self.root.wait_variable(self.blvar)
+
+    def start_deal(self):
+        """Clear the cards of the previous round before dealing"""
+        for index in range(self.plr_count):
+            for card_obj in self.plr_cards[index]:
+                card_obj.pack_forget()
+            self.plr_cards[index].clear()
+            self.__trick_slots[index].place_forget()
+
+    def display_cards(self, plr_index, half):
+        """Display one half of the hand of a player while dealing"""
+        plr = self.game_sess.players[plr_index]
+        no_cards = self.game_sess.rounds[-1].no_passes
+        start = half * (no_cards // 2)
+        stop = no_cards // 2 if half == 0 else len(plr.cards)
+        for j in range(start, stop):
+            card_obj = self.__hand_pool[plr_index][j]
+            if isinstance(card_obj, tk.Button):
+                card_obj['image'] = self.__sprites[plr.cards[j]]
+                card_obj['state'] = 'disabled'
+                self.__pool_cards[card_obj] = plr.cards[j]
+            else:
+                card_obj['image'] = self.__sprites["back"]
+            card_obj.pack(side=tk.LEFT, padx=1, pady=1)
+            self.plr_cards[plr_index].append(card_obj)
 
     def _load_cards(self):
-        """Loads the image of the card"""
-        size = self.card_size[self.plr_count]
-        for suit in self.game_sess.suits_map:
-            for key in self.game_sess.key_map:
-                # Load the cards
-                path_ = self.img_path+'\\' + suit + '\\' + suit[0]+key+'.png'
-                self.__card_imgs[(suit, key)] = PhotoImage(
-                        Image.open(path_).resize(size, Image.ANTIALIAS))
-        # Load the back of the cards
-        path_ = self.img_path+'\\misc\\gray_back.png'
-        self.__card_back = PhotoImage(Image.open(
-                                    path_).resize(size, Image.ANTIALIAS))
-        # Load the images of the suits
-        for suit in self.game_sess.suits_map:
-            path_ = self.img_path+'\\suits\\'+suit+'.png'
-            self.__suit_imgs[suit] = PhotoImage(Image.open(path_).resize(
-                                                (70, 85), Image.ANTIALIAS))
+        """Set the images of the cards, loaded when first displayed"""
+        self.__sprites = SpriteAtlas(self.card_size[self.plr_count])
 
     def update_bot_play(self, card_data):
         """
@@ -451,45 +525,31 @@ class GameGUI:
         plr_index = card_data[0]
         card = card_data[1]
         self.plr_cards[plr_index].pop().pack_forget()
-        self.played_cards.append(tk.Label(
-                                          self.__cur_frame,
-                                          image=self.__card_imgs[card]))
-        self.played_cards[-1].place(
-                        anchor=tk.CENTER,
-                        relx=0.5+self.card_loc[self.plr_count][plr_index][0],
-                        rely=0.5+self.card_loc[self.plr_count][plr_index][1])
-
-    def get_user_play_card(self, plr_index, round_, plr):
+        self._show_played_card(plr_index, card)
+
+    def _show_played_card(self, plr_index, card):
+        """Show a card in the played cards area of its player"""
+        slot = self.__trick_slots[plr_index]
+        slot['image'] = self.__sprites[card]
+        slot.place(anchor=tk.CENTER,
+                   relx=0.5+self.card_loc[self.plr_count][plr_index][0],
+                   rely=0.5+self.card_loc[self.plr_count][plr_index][1])
+
+    def get_user_play_card(self, plr_index, round_, plr, callback):
         """
-        Recieves the card to play from the user
+        Enable the cards the user can play. The function returns at once
+        and the card clicked is passed to callback.
         """
         self.active_player = plr_index
         self.active_round = round_
-        no_suit = True
-        if self.game_mode == "User vs Bots":
-            for suit, _ in self.game_sess.players[plr_index].cards:
-                if suit == round_.suit_in_play or not round_.suit_in_play:
-                    no_suit = False
-                    break
-        if (self.game_mode == "Bot vs Users" or
-                (no_suit and not round_.trump_open)):
+        self.usr_card_callback = callback
+        # No card is playable until a user without the suit in play
+        # asks for the trump
+        playable = plr.playable_cards(round_)
+        if self.game_mode == "Bot vs Users" or not playable:
             self.show_get_trump()
-        self.usr_card = None
-        self.usr_sel_done.set(False)
-        no_match_suit = True
-        # Enable cards matching with current suit in play
-        for i, card_obj in enumerate(self.plr_cards[plr_index]):
-            if ((not round_.suit_in_play
-                    and (plr.cards[i][0] != round_.trump or round_.trump_open
-                         or not plr.stake_player))
-                    or plr.cards[i][0] == round_.suit_in_play
-                    or (not round_.suit_in_play and round_.open_goat)):
-                card_obj['state'] = 'normal'
-                no_match_suit = False
-        # If there is no matching card enable all cards
-        if no_match_suit:
-            for card_obj in self.plr_cards[plr_index]:
-                card_obj['state'] = 'normal'
+        for i in playable:
+            self.plr_cards[plr_index][i]['state'] = 'normal'
         # Enable goat option if conditions apply
         plr_team = plr.team[2]
         if (not round_.suit_in_play and plr_team == round_.wager_team and
@@ -497,40 +557,37 @@ class GameGUI:
                 not round_.open_goat and not round_.goat):
             self.goat_btn['command'] = lambda rnd=round_: self.go_for_goat(rnd)
             self.goat_btn['state'] = 'normal'
-        self.root.wait_variable(self.usr_sel_done)
+        self._start_hints()
+
+    def _post_user_play(self, usr_card):
+        """Update the GUI for the card played by the user"""
+        self._stop_hints()
+        plr_index = self.active_player
+        plr = self.game_sess.players[plr_index]
         # Delete the played card from the player object and the GUI card list
         for i, card in enumerate(plr.cards):
-            if card == self.usr_card:
-                plr.cards = plr.cards[:i] + plr.cards[i+1:]
-                self.plr_cards[plr_index] = \
-                    self.plr_cards[plr_index][:i] + \
-                    self.plr_cards[plr_index][i+1:]
+            if card == usr_card:
+                del plr.cards[i]
+                del self.plr_cards[plr_index][i]
                 break
         for card_obj in self.plr_cards[plr_index]:
             card_obj['state'] = 'disabled'
         self.goat_btn['state'] = 'disabled'
         # Display the played card in the played cards area
-        self.played_cards.append(tk.Label(
-                                        self.__cur_frame,
-                                        image=self.__card_imgs[self.usr_card]))
-        self.played_cards[-1].place(
-                        anchor=tk.CENTER,
-                        relx=0.5+self.card_loc[self.plr_count][plr_index][0],
-                        rely=0.5+self.card_loc[self.plr_count][plr_index][1])
+        self._show_played_card(plr_index, usr_card)
         # Disable show get trump
         if self.get_trump in self.trump_data.pack_slaves():
             self.get_trump.pack_forget()
-        return self.usr_card
+        callback, self.usr_card_callback = self.usr_card_callback, None
+        callback(usr_card)
 
     def post_pass_update(self, round_):
         """
         Updates the GUI based on the latest pass of the round
         """
-        # Delete the played cards from the screen
-        for card in self.played_cards:
-            card.place_forget()
-            card.destroy()
-        self.played_cards = []
+        # Hide the played cards from the screen
+        for slot in self.__trick_slots:
+            slot.place_forget()
         # Update the points in the round
         self.rnd_pts[0]['text'] = round_.team_pts[0]
         self.rnd_pts[1]['text'] = round_.team_pts[1]
@@ -539,11 +596,11 @@ class GameGUI:
         """
         Updates the GUI based on the latest round
         """
-        # Remove all remaining cards
+        # Hide all remaining cards
         for index in range(len(self.plr_cards)):
             for card_obj in self.plr_cards[index]:
                 card_obj.pack_forget()
-                card_obj.destroy()
+            self.plr_cards[index].clear()
         # Reset the round stats
         self.cur_wager_team['text'] = "---"
         self.cur_wager_team['foreground'] = 'black'
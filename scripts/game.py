@@ -1,4 +1,6 @@
 import numpy as np
+import events
+import zobrist
 
 # No players allowed in the game
 allowed_players = (4, 6, 8)
@@ -37,17 +39,24 @@ class GameSession:
     suits_map = ("Spade", "Heart", "Club", "Diamond")
     key_map = ("Q", "K", "10", "A", "9", "J")
 
-    def __init__(self, no_players, player_names=None, teams=None):
+    def __init__(self, no_players, player_names=None, teams=None,
+                 player_types=None, seed=None):
         """
         Constructor for the game_session class
 
         Parameters:
             no_players (int) - number of players in the game
+            player_types (list) - Player subclass used for each seat.
+                                  Defaults to Player for all seats
+            seed - seed or numpy.random.Generator used for the deals
+                   and the choice of start players
         """
         assert no_players in self.allowed_players, "Invalid number of players"
         assert teams is None or len(teams) == 2, "Invalid teams input"
         assert player_names is None or len(player_names) == no_players, \
             "Invalid player names list"
+        assert player_types is None or len(player_types) == no_players, \
+            "Invalid player types list"
         self.no_players = no_players
         # Players and teams
         self.team_plrs = [[], []]   # contains index of players in respt teams
@@ -62,6 +71,7 @@ class GameSession:
         else:
             self.teams = teams
         # Game related variables
+        self.rng = np.random.default_rng(seed)
         self.start_plr_list = [i for i in range(no_players)]
         self.start_player = None
         self.no_rounds = 0
@@ -69,11 +79,15 @@ class GameSession:
         # score - [[team idx, pts], [team 1 no cont jack, team 2 no cont jack]]
         self.score = [[None, None], [0, 0]]
         self.jackie_given = False
+        self.log = None         # GameLogWriter recording the rounds
+        self.events = events.EventBus()     # Events of the rounds played
         self.plr_dict = {}      # Maps player names to index
         # Create player agents in the game
         self.players = []
+        if player_types is None:
+            player_types = [Player] * self.no_players
         for i in range(self.no_players):
-            self.players.append(Player(
+            self.players.append(player_types[i](
                                        self.player_names[i], i,
                                        self.teams[i % 2], self))
             self.plr_dict[self.player_names[i]] = i
@@ -122,24 +136,7 @@ class GameSession:
         if outcome == 'N':
             self.post_round_process()
             self.post_round_process()
-        if open_goat:
-            # Process points for open goat
-            if outcome == 'W':
-                pts = 4
-            else:
-                pts = -8
-        else:
-            # Find points for the set wager
-            if wager >= 20:
-                pts = 2
-            else:
-                pts = 1
-            # Check for goat
-            if goat:
-                pts = pts+1
-            # Update points based on win/loss
-            if outcome == 'L':
-                pts = - (pts+1)
+        pts = self.round_points(wager, outcome, goat, open_goat)
         # Check what team is used in current score
         if self.score[0] == [None, None]:
             self.score[0] = [wager_team, 0]
@@ -162,6 +159,31 @@ class GameSession:
             self.score[0] = [None, None]
         self.post_round_process()   # Do post round cleanup
 
+    @staticmethod
+    def round_points(wager, outcome, goat, open_goat):
+        """
+        Return the points gained by the wager team for a round outcome
+        """
+        if open_goat:
+            # Process points for open goat
+            if outcome == 'W':
+                pts = 4
+            else:
+                pts = -8
+        else:
+            # Find points for the set wager
+            if wager >= 20:
+                pts = 2
+            else:
+                pts = 1
+            # Check for goat
+            if goat:
+                pts = pts+1
+            # Update points based on win/loss
+            if outcome == 'L':
+                pts = - (pts+1)
+        return pts
+
     def post_round_process(self):
         """Does post processing after a round is over"""
         # Set the choices for the next starting player
@@ -177,7 +199,69 @@ class GameSession:
 
     def select_start_player(self):
         """Selects a random start player from the available choices"""
-        self.start_player = np.random.choice(self.start_plr_list)
+        self.start_player = self.rng.choice(self.start_plr_list)
+
+
+# Lookup tables of the pass resolution. Cards are indexed by their card
+# id suit index * 6 + heirarchy, the same numbering as deal_cards.
+CARD_INDEX = {(suit, key): GameSession.suits[suit] * 6 +
+              GameSession.heirarchy[key]
+              for suit in GameSession.suits_map
+              for key in GameSession.key_map}
+CARD_SUIT = tuple(i // 6 for i in range(GameSession.total_cards))
+CARD_POINTS = tuple(GameSession.point_table[GameSession.key_map[i % 6]]
+                    for i in range(GameSession.total_cards))
+
+
+def _card_power(card, lead, trump, trump_active):
+    """
+    Power of a card in a pass, the card with the highest power wins.
+    Cards which are neither of the suit in play nor an active trump can
+    not win and have no power.
+    """
+    suit, rank = CARD_SUIT[card], card % 6
+    if suit == trump and (trump_active or lead == trump):
+        return 2 * 6 + 1 + rank
+    if suit == lead:
+        return 6 + 1 + rank
+    return 0
+
+
+# TRICK_POWER[power_offset(trump_active, trump, lead) + card]
+NO_SUITS = len(GameSession.suits_map)
+TRICK_POWER = tuple(_card_power(card, lead, trump, trump_active)
+                    for trump_active in (False, True)
+                    for trump in range(NO_SUITS)
+                    for lead in range(NO_SUITS)
+                    for card in range(GameSession.total_cards))
+
+
+def power_offset(trump_active, trump, lead):
+    """Return the offset in TRICK_POWER of a trump and suit in play"""
+    return (((trump_active * NO_SUITS + trump) * NO_SUITS + lead) *
+            GameSession.total_cards)
+
+
+def trick_winner(cards, trump, lead, active_from):
+    """
+    Return the position of the winning card of a pass
+
+    Parameters:
+        cards (list) - card ids in the order played
+        trump (int) - trump suit index
+        lead (int) - suit index of the suit in play
+        active_from (int) - position of the first card for which the
+                            trump is active, len(cards) if it is not
+    """
+    closed = power_offset(False, trump, lead)
+    active = power_offset(True, trump, lead)
+    best, best_power = 0, -1
+    for pos, card in enumerate(cards):
+        power = TRICK_POWER[(active if pos >= active_from else closed) +
+                            card]
+        if power > best_power:
+            best, best_power = pos, power
+    return best
 
 
 class Round:
@@ -188,6 +272,7 @@ class Round:
     game (game_session) - game session in which the round is started
     wager (int) - target wager set for the session
     open_goat (bool) - has the player called for an open goat
+    zobrist_hash (int) - 64 bit hash of the round state
     """
     def __init__(self, game):
         """
@@ -197,6 +282,7 @@ class Round:
         game (game_session) - game session in which the round is started
         """
         self.session = game
+        self._hash = None   # Zobrist hash, computed when first needed
         self.wager = self.session.base_bet[self.session.no_players]
         self.open_goat = False
         self.goat = False
@@ -214,6 +300,9 @@ class Round:
         self.team_pts = [0, 0]
         self.team_trumps = [0, 0]
         self.play_history = [[]]
+        self.outcome = None
+        self.pass_winner = None     # Player who won the last pass
+        self._undo = []     # State restored by undo_card for each card
 
     def update_wager(self, Player_ID, wager):
         """
@@ -230,6 +319,35 @@ class Round:
             self.wager = wager
         self.wager_history.append(
             (self.wager, self.wager_player, self.wager_team))
+        self._hash = None
+        if self.session.events:
+            self.session.events.emit(events.Bid(
+                    self.session.no_rounds, self.wager_player, self.wager,
+                    self.open_goat))
+
+    @property
+    def trump(self):
+        """Trump suit of the round"""
+        return self._trump
+
+    @trump.setter
+    def trump(self, suit):
+        self._trump = suit
+        self._hash = None
+        if suit is not None and self.session.events:
+            self.session.events.emit(events.TrumpSet(
+                    self.session.no_rounds, self.wager_player, suit))
+
+    @property
+    def zobrist_hash(self):
+        """
+        Zobrist hash of the round state. It is computed from scratch
+        after the deal and trump are set and then updated with every
+        card played, trump asked or goat called.
+        """
+        if self._hash is None:
+            self._hash = zobrist.round_hash(self)
+        return self._hash
 
     def get_wager_data(self):
         """
@@ -250,103 +368,200 @@ class Round:
     def ask_trump(self, plr_index):
         """Return the trump of the current round"""
         if not self.trump_open:
-            self.trump_open_at = (self.passes_done+1, plr_index)
-            self.trump_open = True
+            self._open_trump(plr_index)
+            if self.session.events:
+                self.session.events.emit(events.TrumpOpened(
+                        self.session.no_rounds, self.passes_done + 1,
+                        plr_index, self.trump))
         return self.trump
 
+    def _open_trump(self, plr_index):
+        """Reveal the trump to a player without the suit in play"""
+        self.trump_open_at = (self.passes_done+1, plr_index)
+        self.trump_open = True
+        if self._hash is not None:
+            self._hash ^= (zobrist.TRUMP_OPEN ^ zobrist.TRUMP_OPEN_AT[
+                                    self.passes_done + 1][plr_index])
+
     def set_goat(self):
         """Player chooses to go for goat"""
         assert self.team_pts[(self.wager_team+1) % 2] == 0, \
             "Invalid conditions to go for goat"
+        if self.goat:
+            return
+        if self._hash is not None:
+            self._hash ^= zobrist.GOAT
         self.goat = True
+        if self.session.events:
+            self.session.events.emit(events.Goat(
+                    self.session.no_rounds, self.next_player))
 
     def set_play_card(self, plr_index, card):
         """Recieves the card played by the user"""
+        self._place_card(plr_index, card)
+        if self.session.events:
+            self.session.events.emit(events.CardPlayed(
+                    self.session.no_rounds, self.passes_done + 1, plr_index,
+                    card))
+
+    def _place_card(self, plr_index, card):
+        """Add a card to the pass and set the next player"""
         assert plr_index == self.next_player, "Wrong player has played"
         assert card[0] in self.session.suits_map, "Invalid card"
         assert card[1] in self.session.key_map, "Invalid card"
         if not self.play_history[-1]:
             self.suit_in_play = card[0]
         self.play_history[-1].append((plr_index, card))
+        if self._hash is not None:
+            # Move the card from the hand to the pass
+            index = CARD_INDEX[card]
+            self._hash ^= (zobrist.OWNER[plr_index][index] ^
+                           zobrist.TRICK[plr_index][index] ^
+                           zobrist.TO_MOVE[plr_index])
         # Set the next player to play
         if len(self.play_history[-1]) < self.session.no_players:
             self.next_player = (self.next_player + 1) % self.session.no_players
+            if self._hash is not None:
+                self._hash ^= zobrist.TO_MOVE[self.next_player]
         else:
             self.next_player = None
 
+    def play_card(self, plr_index, card):
+        """
+        Play a card from a player's hand for a search. The player asks
+        for the trump if the suit in play is not in the hand and the pass
+        is resolved once complete, but the session score is not updated.
+        The card is taken back with undo_card.
+
+        Parameters:
+            plr_index (int) - index of the player playing the card
+            card (tuple) - (suit, key) of the card played
+        """
+        plr = self.session.players[plr_index]
+        hand_pos = plr.cards.index(card)
+        self._undo.append((
+                plr_index, card, hand_pos, self.suit_in_play,
+                self.next_player, self.start_player, self.trump_open,
+                self.trump_open_at, self.passes_done, tuple(self.team_pts),
+                tuple(self.team_trumps), self.outcome, self.pass_winner,
+                self._hash))
+        if (self.play_history[-1] and not self.trump_open and
+                all(c[0] != self.suit_in_play for c in plr.cards)):
+            self._open_trump(plr_index)
+        del plr.cards[hand_pos]
+        self._place_card(plr_index, card)
+        if self.next_player is None:
+            self.resolve_pass()
+
+    def undo_card(self):
+        """Take back the last card played with play_card"""
+        (plr_index, card, hand_pos, self.suit_in_play, self.next_player,
+         self.start_player, self.trump_open, self.trump_open_at,
+         self.passes_done, team_pts, team_trumps, self.outcome,
+         self.pass_winner, self._hash) = self._undo.pop()
+        self.team_pts[:] = team_pts
+        self.team_trumps[:] = team_trumps
+        if not self.play_history[-1]:
+            self.play_history.pop()
+        self.play_history[-1].pop()
+        self.session.players[plr_index].cards.insert(hand_pos, card)
+
+    def commit_score(self):
+        """Update the session score with the outcome of the round"""
+        assert self.outcome is not None, "Round is not over"
+        log = self.session.log
+        if log is not None:
+            log.append_round(self)
+        self.session.update_score(self.wager_team, self.wager, self.outcome,
+                                  self.goat, self.open_goat)
+        if log is not None:
+            log.append_score(self.session)
+        if self.session.events:
+            score = self.session.score
+            self.session.events.emit(events.RoundScored(
+                    self.session.no_rounds, self.outcome, self.wager_team,
+                    (tuple(score[0]), tuple(score[1])),
+                    self.session.jackie_given))
+
     def process_pass(self):
         """
         Determine who won the pass and set the next the start player
-        Also updates other round related data
+        Also updates other round related data and the session score
+        once the round is over
+        """
+        result = self.resolve_pass()
+        if self.session.events:
+            self.session.events.emit(events.PassResolved(
+                    self.session.no_rounds, self.passes_done,
+                    self.pass_winner, tuple(self.team_pts), self.outcome))
+        if result[0]:
+            self.commit_score()
+        return result
+
+    def resolve_pass(self):
+        """
+        Determine who won the pass and set the next the start player
+        without updating the session score
+
+        Returns:
+            result (tuple) - (is the round over, outcome of the round)
         """
         assert len(self.play_history[-1]) == self.session.no_players, \
             "All players have not played their hand"
         self.passes_done += 1   # Increment passes completed
-        max_card = self.play_history[-1][0]
-        max_val = self.session.heirarchy[max_card[1][1]]
         result = (False, None)
-        # Check for the max value/power card
-        if self.trump_open and self.trump_open_at[0] < self.passes_done:
-            trump_used = True
-        else:
-            trump_used = False
-        for card_data in self.play_history[-1][1:]:
-            if (not trump_used and
-                    (self.passes_done, card_data[0]) == self.trump_open_at):
-                trump_used = True
-            card_val = self.session.heirarchy[card_data[1][1]]
-            if (card_data[1][0] == self.suit_in_play
-                    and card_val > max_val and
-                    (max_card[1][0] != self.trump or
-                     self.suit_in_play == self.trump)):
-                max_card = card_data
-                max_val = card_val
-            # Add {not self.open_goat} to disable trump in open goat games
-            elif (trump_used and card_data[1][0] == self.trump):
-                if (max_card[1][0] != self.trump or card_val > max_val):
-                    max_card = card_data
-                    max_val = card_val
-                    trump_used = True
+        trick = self.play_history[-1]
+        cards = [CARD_INDEX[card] for _, card in trick]
+        trump = self.session.suits[self.trump]
+        # The trump is active from the card of the player who asked for
+        # it in this pass, or for every card if it was asked before
+        active_from = len(trick)
+        if self.trump_open:
+            if self.trump_open_at[0] < self.passes_done:
+                active_from = 0
+            elif self.trump_open_at[0] == self.passes_done:
+                for pos in range(1, len(trick)):
+                    if trick[pos][0] == self.trump_open_at[1]:
+                        active_from = pos
+                        break
+        max_card = trick[trick_winner(cards, trump, CARD_SUIT[cards[0]],
+                                      active_from)]
+        self.pass_winner = max_card[0]
         # Add points to the team that captured the round
         team_index = self.session.players[max_card[0]].team[2]
-        for card_data in self.play_history[-1]:
-            self.team_pts[team_index] += \
-                self.session.point_table[card_data[1][1]]
-            if card_data[1][0] == self.trump:
-                team_idx = self.session.players[card_data[0]].team[2]
+        for (plr_index, _), card in zip(trick, cards):
+            self.team_pts[team_index] += CARD_POINTS[card]
+            if CARD_SUIT[card] == trump:
+                team_idx = self.session.players[plr_index].team[2]
                 self.team_trumps[team_idx] += 1
         # Check if one team has all trumps
         if ((max(self.team_trumps) == len(self.session.key_map)) or
                 ((self.suit_in_play == self.trump)
                     and (min(self.team_trumps) == 0))):
-            self.session.update_score(
-                                      self.wager_team, self.wager, 'N',
-                                      self.goat, self.open_goat)
-            return (True, 'N')
+            self.outcome = 'N'
+            return (True, self.outcome)
         # Check condition for open goat
         if self.open_goat and max_card[0] != self.wager_player:
-            self.session.update_score(
-                                      self.wager_team, self.wager, 'L',
-                                      self.goat, self.open_goat)
-            return (True, 'L')
+            self.outcome = 'L'
+            return (True, self.outcome)
         # Check if game is over
         for i in range(2):
             if (i == self.wager_team and
                 ((self.team_pts[i] >= self.wager and not self.goat
                     and self.team_pts[(i+1) % 2] > 0)
                  or (self.team_pts[i] == self.session.total_points))):
-                self.session.update_score(
-                                          self.wager_team, self.wager,
-                                          'W', self.goat, self.open_goat)
-                return (True, 'W')
+                self.outcome = 'W'
+                return (True, self.outcome)
             elif (i != self.wager_team and
                   ((self.team_pts[i] > 0 and self.goat) or
                    (self.session.total_points-self.team_pts[i]) < self.wager)):
-                self.session.update_score(
-                                          self.wager_team, self.wager,
-                                          'L', self.goat, self.open_goat)
-                return (True, 'L')
+                self.outcome = 'L'
+                return (True, self.outcome)
         # Process variables for the next pass
+        if self._hash is not None:
+            for plr_index, card in self.play_history[-1]:
+                self._hash ^= zobrist.TRICK[plr_index][CARD_INDEX[card]]
+            self._hash ^= zobrist.TO_MOVE[max_card[0]]
         self.play_history.append([])
         self.start_player = max_card[0]
         self.next_player = max_card[0]
@@ -449,49 +664,112 @@ class Player:
                       self.cards[avl_choices[0][0]+1:])
         round_.set_play_card(self.index, card)
 
+    def playable_cards(self, round_):
+        """
+        Return the index of the cards a user can select in a round, with
+        the rules of bitboard.legal_moves used by the bots and the
+        server. A user without the suit in play has to ask for the trump
+        first, so no card can be selected while it is hidden.
+        """
+        # bitboard is built on the classes of this module
+        from bitboard import BitHand, card_id
+        moves, ask_trump = BitHand.from_cards(self.cards).legal_moves(
+                                                round_, self.stake_player)
+        if ask_trump and not round_.trump_open:
+            return []
+        return [i for i, card in enumerate(self.cards)
+                if moves >> card_id(card) & 1]
+
     def clear_round_data(self):
         """Clear data related to specific round"""
         self.cards = []
         self.stake_player = False
 
 
-def deal_cards_after_jack(session):
-    """Deals cards with jacks to the losing team"""
+def jack_constraints(session):
+    """
+    Returns the jacks to be dealt to the start player after a jackie
+
+    Returns:
+        constraints (dict) - maps the start player's index to the list
+                             of jack cards forced into the hand
+    """
     jack_order = [('Spade', 'J'), ('Heart', 'J'),
                   ('Club', 'J'), ('Diamond', 'J')]
     constraints = {}
     if session.jackie_given:
-        constraints[session.start_player] = \
-            jack_order[:max(session.score[1])]
-    deal_cards(session, constraints)
+        # The jacks given can not exceed the cards dealt to a player
+        no_jacks = min(max(session.score[1]),
+                       session.total_cards // session.no_players)
+        constraints[session.start_player] = jack_order[:no_jacks]
+    return constraints
+
+
+def deal_cards_after_jack(session):
+    """Deals cards with jacks to the losing team"""
+    deal_cards(session, jack_constraints(session))
+
+
+def generate_deals(no_players, batch, rng, constraints=None):
+    """
+    Generate many deals at once. Cards are given as the index
+    suit index * 6 + heirarchy of the card key.
+
+    Parameters:
+        no_players (int) - number of players in the game
+        batch (int) - number of deals to generate
+        rng (numpy.random.Generator) - random number generator to use
+        constraints (dict) - maps a player index to the list of cards
+                             which have to be dealt to the player
+
+    Returns:
+        deals (ndarray) - (batch, players, cards_per_player) array of the
+                          cards dealt to each player. The cards forced by
+                          the constraints are at the end of the hand
+    """
+    total_cards = GameSession.total_cards
+    cards_per_plr = total_cards // no_players
+    forced = {}
+    if constraints:
+        for plr, plr_const in constraints.items():
+            assert len(plr_const) <= cards_per_plr, "Too many constraints"
+            forced[plr] = [GameSession.suits[card[0]]*6 +
+                           GameSession.heirarchy[card[1]]
+                           for card in plr_const]
+    mask = np.ones(total_cards, dtype=bool)
+    for indices in forced.values():
+        mask[indices] = False
+    values = np.arange(total_cards, dtype=np.int8)[mask]
+    # Shuffle every row independently
+    values = values[rng.random((batch, len(values))).argsort(axis=1)]
+    if not forced:
+        return values.reshape(batch, no_players, cards_per_plr)
+    deals = np.empty((batch, no_players, cards_per_plr), dtype=np.int8)
+    start = 0
+    for plr in range(no_players):
+        indices = forced.get(plr, [])
+        no_cards = cards_per_plr - len(indices)
+        deals[:, plr, :no_cards] = values[:, start:start + no_cards]
+        deals[:, plr, no_cards:] = indices
+        start += no_cards
+    return deals
 
 
 def deal_cards(session, constraints=None):
     """
         Deal cards to the players in the game
     """
-    values = np.arange(24)
-    cards_per_plr = int(24 / session.no_players)
-    if len(constraints) > 0:
-        indices = []
-        for plr_const in constraints.values():
-            for card in plr_const:
-                indices.append(session.suits[card[0]]*6 +
-                               session.heirarchy[card[1]])
-        mask = np.ones(len(values), dtype=bool)
-        mask[indices] = False
-        values = values[mask, ...]
-    # Shuffle and deal cards to all the players
-    np.random.shuffle(values)
+    deal = generate_deals(
+                    session.no_players, 1, session.rng, constraints).tolist()
     for plr in session.players:
-        no_cards = cards_per_plr
-        if plr.index in constraints.keys():
-            no_cards -= len(constraints[plr.index])
-        for i in range(no_cards):
+        for value in deal[0][plr.index]:
             plr.add_card((
-                          session.suits_map[values[i] // 6],
-                          session.key_map[values[i] % 6]))
-        if no_cards < cards_per_plr:
-            for card in constraints[plr.index]:
-                plr.add_card(card)
-        values = values[no_cards:]
+                          session.suits_map[value // 6],
+                          session.key_map[value % 6]))
+    if session.rounds:
+        # The hash of the round covers the hands, it is made again
+        session.rounds[-1]._hash = None
+    if session.events:
+        session.events.emit(events.Deal(
+                session.no_rounds,
+                tuple(tuple(plr.cards) for plr in session.players)))
@@ -0,0 +1,197 @@
+import glob
+import json
+import os
+import numpy as np
+from game import GameSession
+
+# Limits of the games covered by the record format
+MAX_PLAYERS = max(GameSession.allowed_players)
+NO_CARDS = GameSession.total_cards
+# Fixed width record of a round. Cards are card ids (suit index * 6 +
+# heirarchy), suits are suit indices and -1 marks an unused entry.
+RECORD = np.dtype([
+    ("no_players", np.uint8),
+    ("start_player", np.int8),
+    ("deal", np.int8, (NO_CARDS,)),             # player dealt each card id
+    ("bids", np.uint8, (MAX_PLAYERS,)),         # wager called, 0 if none
+    ("wager", np.uint8),
+    ("wager_player", np.int8),
+    ("trump", np.int8),
+    ("goat", np.bool_),
+    ("open_goat", np.bool_),
+    ("trump_open_pass", np.int8),               # pass numbered from 1
+    ("trump_open_plr", np.int8),
+    ("no_plays", np.uint8),
+    ("play_cards", np.int8, (NO_CARDS,)),       # cards in the order played
+    ("play_players", np.int8, (NO_CARDS,)),
+    ("team_pts", np.uint8, (GameSession.no_teams,)),
+    ("team_trumps", np.uint8, (GameSession.no_teams,)),
+    ("outcome", "S1"),
+    ("round_points", np.int8),                  # score change of the wager
+    ("jackie", np.bool_),                       # jackie given after it
+    ("jackies", np.uint8, (GameSession.no_teams,)),
+])
+# The file header holds the magic, the version, the record size and the
+# field names padded to a fixed size
+MAGIC = b"JACKLOG\x00"
+VERSION = 1
+HEADER_SIZE = 512
+
+
+def _header():
+    """Return the header bytes of a log file"""
+    fields = json.dumps(RECORD.names).encode()
+    header = (MAGIC + np.array([VERSION, RECORD.itemsize],
+                               np.uint16).tobytes() + fields)
+    assert len(header) <= HEADER_SIZE, "Header too large"
+    return header.ljust(HEADER_SIZE, b"\x00")
+
+
+class GameLogWriter:
+    """
+    This class appends round records to a log file. Records are filled
+    in a preallocated buffer and written when it is full, so logging a
+    round costs no allocation. A session logs its rounds when the writer
+    is set as GameSession.log.
+
+    Attributes:
+        path (str) - path of the log file
+        buffer (ndarray) - records waiting to be written
+        count (int) - number of records in the buffer
+    """
+    def __init__(self, path, buffer_size=4096):
+        """
+        Constructor for the GameLogWriter class. An existing log file is
+        appended to.
+
+        Parameters:
+            path (str) - path of the log file
+            buffer_size (int) - number of records written at once
+        """
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            _check_header(path)
+            # Drop a partial record left by an interrupted write
+            size = os.path.getsize(path) - HEADER_SIZE
+            self.file = open(path, "r+b")
+            self.file.truncate(HEADER_SIZE +
+                               size // RECORD.itemsize * RECORD.itemsize)
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(_header())
+        self.buffer = np.zeros(buffer_size, RECORD)
+        self.count = 0
+
+    def append_round(self, round_):
+        """
+        Add the record of a finished round. The score fields are set by
+        append_score once the session score is updated.
+
+        Parameters:
+            round_ (Round) - round which is over
+        """
+        if self.count == len(self.buffer):
+            self.flush()
+        session = round_.session
+        suits = session.suits
+        heirarchy = session.heirarchy
+        rec = self.buffer[self.count]
+        self.count += 1
+        rec["no_players"] = session.no_players
+        rec["start_player"] = round_.wager_history[0][1]
+        deal = rec["deal"]
+        deal[:] = -1
+        for plr in session.players:
+            for card in plr.cards:
+                deal[suits[card[0]] * 6 + heirarchy[card[1]]] = plr.index
+        rec["bids"] = 0
+        for wager, plr, _ in round_.wager_history[1:]:
+            rec["bids"][plr] = wager
+        rec["wager"] = round_.wager
+        rec["wager_player"] = round_.wager_player
+        rec["trump"] = suits[round_.trump]
+        rec["goat"] = round_.goat
+        rec["open_goat"] = round_.open_goat
+        if round_.trump_open:
+            rec["trump_open_pass"], rec["trump_open_plr"] = \
+                round_.trump_open_at
+        else:
+            rec["trump_open_pass"] = rec["trump_open_plr"] = -1
+        cards = rec["play_cards"]
+        players = rec["play_players"]
+        cards[:] = -1
+        players[:] = -1
+        i = 0
+        for pass_ in round_.play_history:
+            for plr, card in pass_:
+                index = suits[card[0]] * 6 + heirarchy[card[1]]
+                cards[i] = index
+                players[i] = plr
+                deal[index] = plr
+                i += 1
+        rec["no_plays"] = i
+        rec["team_pts"] = round_.team_pts
+        rec["team_trumps"] = round_.team_trumps
+        rec["outcome"] = round_.outcome
+        rec["round_points"] = session.round_points(
+                    round_.wager, round_.outcome, round_.goat,
+                    round_.open_goat)
+
+    def append_score(self, session):
+        """Set the score fields of the last record after update_score"""
+        rec = self.buffer[self.count - 1]
+        rec["jackie"] = session.jackie_given
+        rec["jackies"] = session.score[1]
+
+    def flush(self):
+        """Write the buffered records to the file"""
+        self.file.write(self.buffer[:self.count].tobytes())
+        self.file.flush()
+        self.count = 0
+
+    def close(self):
+        """Write the buffered records and close the file"""
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _check_header(path):
+    """Check that a file is a log with the current record format"""
+    with open(path, "rb") as log:
+        header = log.read(HEADER_SIZE)
+    assert header[:len(MAGIC)] == MAGIC, "Not a game log file"
+    version, itemsize = np.frombuffer(header, np.uint16, 2, len(MAGIC))
+    assert version == VERSION and itemsize == RECORD.itemsize, \
+        "Unsupported game log version"
+
+
+def open_log(path):
+    """
+    Memory map a log file
+
+    Parameters:
+        path (str) - path of the log file
+
+    Returns:
+        records (ndarray) - read-only structured array of the records,
+                            a partial record at the end is left out
+    """
+    _check_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, RECORD)
+    return np.memmap(path, RECORD, mode="r", offset=HEADER_SIZE,
+                     shape=(count,))
+
+
+def open_logs(pattern):
+    """Memory map every log file matching a glob pattern"""
+    return [open_log(path) for path in sorted(glob.glob(pattern))]
@@ -0,0 +1,131 @@
+import argparse
+import time
+from game import GameSession, deal_cards_after_jack
+
+
+class HeadlessGame:
+    """
+    This class plays complete rounds of a game session without any
+    user interface. Every seat is controlled by a bot policy, i.e. an
+    instance of Player or of one of its subclasses.
+
+    Attributes:
+        game_sess (GameSession) - game session being played
+        outcomes (list) - outcome ('W', 'L' or 'N') of each round played
+        keep_rounds (bool) - retain finished Round objects in the session
+        last_round (Round) - the round played last
+    """
+    def __init__(self, no_players, policies=None, player_names=None,
+                 teams=None, keep_rounds=False, seed=None, log=None):
+        """
+        Constructor for the HeadlessGame class
+
+        Parameters:
+            no_players (int) - number of players in the game
+            policies (list) - Player subclass used for each seat
+            keep_rounds (bool) - keep every finished Round in the session.
+                                 Disable for long simulations to keep the
+                                 memory footprint constant
+            seed - seed or numpy.random.Generator of the game session
+            log (GameLogWriter) - writer recording every round played
+        """
+        self.game_sess = GameSession(no_players, player_names, teams,
+                                     player_types=policies, seed=seed)
+        self.game_sess.log = log
+        self.keep_rounds = keep_rounds
+        self.outcomes = []
+        self.last_round = None
+
+    def play_round(self):
+        """
+        Play a single round from the deal until a win/loss
+
+        Returns:
+            outcome (str) - 'W'/'L' for the wager team or 'N' if invalid
+        """
+        game_sess = self.game_sess
+        if game_sess.get_start_player() is None:
+            game_sess.select_start_player()
+        game_sess.start_round()
+        round_ = game_sess.rounds[-1]
+        self.last_round = round_
+        deal_cards_after_jack(game_sess)
+        self._run_wager_round(round_)
+        outcome = self._start_play(round_)
+        game_sess.select_start_player()
+        if not self.keep_rounds:
+            game_sess.rounds.clear()
+        self.outcomes.append(outcome)
+        return outcome
+
+    def play_match(self, max_rounds, stop_on_jackie=True):
+        """
+        Play rounds until a jackie is given or max_rounds are played
+
+        Parameters:
+            max_rounds (int) - maximum number of rounds in the match
+            stop_on_jackie (bool) - end the match when a team gets a jackie
+
+        Returns:
+            outcomes (list) - outcome of each round in the match
+        """
+        outcomes = []
+        for _ in range(max_rounds):
+            outcomes.append(self.play_round())
+            if stop_on_jackie and self.game_sess.jackie_given:
+                break
+        return outcomes
+
+    def _run_wager_round(self, round_):
+        """Ask every player for a wager and set the trump"""
+        game_sess = self.game_sess
+        plr_count = game_sess.no_players
+        start_plr = game_sess.start_player
+        for i in range(start_plr, start_plr + plr_count):
+            player = game_sess.players[i % plr_count]
+            set_wager, value = player.get_wager(round_.wager_history)
+            if set_wager:
+                round_.update_wager(player.ID, value)
+            if round_.open_goat:
+                break
+        wager_plr = game_sess.players[round_.wager_player]
+        wager_plr.set_wager_player()
+        round_.trump = wager_plr.get_trump()
+
+    def _start_play(self, round_):
+        """Play passes until the round is over"""
+        game_sess = self.game_sess
+        plr_count = game_sess.no_players
+        for _ in range(round_.no_passes):
+            for i in range(round_.start_player,
+                           round_.start_player + plr_count):
+                game_sess.players[i % plr_count].get_play_card(round_)
+            round_status = round_.process_pass()
+            if round_status[0]:
+                break
+        return round_status[1]
+
+
+def benchmark(no_players=4, no_rounds=10000, policies=None, seed=None):
+    """
+    Measure the number of rounds played per second by the headless driver
+
+    Returns:
+        rate (float) - rounds played per second
+    """
+    game = HeadlessGame(no_players, policies, seed=seed)
+    start = time.perf_counter()
+    for _ in range(no_rounds):
+        game.play_round()
+    return no_rounds / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        description="Play bot-only rounds without the GUI")
+    parser.add_argument("-p", "--players", type=int, default=4,
+                        choices=GameSession.allowed_players)
+    parser.add_argument("-n", "--rounds", type=int, default=10000)
+    args = parser.parse_args()
+    rate = benchmark(args.players, args.rounds)
+    print("{:.0f} rounds/s with {} players".format(rate, args.players))
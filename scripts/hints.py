@@ -0,0 +1,105 @@
+import random
+import threading
+from game import GameSession
+from belief import BeliefTracker
+from bitboard import card_id, iter_ids
+from botservice import snapshot
+from searchstate import SearchState
+
+
+class HintEngine:
+    """
+    This class ranks the cards a user can play by their estimated win
+    probability while the user decides. A worker thread samples the
+    hidden hands consistent with what the user has seen, plays each card
+    on the sample and finishes the round with random cards. The ranking
+    is published after every batch of samples, so it is refined until
+    the engine is cancelled.
+
+    Attributes:
+        cards (list) - cards ranked by the engine
+        samples (int) - samples of every card in the current ranking
+    """
+    batch = 16
+
+    def __init__(self, session, plr_index, cards, seed=None):
+        """
+        Constructor for the HintEngine class. The session is copied, so
+        the analysis does not touch the round being played.
+
+        Parameters:
+            session (GameSession) - session in which the user plays
+            plr_index (int) - index of the user's player
+            cards (list) - cards the user can play
+            seed - seed of the random samples
+        """
+        self.cards = list(cards)
+        self.samples = 0
+        self.__session = snapshot(session)
+        self.__plr_index = plr_index
+        self.__rng = random.Random(seed)
+        self.__ranking = []
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start the analysis in the background"""
+        self.__thread.start()
+        return self
+
+    def cancel(self):
+        """Stop the analysis after the sample being played"""
+        self.__stop.set()
+
+    def ranking(self):
+        """
+        Return the latest ranking
+
+        Returns:
+            ranking (list) - (card, win probability) pairs from the best
+                             card, empty before the first batch
+        """
+        with self.__lock:
+            return list(self.__ranking)
+
+    def _run(self):
+        """Sample the round and publish the ranking until cancelled"""
+        session = self.__session
+        round_ = session.rounds[-1]
+        rng = self.__rng
+        team = self.__plr_index % GameSession.no_teams
+        belief = BeliefTracker(session, self.__plr_index)
+        belief.update(round_)
+        state = SearchState.from_round(round_, [0] * session.no_players,
+                                       round_.trump)
+        moves = [card_id(card) for card in self.cards]
+        wins = [0.0] * len(moves)
+        samples = 0
+        while not self.__stop.is_set():
+            for _ in range(self.batch):
+                hands = belief.sample(rng)
+                trump = belief.sample_trump(rng)
+                for i, move in enumerate(moves):
+                    state.hands = list(hands)
+                    state.trump = trump
+                    state.play(move)
+                    # Finish the round with random cards
+                    while state.outcome is None:
+                        legal, _ = state.legal_moves()
+                        state.play(rng.choice(list(iter_ids(legal))))
+                    winner = state.winning_team()
+                    if winner is None:
+                        wins[i] += 0.5
+                    elif winner == team:
+                        wins[i] += 1
+                    state.undo_all()
+                samples += 1
+                if self.__stop.is_set():
+                    return
+            ranking = sorted(((card, win / samples)
+                              for card, win in zip(self.cards, wins)),
+                             key=lambda item: item[1], reverse=True)
+            with self.__lock:
+                self.__ranking = ranking
+                self.samples = samples
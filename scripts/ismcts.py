@@ -0,0 +1,156 @@
+import math
+import random
+import time
+from game import GameSession, Player
+from belief import BeliefTracker
+from bitboard import (SUIT_MASKS, card_from_id, cards_to_mask, iter_ids,
+                      legal_moves, popcount)
+from searchstate import SearchState
+
+
+class _Node:
+    """Node of the search tree reached by playing a card"""
+    __slots__ = ("move", "team", "parent", "children", "tried",
+                 "visits", "wins", "avail")
+
+    def __init__(self, move=None, team=None, parent=None):
+        self.move = move            # card id played to reach the node
+        self.team = team            # team of the player of the card
+        self.parent = parent
+        self.children = {}
+        self.tried = 0              # mask of the moves in children
+        self.visits = 0
+        self.wins = 0.0
+        self.avail = 0
+
+
+class ISMCTSPlayer(Player):
+    """
+    This class creates a bot which selects the card to play with single
+    observer information set Monte Carlo tree search. Every iteration
+    samples the hidden hands (and the trump if it is unknown) consistent
+    with the play history and runs on a SearchState with play/undo.
+    The hidden hands are drawn by a BeliefTracker following the round.
+
+    Attributes:
+        iterations (int) - maximum search iterations per move
+        time_limit (float) - wall-clock budget per move in seconds,
+                             None to use only the iteration budget
+        exploration (float) - exploration constant of the UCB formula
+    """
+    iterations = 2000
+    time_limit = 0.05
+    exploration = 0.7
+
+    def __init__(self, ID, index, team, session):
+        super().__init__(ID, index, team, session)
+        # Seeded from a child of the session's generator, so the search
+        # is reproduced from the session seed without shifting its deals
+        child = session.rng.spawn(1)[0]
+        self.rng = random.Random(int(child.integers(2**63)))
+        self.belief = None
+        self._belief_round = None
+
+    def get_play_card(self, round_):
+        """
+        Select the card to play for the current round
+        """
+        suits = self.session.suits
+        hand = cards_to_mask(self.cards)
+        suit_in_play = (None if round_.suit_in_play is None
+                        else suits[round_.suit_in_play])
+        # Player who does not have the suit in play asks for the trump
+        if (suit_in_play is not None and
+                not hand & SUIT_MASKS[suit_in_play]):
+            round_.ask_trump(self.index)
+        trump_known = self.stake_player or round_.trump_open
+        trump = suits[round_.trump] if trump_known else None
+        moves, _ = legal_moves(hand, suit_in_play, trump,
+                               round_.trump_open, self.stake_player)
+        if popcount(moves) == 1:
+            move = moves.bit_length() - 1
+        else:
+            move = self.search(round_, hand, moves)
+        card = card_from_id(move)
+        self.cards.remove(card)
+        round_.set_play_card(self.index, card)
+
+    def search(self, round_, hand, moves):
+        """
+        Run the search from the current state of the round
+
+        Parameters:
+            round_ (Round) - round in which the player has to play
+            hand (int) - bitmask of the player's cards
+            moves (int) - bitmask of the cards the player can play
+
+        Returns:
+            move (int) - card id of the selected card
+        """
+        if self._belief_round is not round_:
+            self.belief = BeliefTracker(self.session, self.index)
+            self._belief_round = round_
+        belief = self.belief
+        belief.update(round_)
+        state = SearchState.from_round(round_, [0] * self.session.no_players,
+                                       round_.trump)
+        root = _Node()
+        if self.time_limit is not None:
+            deadline = time.perf_counter() + self.time_limit
+        for _ in range(self.iterations):
+            if (self.time_limit is not None and
+                    time.perf_counter() > deadline):
+                break
+            state.hands = belief.sample(self.rng)
+            state.trump = belief.sample_trump(self.rng)
+            self._iterate(root, state)
+        best = max((root.children[move] for move in iter_ids(moves)
+                    if move in root.children),
+                   key=lambda node: node.visits, default=None)
+        if best is None:
+            return moves.bit_length() - 1
+        return best.move
+
+    def _iterate(self, root, state):
+        """Run one selection, expansion, rollout and update step"""
+        rng = self.rng
+        node = root
+        no_teams = GameSession.no_teams
+        # Selection and expansion
+        while state.outcome is None:
+            moves, _ = state.legal_moves()
+            untried = moves & ~node.tried
+            for move in iter_ids(moves & node.tried):
+                node.children[move].avail += 1
+            if untried:
+                move = rng.choice(list(iter_ids(untried)))
+                child = _Node(move, state.next_player % no_teams, node)
+                child.avail = 1
+                node.children[move] = child
+                node.tried |= 1 << move
+                state.play(move)
+                node = child
+                break
+            best, best_val = None, -1.0
+            for move in iter_ids(moves):
+                child = node.children[move]
+                val = (child.wins / child.visits + self.exploration *
+                       math.sqrt(math.log(child.avail) / child.visits))
+                if val > best_val:
+                    best, best_val = child, val
+            state.play(best.move)
+            node = best
+        # Play random cards until the end of the round
+        while state.outcome is None:
+            moves, _ = state.legal_moves()
+            state.play(rng.choice(list(iter_ids(moves))))
+        winner = state.winning_team()
+        # Update the statistics of the nodes in the path
+        while node is not root:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.team:
+                node.wins += 1
+            node = node.parent
+        state.undo_all()
@@ -13,8 +13,10 @@ class SelectDialog():
         result (empty list) - output is returned through this list
         op_type (str) - should be either 'radiobutton' or 'checkbox'
         root (tk.tk()) - tk() object which would be set as master
+        callback (function) - called once the popup is closed
     """
-    def __init__(self, text, options, result, op_type, root=None):
+    def __init__(self, text, options, result, op_type, root=None,
+                 callback=None):
 
         assert len(options) != 0, "Empty choice list!"
         assert (
@@ -22,6 +24,7 @@ class SelectDialog():
                 op_type == 'radiobutton'), "Invalid choice type!"
 
         self.root = root
+        self.callback = callback
         self.top = tk.Toplevel(self.root)
         choices = []
         # Create frame for message
@@ -57,27 +60,35 @@ class SelectDialog():
         # Put window on top
         self.top.transient(self.root)
         self.top.grab_set()
+        self.top.protocol("WM_DELETE_WINDOW", self._close)
 
     def _cb_submit(self, result):
         """Call back for Ok button for checkbox input"""
         for var in self.check_var:
             result.append(var.get() == 1)
-        self.top.destroy()
+        self._close()
 
     def _rb_submit(self, result):
         """Call back for Ok button for radiobutton input"""
         result.append(self.var.get())
+        self._close()
+
+    def _close(self):
+        """Close the popup and let the caller read the result"""
         self.top.destroy()
+        if self.callback is not None:
+            self.callback()
 
 
 class GetNumInput():
     """
         Creates a temporary popup box to request the user
-        to input a number
+        to input a number, callback is called once it is closed
     """
-    def __init__(self, text, range_, result, root):
+    def __init__(self, text, range_, result, root, callback=None):
         assert len(range_) != 0, "Empty choice list!"
         self.root = root
+        self.callback = callback
         self.top = tk.Toplevel(self.root)
         # Create frame for message
         msg_frame = tk.Frame(self.top, borderwidth=5, relief='ridge')
@@ -99,6 +110,7 @@ class GetNumInput():
         # Put window on top
         self.top.transient(self.root)
         self.top.grab_set()
+        self.top.protocol("WM_DELETE_WINDOW", self._close)
 
     def _choice_submit(self, result):
         """Call back for Ok button"""
@@ -106,4 +118,10 @@ class GetNumInput():
             result.append(int(self.usr_input.get()))
         except ValueError:
             result.append(self.usr_input.get())
+        self._close()
+
+    def _close(self):
+        """Close the popup and let the caller read the result"""
         self.top.destroy()
+        if self.callback is not None:
+            self.callback()
@@ -0,0 +1,499 @@
+import argparse
+import time
+import numpy as np
+from game import GameSession, generate_deals, jack_constraints
+from batchengine import (BatchRounds, ONGOING, OUTCOME_NAMES, NO_KEYS,
+                         NO_SUITS)
+from bitboard import card_id, cards_to_mask, iter_ids, legal_moves
+
+# Layout of the action space
+NO_CARDS = GameSession.total_cards
+PASS_ACTION = NO_CARDS
+BID_ACTION = PASS_ACTION + 1
+FIRST_BID = min(GameSession.base_bet[p]
+                for p in GameSession.allowed_players) + 1
+BID_VALUES = np.arange(FIRST_BID, GameSession.total_points + 1)
+OPEN_GOAT_ACTION = BID_ACTION + len(BID_VALUES)
+TRUMP_ACTION = OPEN_GOAT_ACTION + 1
+GOAT_ACTION = TRUMP_ACTION + NO_SUITS
+NO_GOAT_ACTION = GOAT_ACTION + 1
+NUM_ACTIONS = NO_GOAT_ACTION + 1
+# Phases of a round
+BID = 0
+TRUMP = 1
+GOAT = 2
+PLAY = 3
+NO_PHASES = 4
+
+
+def obs_slices(no_players):
+    """
+    Return the layout of an observation
+
+    Returns:
+        slices (dict) - maps each part of an observation to its slice
+        size (int) - size of an observation
+    """
+    sizes = (("hand", NO_CARDS), ("out", NO_CARDS),
+             ("trick", no_players * NO_CARDS), ("trump", NO_SUITS),
+             ("trump_open", 1), ("lead", NO_SUITS),
+             ("phase", NO_PHASES), ("wager", 1),
+             ("wager_plr", no_players), ("open_goat", 1), ("goat", 1),
+             ("team_pts", 2), ("team_trumps", 2), ("score", 2),
+             ("jackies", 2))
+    slices = {}
+    start = 0
+    for name, size in sizes:
+        slices[name] = slice(start, start + size)
+        start += size
+    return slices, start
+
+
+def bid_action(wager):
+    """Return the action of a wager called in the wager round"""
+    if wager == "Open Goat":
+        return OPEN_GOAT_ACTION
+    return BID_ACTION + wager - FIRST_BID
+
+
+def encode_round(round_, plr, phase, obs, mask):
+    """
+    Write the observation and legal actions of a player in a Round with
+    the layout of VecJackieEnv, e.g. to record the decisions of bots
+
+    Parameters:
+        round_ (Round) - round in which the player has to act
+        plr (int) - index of the player to act
+        phase (int) - BID, TRUMP, GOAT or PLAY
+        obs (ndarray) - observation buffer to fill
+        mask (ndarray) - action mask buffer to fill
+    """
+    session = round_.session
+    suits = session.suits
+    no_players = session.no_players
+    team = plr % GameSession.no_teams
+    other = 1 - team
+    sl, _ = obs_slices(no_players)
+    obs[:] = 0
+    mask[:] = False
+    hand = cards_to_mask(session.players[plr].cards)
+    for card in iter_ids(hand):
+        obs[sl["hand"].start + card] = 1
+    trick = sl["trick"].start
+    for pass_ in round_.play_history:
+        for seat, card in pass_:
+            obs[sl["out"].start + card_id(card)] = 1
+    for seat, card in round_.play_history[-1]:
+        obs[trick + (seat - plr) % no_players * NO_CARDS + card_id(card)] = 1
+    trump = None if round_.trump is None else suits[round_.trump]
+    if (phase not in (BID, TRUMP) and
+            (round_.trump_open or plr == round_.wager_player)):
+        obs[sl["trump"].start + trump] = 1
+    obs[sl["trump_open"].start] = round_.trump_open
+    lead = None
+    if round_.suit_in_play is not None and round_.play_history[-1]:
+        lead = suits[round_.suit_in_play]
+        obs[sl["lead"].start + lead] = 1
+    obs[sl["phase"].start + phase] = 1
+    obs[sl["wager"].start] = round_.wager / GameSession.total_points
+    obs[sl["wager_plr"].start +
+        (round_.wager_player - plr) % no_players] = 1
+    obs[sl["open_goat"].start] = round_.open_goat
+    obs[sl["goat"].start] = round_.goat
+    total = GameSession.total_points
+    obs[sl["team_pts"]] = (round_.team_pts[team] / total,
+                           round_.team_pts[other] / total)
+    obs[sl["team_trumps"]] = (round_.team_trumps[team] / NO_KEYS,
+                              round_.team_trumps[other] / NO_KEYS)
+    behind, pts = session.score[0]
+    if behind is not None:
+        obs[sl["score"]] = (pts, -pts) if behind == team else (-pts, pts)
+    jackies = session.score[1]
+    obs[sl["jackies"]] = (jackies[team], jackies[other])
+    # Legal actions of the player
+    if phase == BID:
+        mask[PASS_ACTION] = True
+        mask[BID_ACTION:OPEN_GOAT_ACTION] = BID_VALUES > round_.wager
+        mask[OPEN_GOAT_ACTION] = True
+    elif phase == TRUMP:
+        mask[TRUMP_ACTION:GOAT_ACTION] = True
+    elif phase == GOAT:
+        mask[GOAT_ACTION:NUM_ACTIONS] = True
+    else:
+        moves, _ = legal_moves(hand, lead, trump, round_.trump_open,
+                               plr == round_.wager_player)
+        for card in iter_ids(moves):
+            mask[card] = True
+
+
+class VecJackieEnv:
+    """
+    This class runs many tables of the game at once as a reinforcement
+    learning environment. Every table is a GameSession played round after
+    round; the card play of all the tables is done by a BatchRounds
+    engine. At each step every table has one player to act, who gets an
+    action from the action space:
+
+        0-23  play the card id
+        24    pass in the wager round
+        25-37 bid 16 to 28
+        38    bid an open goat
+        39-42 choose the trump suit index
+        43    go for goat, 44 do not go for goat
+
+    The goat decision is offered to a player of the wager team before
+    leading a pass while the other team has no points. Observations and
+    action masks are written into preallocated buffers from the view of
+    the player to act. A finished round is scored with update_score of
+    its session and the next round of the table is dealt right away.
+
+    Attributes:
+        no_players (int) - number of players at every table
+        num_envs (int) - number of tables
+        obs (ndarray) - (tables, obs_size) observation of each table
+        action_mask (ndarray) - (tables, actions) legal actions
+        to_play (ndarray) - index of the player to act at each table
+        rewards (ndarray) - (tables, teams) round points of the last step
+        dones (ndarray) - tables whose round ended in the last step
+        sessions (list) - game session of each table
+    """
+    def __init__(self, no_players=4, num_envs=64, seed=None):
+        """
+        Constructor for the VecJackieEnv class
+
+        Parameters:
+            no_players (int) - number of players at every table
+            num_envs (int) - number of tables played at once
+            seed - seed or numpy.random.Generator of the deals
+        """
+        assert no_players in GameSession.allowed_players, \
+            "Invalid number of players"
+        self.no_players = no_players
+        self.num_envs = num_envs
+        self.rng = np.random.default_rng(seed)
+        # All the sessions share the generator of the environment
+        self.sessions = [GameSession(no_players, seed=self.rng)
+                         for _ in range(num_envs)]
+        self.engine = BatchRounds(no_players, num_envs)
+        self.base_bet = GameSession.base_bet[no_players]
+        self._rows = np.arange(num_envs)
+        self.phase = np.zeros(num_envs, np.int8)
+        self.bid_turn = np.zeros(num_envs, np.int8)
+        self.to_play = np.zeros(num_envs, np.int8)
+        self.goat_asked = np.zeros(num_envs, bool)
+        # Game score of each team, negative when behind, and jackies
+        self.score = np.zeros((num_envs, GameSession.no_teams), np.float32)
+        self.jackies = np.zeros((num_envs, GameSession.no_teams), np.float32)
+        self._slices, self.obs_size = obs_slices(no_players)
+        self.obs = np.zeros((num_envs, self.obs_size), np.float32)
+        self._trick_obs = self.obs[:, self._slices["trick"]].reshape(
+                                            num_envs, no_players, NO_CARDS)
+        self.action_mask = np.zeros((num_envs, NUM_ACTIONS), bool)
+        self.rewards = np.zeros((num_envs, GameSession.no_teams), np.float32)
+        self.dones = np.zeros(num_envs, bool)
+        self.info = {"action_mask": self.action_mask,
+                     "to_play": self.to_play}
+        # Buffers of _write_obs, every part of an observation is written
+        # in place from gathers over flat views of the engine arrays
+        no_teams = GameSession.no_teams
+        engine = self.engine
+        self._flat_hands = engine.hands.reshape(-1, NO_CARDS)
+        self._flat_trick = engine.trick_cards.reshape(-1)
+        self._flat_pts = engine.team_pts.reshape(-1)
+        self._flat_trumps = engine.team_trumps.reshape(-1)
+        self._flat_score = self.score.reshape(-1)
+        self._flat_jackies = self.jackies.reshape(-1)
+        self._seats = np.arange(no_players)
+        self._suits = np.arange(NO_SUITS)
+        self._phases = np.arange(NO_PHASES)
+        self._card_ids = np.arange(NO_CARDS)
+        self._plr_base = self._rows * no_players
+        self._team_base = (self._rows[:, None] * no_teams +
+                           np.arange(no_teams))
+        self._team_sign = np.array([1, -1])
+        self._plr_idx = np.empty(num_envs, np.intp)
+        self._seat_idx = np.empty((num_envs, no_players), np.intp)
+        self._team = np.empty(num_envs, engine.plr_team.dtype)
+        self._team_idx = np.empty((num_envs, no_teams), np.intp)
+        self._hand = np.empty((num_envs, NO_CARDS), bool)
+        self._out = np.empty((num_envs, NO_CARDS), bool)
+        self._seat_cards = np.empty((num_envs, no_players), np.int8)
+        self._trump = np.empty(num_envs, np.int8)
+        self._known = np.empty(num_envs, bool)
+        self._shown = np.empty(num_envs, bool)
+        self._phase_hot = np.empty((num_envs, NO_PHASES), bool)
+        self._team_int = np.empty((num_envs, no_teams), np.int16)
+        self._team_float = np.empty((num_envs, no_teams), np.float32)
+
+    def reset(self):
+        """
+        Deal a new round at every table
+
+        Returns:
+            obs (ndarray) - observation of each table
+            info (dict) - action mask and player to act of each table
+        """
+        self._deal(np.ones(self.num_envs, bool))
+        self.rewards[:] = 0
+        self.dones[:] = False
+        self._write_obs()
+        return self.obs, self.info
+
+    def step(self, actions):
+        """
+        Apply one action at every table
+
+        Parameters:
+            actions (ndarray) - action of the player to act at each table
+
+        Returns:
+            obs (ndarray) - observation of each table
+            rewards (ndarray) - (tables, teams) points won by each team
+                                in the rounds which ended
+            dones (ndarray) - tables whose round ended, the table is
+                              already dealt the next round
+            info (dict) - action mask and player to act of each table
+        """
+        actions = np.asarray(actions)
+        assert self.action_mask[self._rows, actions].all(), "Illegal action"
+        self.rewards[:] = 0
+        self.dones[:] = False
+        phase = self.phase.copy()
+        self._step_bid(actions, phase == BID)
+        self._step_trump(actions, phase == TRUMP)
+        self._step_goat(actions, phase == GOAT)
+        self._step_play(actions, phase == PLAY)
+        self._write_obs()
+        return self.obs, self.rewards, self.dones, self.info
+
+    def _deal(self, rows):
+        """Deal the next round of the tables in the mask"""
+        idx = np.flatnonzero(rows)
+        cards_per_plr = NO_CARDS // self.no_players
+        deals = np.empty((len(idx), self.no_players, cards_per_plr), np.int8)
+        starts = np.empty(len(idx), np.int8)
+        # Tables with the same jacks to give out are dealt in one batch
+        groups = {}
+        for i, table in enumerate(idx):
+            session = self.sessions[table]
+            if session.start_player is None:
+                session.select_start_player()
+            starts[i] = session.start_player
+            constraints = jack_constraints(session)
+            key = tuple((plr, tuple(cards))
+                        for plr, cards in constraints.items())
+            groups.setdefault(key, []).append(i)
+        for key, group in groups.items():
+            deals[group] = generate_deals(self.no_players, len(group),
+                                          self.rng, dict(key))
+        self.engine.reset(deals, 0, starts, self.base_bet, starts,
+                          rows=rows)
+        self.phase[idx] = BID
+        self.bid_turn[idx] = 0
+        self.to_play[idx] = starts
+        self.goat_asked[idx] = False
+
+    def _step_bid(self, actions, rows):
+        """Record the bids and move to the trump choice after the last"""
+        engine = self.engine
+        idx = np.flatnonzero(rows)
+        act = actions[idx]
+        raised = idx[act >= BID_ACTION]
+        act = actions[raised]
+        open_goat = act == OPEN_GOAT_ACTION
+        engine.wager[raised] = np.where(
+                    open_goat, GameSession.total_points,
+                    BID_VALUES[np.minimum(act - BID_ACTION,
+                                          len(BID_VALUES) - 1)])
+        engine.wager_player[raised] = self.to_play[raised]
+        engine.open_goat[raised] = open_goat
+        self.bid_turn[idx] += 1
+        over = (self.bid_turn[idx] == self.no_players) | engine.open_goat[idx]
+        self.phase[idx[over]] = TRUMP
+        self.to_play[idx] = np.where(
+                    over, engine.wager_player[idx],
+                    (engine.start_player[idx] + self.bid_turn[idx]) %
+                    self.no_players)
+
+    def _step_trump(self, actions, rows):
+        """Set the trump and start the card play"""
+        engine = self.engine
+        idx = np.flatnonzero(rows)
+        engine.trump[idx] = actions[idx] - TRUMP_ACTION
+        engine.wager_team[idx] = engine.plr_team[engine.wager_player[idx]]
+        # The wager player starts an open goat round
+        goat_idx = idx[engine.open_goat[idx]]
+        engine.start_player[goat_idx] = engine.wager_player[goat_idx]
+        engine.next_player[goat_idx] = engine.wager_player[goat_idx]
+        self._next_turn(rows)
+
+    def _step_goat(self, actions, rows):
+        """Record the goat decision, the player then plays a card"""
+        idx = np.flatnonzero(rows)
+        self.engine.goat[idx] |= actions[idx] == GOAT_ACTION
+        self.goat_asked[idx] = True
+        self._next_turn(rows)
+
+    def _step_play(self, actions, rows):
+        """Play the cards, resolve the completed passes and score"""
+        engine = self.engine
+        engine.play(actions, rows=rows)
+        self.goat_asked[rows] = False
+        complete = rows & (engine.trick_len == self.no_players)
+        engine.resolve_pass(complete)
+        ended = complete & (engine.outcome != ONGOING)
+        if ended.any():
+            self._score(ended)
+            self._deal(ended)
+        self._next_turn(rows & ~ended)
+
+    def _score(self, rows):
+        """Update the score of the sessions whose round ended"""
+        engine = self.engine
+        no_teams = GameSession.no_teams
+        for table in np.flatnonzero(rows):
+            session = self.sessions[table]
+            team = int(engine.wager_team[table])
+            wager = int(engine.wager[table])
+            outcome = OUTCOME_NAMES[int(engine.outcome[table])]
+            goat = bool(engine.goat[table])
+            open_goat = bool(engine.open_goat[table])
+            session.update_score(team, wager, outcome, goat, open_goat)
+            # The reward is the points update_score adds to the game
+            # score, an invalid round also scores for the wager team
+            pts = session.round_points(wager, outcome, goat, open_goat)
+            self.rewards[table, team] = pts
+            self.rewards[table, (team + 1) % no_teams] = -pts
+            self.score[table] = 0
+            if session.score[0][0] is not None:
+                behind, pts = session.score[0]
+                self.score[table, behind] = pts
+                self.score[table, (behind + 1) % no_teams] = -pts
+            self.jackies[table] = session.score[1]
+        self.dones |= rows
+
+    def _next_turn(self, rows):
+        """Find the player to act and offer the goat before a lead"""
+        engine = self.engine
+        idx = np.flatnonzero(rows)
+        plrs = engine.next_player[idx]
+        team = engine.plr_team[plrs]
+        other_pts = engine.team_pts[idx, 1 - team]
+        offer = ((engine.trick_len[idx] == 0) &
+                 (team == engine.wager_team[idx]) & (other_pts == 0) &
+                 ~engine.open_goat[idx] & ~engine.goat[idx] &
+                 ~self.goat_asked[idx])
+        self.phase[idx] = np.where(offer, GOAT, PLAY)
+        self.to_play[idx] = plrs
+
+    def _write_obs(self):
+        """Write the observations and action masks of all the tables"""
+        engine = self.engine
+        obs = self.obs
+        sl = self._slices
+        plr = self.to_play
+        no_players = self.no_players
+        # Indices are always in range, with mode "clip" take writes
+        # straight into its out buffer
+        plr_idx = self._plr_idx
+        np.add(self._plr_base, plr, out=plr_idx)
+        np.take(self._flat_hands, plr_idx, axis=0, out=self._hand,
+                mode="clip")
+        np.copyto(obs[:, sl["hand"]], self._hand)
+        np.any(engine.hands, axis=1, out=self._out)
+        np.logical_not(self._out, out=obs[:, sl["out"]])
+        # Cards of the current pass by seat relative to the player, the
+        # seats after the leader hold the next positions of the pass
+        seat_idx = self._seat_idx
+        np.subtract(plr, engine.trick_plrs[:, 0], out=plr_idx)
+        np.add(plr_idx[:, None], self._seats, out=seat_idx)
+        np.remainder(seat_idx, no_players, out=seat_idx)
+        np.add(seat_idx, self._plr_base[:, None], out=seat_idx)
+        np.take(self._flat_trick, seat_idx, out=self._seat_cards,
+                mode="clip")
+        np.equal(self._seat_cards[:, :, None], self._card_ids,
+                 out=self._trick_obs)
+        hot = self._phase_hot
+        np.equal(self._phases, self.phase[:, None], out=hot)
+        np.copyto(obs[:, sl["phase"]], hot)
+        # The trump is known to the wager player and once it is revealed
+        known = self._known
+        shown = self._shown
+        np.equal(plr, engine.wager_player, out=known)
+        np.logical_or(known, engine.trump_open, out=known)
+        np.logical_or(hot[:, BID], hot[:, TRUMP], out=shown)
+        np.logical_not(shown, out=shown)
+        np.logical_and(known, shown, out=known)
+        np.copyto(self._trump, -1)
+        np.copyto(self._trump, engine.trump, where=known)
+        np.equal(self._suits, self._trump[:, None], out=obs[:, sl["trump"]])
+        np.copyto(obs[:, sl["trump_open"].start], engine.trump_open)
+        np.equal(self._suits, engine.suit_in_play[:, None],
+                 out=obs[:, sl["lead"]])
+        np.divide(engine.wager, GameSession.total_points,
+                  out=obs[:, sl["wager"].start])
+        np.subtract(engine.wager_player, plr, out=plr_idx)
+        np.remainder(plr_idx, no_players, out=plr_idx)
+        np.equal(self._seats, plr_idx[:, None], out=obs[:, sl["wager_plr"]])
+        np.copyto(obs[:, sl["open_goat"].start], engine.open_goat)
+        np.copyto(obs[:, sl["goat"].start], engine.goat)
+        # Team values with the team of the player first
+        team_idx = self._team_idx
+        np.take(engine.plr_team, plr, out=self._team, mode="clip")
+        np.multiply(self._team[:, None], self._team_sign, out=team_idx)
+        np.add(team_idx, self._team_base, out=team_idx)
+        team_int = self._team_int
+        np.take(self._flat_pts, team_idx, out=team_int, mode="clip")
+        np.divide(team_int, GameSession.total_points,
+                  out=obs[:, sl["team_pts"]])
+        np.take(self._flat_trumps, team_idx, out=team_int, mode="clip")
+        np.divide(team_int, NO_KEYS, out=obs[:, sl["team_trumps"]])
+        team_float = self._team_float
+        np.take(self._flat_score, team_idx, out=team_float, mode="clip")
+        np.copyto(obs[:, sl["score"]], team_float)
+        np.take(self._flat_jackies, team_idx, out=team_float, mode="clip")
+        np.copyto(obs[:, sl["jackies"]], team_float)
+        # Legal actions of the player to act
+        mask = self.action_mask
+        bids = mask[:, BID_ACTION:OPEN_GOAT_ACTION]
+        np.copyto(mask[:, PASS_ACTION], hot[:, BID])
+        np.greater(BID_VALUES, engine.wager[:, None], out=bids)
+        np.logical_and(bids, hot[:, BID, None], out=bids)
+        np.copyto(mask[:, OPEN_GOAT_ACTION], hot[:, BID])
+        np.copyto(mask[:, TRUMP_ACTION:GOAT_ACTION], hot[:, TRUMP, None])
+        np.copyto(mask[:, GOAT_ACTION:NUM_ACTIONS], hot[:, GOAT, None])
+        np.logical_and(engine.legal_moves()[0], hot[:, PLAY, None],
+                       out=mask[:, :NO_CARDS])
+
+
+def random_actions(action_mask, rng):
+    """Return a random legal action for every table"""
+    return (rng.random(action_mask.shape) * action_mask).argmax(axis=1)
+
+
+def benchmark(no_players=4, num_envs=1024, no_steps=1000, seed=None):
+    """
+    Measure the number of table steps per second with random actions
+
+    Returns:
+        rate (float) - steps played per second over all the tables
+    """
+    env = VecJackieEnv(no_players, num_envs, seed)
+    rng = np.random.default_rng(seed)
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(no_steps):
+        env.step(random_actions(env.action_mask, rng))
+    return no_steps * num_envs / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    description="Step random actions in the vectorized env")
+    parser.add_argument("-p", "--players", type=int, default=4,
+                        choices=GameSession.allowed_players)
+    parser.add_argument("-k", "--envs", type=int, default=1024)
+    parser.add_argument("-n", "--steps", type=int, default=1000)
+    args = parser.parse_args()
+    rate = benchmark(args.players, args.envs, args.steps)
+    print("{:.0f} steps/s with {} players".format(rate, args.players))
@@ -2,159 +2,289 @@ import vision
 from tkinter import messagebox as msg
 from popups import GetNumInput, SelectDialog
 from game import deal_cards_after_jack
+from botservice import apply_decision
+from events import Bid, CardPlayed, TrumpOpened, Goat, PassResolved
 
 
 class ManageRound():
     """
     This class manages each game round by interacting with the
-    game session and the front end app
+    game session and the front end app. The GUI is updated from the
+    events of the round instead of being called by the engine.
+    The round is played as a sequence of steps scheduled with
+    root.after, so the Tk main loop keeps running between the steps.
+    A step waiting for the user opens a dialog or enables the cards and
+    returns, the answer of the user schedules the next step.
+    The waits between the steps are scaled by the playback speed of the
+    GUI and a paused round keeps its next step until it is resumed.
 
     Attributes:
         gui - GameFUI instance to call necessary methods
         game_sess - GameSession instance to manage the game
     """
+    # Waits in ms after the steps of the round at normal speed
+    deal_wait = 250
+    card_wait = 1500
+    pass_wait = 1000
 
     def __init__(self, gui, game_sess):
         self.__gui = gui
         self.__game_sess = game_sess
         self.plr_count = self.__gui.plr_count
         self.goat_on = False
+        self.__handlers = {Bid: self._on_bid,
+                           CardPlayed: self._on_card_played,
+                           TrumpOpened: self._on_trump_opened,
+                           Goat: self._on_goat,
+                           PassResolved: self._on_pass_resolved}
+        self.__subscription = None
+        self.__step = None      # Next step of the round
+        self.__delay = 0        # Wait before the next step
+        self.__job = None       # after() id of the scheduled step
+        self.__dialog = None    # Dialog waiting for the user
+        self.__deal_order = []
+        self.__bid_order = []
+
+    def _on_event(self, event):
+        """Update the GUI with an event of the round"""
+        self.__handlers[type(event)](event)
+
+    def _on_bid(self, event):
+        """Show the wager set by a player"""
+        self.__gui.update_wager(self.__round)
+
+    def _on_card_played(self, event):
+        """Show the card played by a bot"""
+        if not self.__game_sess.players[event.player].user_control:
+            self.__gui.update_bot_play((event.player, event.card))
+
+    def _on_trump_opened(self, event):
+        """Show the trump when it is opened by a bot"""
+        if not self.__game_sess.players[event.player].user_control:
+            self.__gui.update_trump(event.trump)
+
+    def _on_goat(self, event):
+        """Show the goat called by a bot"""
+        player = self.__game_sess.players[event.player]
+        if not player.user_control and not self.__round.open_goat:
+            self.__gui.go_for_goat(None, True)
+        self.goat_on = True
+
+    def _on_pass_resolved(self, event):
+        """Clear the pass from the screen once it is resolved"""
+        self.__gui.post_pass_update(self.__round)
+
+    def _schedule(self, step, delay=0):
+        """Run the next step of the round after a wait"""
+        self.__step = step
+        self.__delay = delay
+        speed = self.__gui.playback_speed()
+        if not speed:
+            self.__job = None       # Paused until set_speed
+            return
+        self.__job = self.__gui.root.after(int(delay / speed), self._run_step)
+
+    def _run_step(self):
+        """Run the scheduled step of the round"""
+        step = self.__step
+        self.__job = self.__step = None
+        step()
+
+    def set_speed(self):
+        """Schedule the next step again with a new playback speed"""
+        if self.__job is not None:
+            self.__gui.root.after_cancel(self.__job)
+            self.__job = None
+        if self.__step is not None:
+            self._schedule(self.__step, self.__delay)
+
+    def cancel(self):
+        """Stop the round, e.g. when the application is closed"""
+        self.__gui.bots.cancel()
+        if self.__job is not None:
+            self.__gui.root.after_cancel(self.__job)
+        self.__job = self.__step = None
+        if self.__dialog is not None:
+            # Destroyed without calling back into the round
+            self.__dialog.top.destroy()
+            self.__dialog = None
+        if self.__subscription is not None:
+            self.__game_sess.events.unsubscribe(self.__subscription)
+            self.__subscription = None
 
     def start_round(self):
         """Start a round of play"""
-        self._get_start_player()
-        self.__game_sess.start_round()
-        self.__round = self.__game_sess.rounds[-1]
-        self.__gui.update_round_no(self.__game_sess.no_rounds)
-        deal_cards_after_jack(self.__game_sess)
-        self.__gui.display_cards()
-        self._run_wager_round()
-        self._start_play()
+        self._schedule(self._start_player_step)
 
-    def _get_start_player(self):
+    def _start_player_step(self):
         """
         If start player is not set get the input from the user
         """
-        while (self.__game_sess.get_start_player() is None):
-            result = []
-            players = [self.__game_sess.players[i].ID
-                       for i in self.__game_sess.start_plr_list]
-            popup = SelectDialog(
-                            "Select which player to deal cards first to",
-                            players, result, 'radiobutton')
-            self.__gui.root.wait_window(popup.top)
-            if (len(result) == 0):
-                msg.showerror(
-                              "No Selection made!",
-                              "You did not select a start player")
-                continue
+        if self.__game_sess.get_start_player() is not None:
+            self._deal_round()
+            return
+        result = []
+        players = [self.__game_sess.players[i].ID
+                   for i in self.__game_sess.start_plr_list]
+        self.__dialog = SelectDialog(
+                        "Select which player to deal cards first to",
+                        players, result, 'radiobutton', self.__gui.root,
+                        lambda: self._start_player_chosen(result))
+
+    def _start_player_chosen(self, result):
+        """Set the start player selected by the user"""
+        self.__dialog = None
+        # A dialog closed without a selection is shown again
+        if result:
             self.__game_sess.set_start_player(result[0])
+        self._schedule(self._start_player_step)
+
+    def _deal_round(self):
+        """Deal the cards of the round"""
+        self.__game_sess.start_round()
+        self.__round = self.__game_sess.rounds[-1]
+        self.__subscription = self.__game_sess.events.subscribe(
+                                        self._on_event, *self.__handlers)
+        self.__gui.update_round_no(self.__game_sess.no_rounds)
+        deal_cards_after_jack(self.__game_sess)
+        # Show the hands a half at a time from the start player
+        start = self.__game_sess.start_player
+        self.__deal_order = [(half, i % self.plr_count)
+                             for half in range(2)
+                             for i in range(start, start + self.plr_count)]
+        self.__gui.start_deal()
+        self._schedule(self._deal_step)
+
+    def _deal_step(self):
+        """Display the cards dealt to the next player"""
+        half, plr_index = self.__deal_order.pop(0)
+        self.__gui.display_cards(plr_index, half)
+        delay = self.deal_wait
+        if not self.__deal_order:
+            self._schedule(self._wager_step, 2 * delay)
+        elif self.__deal_order[0][0] != half:
+            self._schedule(self._deal_step, 2 * delay)
+        else:
+            self._schedule(self._deal_step, delay)
+
+    def _wager_step(self):
+        """Start the wager round from the start player"""
+        start_plr = self.__game_sess.start_player
+        self.__bid_order = [i % self.plr_count
+                            for i in range(start_plr,
+                                           start_plr + self.plr_count)]
+        # Show the base wager of the start player
+        self.__gui.update_wager(self.__round)
+        self._schedule(self._bid_step)
 
-    def _run_wager_round(self):
+    def _bid_step(self):
         """
-        Ask players if they want to set a wager
+        Ask the next player if they want to set a wager
         """
-        start_plr = self.__game_sess.start_player
-        for i in range(start_plr, start_plr + self.plr_count):
-            player = self.__game_sess.players[i % self.plr_count]
-            if not (player.user_control):
-                set_wager, value = player.get_wager(self.__round.wager_history)
-                if set_wager:
-                    self.__round.update_wager(player.ID, value)
-            else:
-                usr_inp = True
-                while (usr_inp):
-                    if player.ID == self.__game_sess.get_start_player():
-                        usr_inp = msg.askyesno(
-                                    "Call Wager", "Player "+player.ID + "\n" +
-                                    "Do you want to raise your base wager?")
-                    else:
-                        usr_inp = msg.askyesno(
-                                        "Call Wager", "Player " + player.ID +
-                                        "\nDo you want to set a wager?")
-                    if usr_inp:
-                        vals = [i for i in range(self.__round.wager+1, 29)]
-                        vals.append("Open Goat")
-                        result = []
-                        popup = GetNumInput(
-                                        "Select your wager from the list",
-                                        vals, result, self.__gui.root)
-                        self.__gui.root.wait_window(popup.top)
-                        if len(result) == 0:
-                            msg.showerror(
-                                            "Wager not set!",
-                                            "You did not submit a wager")
-                            continue
-                        self.__round.update_wager(player.ID, result[-1])
-                        break
-            # Update the wager set by the last player
-            self.__gui.update_wager(self.__round)
-            if self.__round.open_goat:
-                break
-        self.__game_sess.players[self.__round.wager_player].set_wager_player()
-        # Ask for the trump suit
+        if not self.__bid_order or self.__round.open_goat:
+            wager_plr = self.__game_sess.players[self.__round.wager_player]
+            wager_plr.set_wager_player()
+            self._schedule(self._trump_step)
+            return
+        player = self.__game_sess.players[self.__bid_order.pop(0)]
+        if not player.user_control:
+            set_wager, value = player.get_wager(self.__round.wager_history)
+            if set_wager:
+                self.__round.update_wager(player.ID, value)
+            self._schedule(self._bid_step)
+            return
+        if player.ID == self.__game_sess.get_start_player():
+            text = "Raise your base wager or pass"
+        else:
+            text = "Select your wager or pass"
+        vals = ["Pass"] + [i for i in range(self.__round.wager+1, 29)]
+        vals.append("Open Goat")
+        result = []
+        self.__dialog = GetNumInput(
+                        "Player " + player.ID + "\n" + text, vals, result,
+                        self.__gui.root,
+                        lambda: self._user_bid(player, result))
+
+    def _user_bid(self, player, result):
+        """Set the wager selected by the user"""
+        self.__dialog = None
+        if not result:
+            # The dialog was closed without an answer, ask again
+            self.__bid_order.insert(0, player.index)
+        elif result[-1] != "Pass":
+            self.__round.update_wager(player.ID, result[-1])
+        self._schedule(self._bid_step)
+
+    def _trump_step(self):
+        """Ask the wager player for the trump suit and start playing"""
         if self.__game_sess.players[self.__round.wager_player].user_control:
             result = []
-            while not result:
-                popup = SelectDialog("Select the trump suit",
-                                     self.__game_sess.suits_map,
-                                     result, 'radiobutton', self.__gui.root)
-                self.__gui.root.wait_window(popup.top)
-                if result:
-                    self.__round.trump = result[0]
+            self.__dialog = SelectDialog(
+                            "Select the trump suit",
+                            self.__game_sess.suits_map, result,
+                            'radiobutton', self.__gui.root,
+                            lambda: self._user_trump(result))
+            return
+        self.__round.trump = \
+            self.__game_sess.players[self.__round.start_player].get_trump()
+        self._schedule(self._turn_step)
+
+    def _user_trump(self, result):
+        """Set the trump suit selected by the user"""
+        self.__dialog = None
+        if not result:
+            # The dialog was closed without a selection, ask again
+            self._schedule(self._trump_step)
+            return
+        self.__round.trump = result[0]
+        self._schedule(self._turn_step)
+
+    def _turn_step(self):
+        """Let the next player of the pass play a card"""
+        plr_index = self.__round.next_player
+        plr = self.__game_sess.players[plr_index]
+        if not plr.user_control:
+            # Get card played by the bot without blocking the GUI
+            self.__gui.bots.request_card(self.__game_sess, plr_index,
+                                         self._bot_card)
+            return
+        elif self.__gui.game_mode == "Bot vs Users":
+            # Get card played by the user through camera
+            self.__round.set_play_card(plr_index, vision.get_card_input())
         else:
-            self.__round.trump = \
-                self.__game_sess.players[self.__round.start_player].get_trump()
+            # Wait for the user to click a card in the GUI
+            self.__gui.get_user_play_card(plr_index, self.__round, plr,
+                                          self._user_card)
+            return
+        self._card_done()
 
-    def _start_play(self):
-        """
-        Start playing the round until a win/loss
-        """
-        for pass_ in range(1, self.__round.no_passes+1):
-            # Start the turn with the current start player
-            for i in range(
-                           self.__round.start_player,
-                           self.__round.start_player + self.plr_count):
-                plr_index = i % self.plr_count
-                plr = self.__game_sess.players[plr_index]
-                if not plr.user_control:
-                    # Get card played by the bot
-                    plr.get_play_card(self.__round)
-                    # Update GUI if trump was opened by bot
-                    if (self.__round.trump_open and
-                            self.__round.trump_open_at == (pass_, plr_index)):
-                        self.__gui.update_trump(self.__round.trump)
-                    # Check if bot opted for goat
-                    if (not self.goat_on and self.__round.goat
-                            and not self.__round.open_goat):
-                        self.__gui.go_for_goat(None, True)
-                        self.goat_on = True
-                    # Show the card played by the bot in the GUI
-                    self.__gui.update_bot_play(
-                                self.__round.play_history[pass_-1][-1])
-                elif self.__gui.game_mode == "Bot vs Users":
-                    # Get card played by the user through camera
-                    self.__round.set_play_card(
-                                               plr_index,
-                                               vision.get_card_input())
-                else:
-                    # Get card played by the user through the GUI
-                    card = self.__gui.get_user_play_card(
-                                                         plr_index,
-                                                         self.__round, plr)
-                    self.__round.set_play_card(plr_index, card)
-                    # Check if bot opted for goat
-                    if (not self.goat_on and self.__round.goat):
-                        self.goat_on = True
-                # Add a wait after each player plays his card
-                self.__gui.add_wait_time(1500)
-            # Add a wait at the end of the round
-            self.__gui.add_wait_time(1000)
-            # Update the round for the cards played
-            round_status = self.__round.process_pass()
-            self.__gui.post_pass_update(self.__round)
-            if round_status[0]:             # Check if game is won
-                break
+    def _bot_card(self, decision):
+        """Play the card chosen by the bot"""
+        apply_decision(self.__round, self.__round.next_player, decision)
+        self._card_done()
+
+    def _user_card(self, card):
+        """Play the card selected by the user in the GUI"""
+        self.__round.set_play_card(self.__round.next_player, card)
+        self._card_done()
+
+    def _card_done(self):
+        """Schedule the next player or the end of the pass"""
+        if self.__round.next_player is None:
+            self._schedule(self._pass_step, self.card_wait + self.pass_wait)
+        else:
+            self._schedule(self._turn_step, self.card_wait)
+
+    def _pass_step(self):
+        """Update the round for the cards played"""
+        round_status = self.__round.process_pass()
+        if round_status[0]:             # Check if game is won
+            self._end_round(round_status)
+        else:
+            self._schedule(self._turn_step)
+
+    def _end_round(self, round_status):
+        """Display the result of the round"""
         # Print goat status
         text = ""
         if ((self.__round.goat or self.__round.open_goat)
@@ -173,6 +303,7 @@ class ManageRound():
             text = text + "Team " + team + " lost the round."
         else:
             text = "One team had all trump cards. Round is invalid."
+        self.cancel()
         msg.showinfo("Round Over!", text)
         # Update GUI and game_sess at the end of the round
         self.__gui.post_round_update(self.__round)
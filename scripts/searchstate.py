@@ -0,0 +1,210 @@
+from game import GameSession, trick_winner
+from bitboard import (NO_KEYS, CARD_POINTS, SUIT_MASKS, card_id,
+                      cards_to_mask, legal_moves)
+
+
+class SearchState:
+    """
+    This class is a compact copy of a round for tree search. Hands are
+    bitmasks, cards are card ids and suits are suit indices. Moves are
+    played and taken back with play and undo so that a search never has
+    to copy the state. A completed pass is resolved inside play with the
+    same rules as Round.process_pass, but no score is updated.
+
+    Attributes:
+        no_players (int) - number of players in the round
+        hands (list) - bitmask of the cards held by each player
+        trump (int) - trump suit index
+        trick (tuple) - (player, card id) pairs played in the current pass
+        team_pts (tuple) - points gained by each team
+        outcome (str) - None while the round is on, else 'W', 'L' or 'N'
+    """
+    __slots__ = ("no_players", "hands", "trump", "trump_open",
+                 "trump_open_pass", "trump_open_plr", "suit_in_play",
+                 "trick", "next_player", "start_player", "passes_done",
+                 "team_pts", "team_trumps", "wager", "wager_player",
+                 "wager_team", "goat", "open_goat", "outcome", "_undo")
+
+    def __init__(self, no_players, hands, trump, wager, wager_player,
+                 start_player, goat=False, open_goat=False):
+        """
+        Constructor for the SearchState class at the start of a round
+
+        Parameters:
+            no_players (int) - number of players in the round
+            hands (list) - bitmask of the cards held by each player
+            trump (int) - trump suit index
+            wager (int) - wager of the round
+            wager_player (int) - index of the player holding the wager
+            start_player (int) - index of the player starting the round
+        """
+        self.no_players = no_players
+        self.hands = list(hands)
+        self.trump = trump
+        self.trump_open = False
+        self.trump_open_pass = None
+        self.trump_open_plr = None
+        self.suit_in_play = None
+        self.trick = ()
+        self.next_player = start_player
+        self.start_player = start_player
+        self.passes_done = 0
+        self.team_pts = (0, 0)
+        self.team_trumps = (0, 0)
+        self.wager = wager
+        self.wager_player = wager_player
+        self.wager_team = wager_player % GameSession.no_teams
+        self.goat = goat
+        self.open_goat = open_goat
+        self.outcome = None
+        self._undo = []
+
+    @classmethod
+    def from_round(cls, round_, hands=None, trump=None):
+        """
+        Create a search state from the current state of a Round
+
+        Parameters:
+            round_ (Round) - round to copy
+            hands (list) - bitmask of each player's cards, by default the
+                           cards held by the players of the session
+            trump (str) - trump suit to use in place of the round's trump
+        """
+        session = round_.session
+        if hands is None:
+            hands = [cards_to_mask(plr.cards) for plr in session.players]
+        if trump is None:
+            trump = round_.trump
+        state = cls(session.no_players, hands, session.suits[trump],
+                    round_.wager, round_.wager_player, round_.start_player,
+                    round_.goat, round_.open_goat)
+        state.trump_open = round_.trump_open
+        if round_.trump_open:
+            state.trump_open_pass, state.trump_open_plr = round_.trump_open_at
+        if round_.suit_in_play is not None:
+            state.suit_in_play = session.suits[round_.suit_in_play]
+        state.trick = tuple((plr, card_id(card))
+                            for plr, card in round_.play_history[-1])
+        state.next_player = round_.next_player
+        state.passes_done = round_.passes_done
+        state.team_pts = tuple(round_.team_pts)
+        state.team_trumps = tuple(round_.team_trumps)
+        return state
+
+    def legal_moves(self):
+        """
+        Return the mask of cards the next player can play and if the
+        player has to ask for the trump to play
+        """
+        plr = self.next_player
+        return legal_moves(self.hands[plr], self.suit_in_play, self.trump,
+                           self.trump_open, plr == self.wager_player)
+
+    def play(self, card):
+        """
+        Play a card id for the next player. The player asks for the trump
+        if the suit in play is not in the hand. The pass is resolved
+        once all the players have played.
+        """
+        plr = self.next_player
+        self._undo.append((
+                plr, card, self.suit_in_play, self.trick, self.trump_open,
+                self.trump_open_pass, self.trump_open_plr, self.start_player,
+                self.passes_done, self.team_pts, self.team_trumps,
+                self.outcome))
+        hand = self.hands[plr]
+        if (self.suit_in_play is not None and not self.trump_open and
+                not hand & SUIT_MASKS[self.suit_in_play]):
+            self.trump_open = True
+            self.trump_open_pass = self.passes_done + 1
+            self.trump_open_plr = plr
+        self.hands[plr] = hand ^ (1 << card)
+        if not self.trick:
+            self.suit_in_play = card // NO_KEYS
+        self.trick += ((plr, card),)
+        if len(self.trick) < self.no_players:
+            self.next_player = (plr + 1) % self.no_players
+        else:
+            self._resolve_pass()
+
+    def undo(self):
+        """Take back the last card played"""
+        (plr, card, self.suit_in_play, self.trick, self.trump_open,
+         self.trump_open_pass, self.trump_open_plr, self.start_player,
+         self.passes_done, self.team_pts, self.team_trumps,
+         self.outcome) = self._undo.pop()
+        self.hands[plr] |= 1 << card
+        self.next_player = plr
+
+    def undo_all(self):
+        """Take back all the cards played since the state was created"""
+        while self._undo:
+            self.undo()
+
+    def pass_winner(self, trick):
+        """
+        Return the index of the player winning a complete pass with the
+        same rules as Round.process_pass
+        """
+        passes_done = self.passes_done + 1
+        active_from = len(trick)
+        if self.trump_open:
+            if self.trump_open_pass < passes_done:
+                active_from = 0
+            elif self.trump_open_pass == passes_done:
+                for pos in range(1, len(trick)):
+                    if trick[pos][0] == self.trump_open_plr:
+                        active_from = pos
+                        break
+        cards = [card for _, card in trick]
+        return trick[trick_winner(cards, self.trump, cards[0] // NO_KEYS,
+                                  active_from)][0]
+
+    def _resolve_pass(self):
+        """Determine the winner of the pass and check for end of round"""
+        trick = self.trick
+        winner = self.pass_winner(trick)
+        self.passes_done += 1
+        no_teams = GameSession.no_teams
+        pts = list(self.team_pts)
+        trumps = list(self.team_trumps)
+        for plr, card in trick:
+            pts[winner % no_teams] += CARD_POINTS[card]
+            if card // NO_KEYS == self.trump:
+                trumps[plr % no_teams] += 1
+        self.team_pts = tuple(pts)
+        self.team_trumps = tuple(trumps)
+        # Check for the end of the round in the order of process_pass
+        total = GameSession.total_points
+        if (max(trumps) == NO_KEYS or
+                (self.suit_in_play == self.trump and min(trumps) == 0)):
+            self.outcome = 'N'
+        elif self.open_goat and winner != self.wager_player:
+            self.outcome = 'L'
+        else:
+            for i in range(no_teams):
+                if (i == self.wager_team and
+                    ((pts[i] >= self.wager and not self.goat
+                      and pts[(i+1) % 2] > 0) or pts[i] == total)):
+                    self.outcome = 'W'
+                    break
+                elif (i != self.wager_team and
+                      ((pts[i] > 0 and self.goat) or
+                       (total - pts[i]) < self.wager)):
+                    self.outcome = 'L'
+                    break
+        self.trick = ()
+        self.suit_in_play = None
+        self.start_player = winner
+        self.next_player = winner
+
+    def winning_team(self):
+        """
+        Return the team which won the finished round or None if the
+        round was invalid
+        """
+        if self.outcome == 'W':
+            return self.wager_team
+        if self.outcome == 'L':
+            return (self.wager_team + 1) % GameSession.no_teams
+        return None
@@ -0,0 +1,267 @@
+import argparse
+import collections
+import glob
+import multiprocessing as mp
+import os
+import re
+import numpy as np
+from game import GameSession, Player
+from headless import HeadlessGame
+from rlenv import (BID, TRUMP, PLAY, NUM_ACTIONS, PASS_ACTION, TRUMP_ACTION,
+                   bid_action, encode_round, obs_slices)
+from bitboard import card_id
+
+SHARD_PATTERN = "shard_{:06d}.npy"
+
+
+def sample_dtype(no_players):
+    """
+    Return the record of a training sample. The observation and action
+    mask have the layout of VecJackieEnv.
+
+    Fields:
+        obs - observation of the player to act
+        mask - legal actions of the player
+        action - action taken by the player
+        player - index of the player
+        outcome - outcome of the round, 'W'/'L' for the wager team or 'N'
+        points - round points won by the player's team
+    """
+    _, obs_size = obs_slices(no_players)
+    return np.dtype([("obs", np.float32, (obs_size,)),
+                     ("mask", np.bool_, (NUM_ACTIONS,)),
+                     ("action", np.int8),
+                     ("player", np.int8),
+                     ("outcome", "S1"),
+                     ("points", np.int8)])
+
+
+class _Recorder:
+    """Decisions of the players in the round being played"""
+    def __init__(self, no_players):
+        """Constructor for the _Recorder class"""
+        self.dtype = sample_dtype(no_players)
+        self.round_samples = []
+        self.samples = []
+
+    def record(self, plr, action, obs, mask):
+        """Keep a decision until the outcome of the round is known"""
+        self.round_samples.append((obs, mask, action, plr))
+
+    def end_round(self, round_):
+        """Label the decisions of the round with its outcome"""
+        outcome = round_.outcome
+        # The points update_score adds, an invalid round also scores
+        pts = round_.session.round_points(round_.wager, outcome,
+                                          round_.goat, round_.open_goat)
+        for obs, mask, action, plr in self.round_samples:
+            sign = (1 if plr % GameSession.no_teams == round_.wager_team
+                    else -1)
+            self.samples.append((obs, mask, action, plr, outcome, sign * pts))
+        self.round_samples = []
+
+    def take(self):
+        """Return the labelled samples as an array and clear them"""
+        samples = np.array(self.samples, self.dtype)
+        self.samples = []
+        return samples
+
+
+def recording_policy(policy, recorder):
+    """
+    Return a subclass of a bot policy which records the observation,
+    legal actions and action of its wager, trump and card decisions
+    """
+    class RecordingPolicy(policy):
+        def _encode(self, round_, phase):
+            _, obs_size = obs_slices(self.session.no_players)
+            obs = np.empty(obs_size, np.float32)
+            mask = np.empty(NUM_ACTIONS, bool)
+            encode_round(round_, self.index, phase, obs, mask)
+            return obs, mask
+
+        def get_wager(self, wager_history):
+            round_ = self.session.rounds[-1]
+            obs, mask = self._encode(round_, BID)
+            set_wager, value = super().get_wager(wager_history)
+            action = bid_action(value) if set_wager else PASS_ACTION
+            recorder.record(self.index, action, obs, mask)
+            return set_wager, value
+
+        def get_trump(self):
+            round_ = self.session.rounds[-1]
+            obs, mask = self._encode(round_, TRUMP)
+            trump = super().get_trump()
+            action = TRUMP_ACTION + self.session.suits[trump]
+            recorder.record(self.index, action, obs, mask)
+            return trump
+
+        def get_play_card(self, round_):
+            obs, mask = self._encode(round_, PLAY)
+            super().get_play_card(round_)
+            action = card_id(round_.play_history[-1][-1][1])
+            recorder.record(self.index, action, obs, mask)
+
+    RecordingPolicy.__name__ = "Recording" + policy.__name__
+    return RecordingPolicy
+
+
+def _play_rounds(task):
+    """
+    Worker function playing a chunk of rounds of one game session
+
+    Parameters:
+        task (tuple) - (no_players, policies, no_rounds, seed_seq)
+
+    Returns:
+        samples (ndarray) - labelled decisions of the rounds
+    """
+    no_players, policies, no_rounds, seed_seq = task
+    recorder = _Recorder(no_players)
+    policies = [recording_policy(policy, recorder) for policy in policies]
+    game = HeadlessGame(no_players, policies,
+                        seed=np.random.default_rng(seed_seq))
+    for _ in range(no_rounds):
+        game.play_round()
+        recorder.end_round(game.last_round)
+    return recorder.take()
+
+
+class ShardWriter:
+    """
+    This class streams samples to numbered shard files of a fixed number
+    of samples. A shard is written to a temporary file and renamed, so
+    the folder only holds complete shards and numbering resumes after
+    the last shard found.
+
+    Attributes:
+        folder (str) - folder of the shards
+        next_shard (int) - number of the next shard written
+        buffer (ndarray) - samples of the shard being filled
+        count (int) - number of samples in the buffer
+    """
+    def __init__(self, folder, dtype, shard_samples):
+        """
+        Constructor for the ShardWriter class
+
+        Parameters:
+            folder (str) - folder of the shards
+            dtype (numpy.dtype) - record of a sample
+            shard_samples (int) - number of samples in a shard
+        """
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        numbers = [int(re.findall(r"\d+", os.path.basename(path))[0])
+                   for path in glob.glob(os.path.join(folder, "shard_*.npy"))]
+        self.next_shard = max(numbers, default=-1) + 1
+        self.buffer = np.zeros(shard_samples, dtype)
+        self.count = 0
+
+    def write(self, samples):
+        """Add samples, writing a shard whenever the buffer is full"""
+        start = 0
+        while start < len(samples):
+            stop = min(len(samples),
+                       start + len(self.buffer) - self.count)
+            self.buffer[self.count:self.count + stop - start] = \
+                samples[start:stop]
+            self.count += stop - start
+            start = stop
+            if self.count == len(self.buffer):
+                self.flush()
+
+    def flush(self):
+        """Write the buffered samples as a shard"""
+        if not self.count:
+            return
+        path = os.path.join(self.folder,
+                            SHARD_PATTERN.format(self.next_shard))
+        with open(path + ".tmp", "wb") as shard:
+            np.save(shard, self.buffer[:self.count])
+        os.replace(path + ".tmp", path)
+        self.next_shard += 1
+        self.count = 0
+
+
+def generate(folder, no_rounds, no_players=4, policies=None,
+             rounds_per_task=100, processes=None, max_pending=None,
+             shard_bytes=64 << 20, seed=0, callback=None):
+    """
+    Play bot against bot rounds over a process pool and stream the
+    decisions to shards. At most max_pending chunks of rounds are queued
+    or held, so the memory used does not grow with the number of rounds.
+
+    Parameters:
+        folder (str) - folder of the shards
+        no_rounds (int) - number of rounds to play
+        no_players (int) - number of players in the game
+        policies (list) - Player subclass used for each seat
+        rounds_per_task (int) - rounds played by a worker per task
+        processes (int) - size of the process pool
+        max_pending (int) - chunks submitted and not yet written,
+                            by default twice the size of the pool
+        shard_bytes (int) - size of a shard file
+        seed (int) - seed of the run, every chunk has its own stream
+        callback (function) - called with the number of rounds written
+
+    Returns:
+        shards (int) - number of the next shard to be written
+    """
+    if policies is None:
+        policies = [Player] * no_players
+    dtype = sample_dtype(no_players)
+    writer = ShardWriter(folder, dtype,
+                         max(1, shard_bytes // dtype.itemsize))
+    processes = processes or os.cpu_count()
+    max_pending = max_pending or 2 * processes
+    # A resumed run continues with new streams from its first shard
+    first_shard = writer.next_shard
+    no_tasks = -(-no_rounds // rounds_per_task)
+    pending = collections.deque()
+    done = 0
+    with mp.Pool(processes) as pool:
+        for task_no in range(no_tasks + max_pending):
+            if task_no < no_tasks:
+                chunk = min(rounds_per_task,
+                            no_rounds - task_no * rounds_per_task)
+                seed_seq = np.random.SeedSequence(
+                                    seed, spawn_key=(first_shard, task_no))
+                pending.append((chunk, pool.apply_async(
+                                    _play_rounds,
+                                    ((no_players, policies, chunk,
+                                      seed_seq),))))
+            # Wait for the oldest chunk once enough are in flight
+            if len(pending) >= max_pending or task_no >= no_tasks:
+                if not pending:
+                    break
+                chunk, result = pending.popleft()
+                writer.write(result.get())
+                done += chunk
+                if callback is not None:
+                    callback(done)
+    writer.flush()
+    return writer.next_shard
+
+
+def load_shards(folder):
+    """Memory map the shards of a folder in order"""
+    paths = sorted(glob.glob(os.path.join(folder, "shard_*.npy")))
+    return [np.load(path, mmap_mode='r') for path in paths]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                    description="Generate self-play training samples")
+    parser.add_argument("folder")
+    parser.add_argument("-n", "--rounds", type=int, default=10000)
+    parser.add_argument("-p", "--players", type=int, default=4,
+                        choices=GameSession.allowed_players)
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("--shard-mb", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.folder, args.rounds, args.players,
+             processes=args.processes, shard_bytes=args.shard_mb << 20,
+             seed=args.seed,
+             callback=lambda done: print("{} rounds".format(done), end="\r"))
+    print()
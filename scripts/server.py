@@ -0,0 +1,687 @@
+import argparse
+import asyncio
+import json
+import operator
+import struct
+import time
+import events
+from game import GameSession, Player, deal_cards_after_jack
+from bitboard import card_id, cards_to_mask, legal_moves, mask_to_cards
+
+# Messages are UTF-8 JSON objects prefixed by their length
+HEADER = struct.Struct(">I")
+MAX_MESSAGE = 1 << 16
+# A connection is closed when its unsent data grow past this size
+MAX_BUFFER = 1 << 20
+# Phases of a table
+WAITING = "waiting"
+BID = "bid"
+TRUMP = "trump"
+PLAY = "play"
+
+
+class ProtocolError(Exception):
+    """An invalid message of a client, answered with an "error" message"""
+
+
+def check(condition, error):
+    """Raise a ProtocolError with the error message if condition fails"""
+    if not condition:
+        raise ProtocolError(error)
+
+
+def is_int(value):
+    """Return if a decoded JSON value is an integer"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def read_table_id(message):
+    """
+    Return the table id of a message
+
+    Raises:
+        ProtocolError - if the id is not a non-empty string
+    """
+    table_id = message.get("table")
+    check(isinstance(table_id, str) and table_id, "Invalid table id")
+    return table_id
+
+
+def encode(message):
+    """Return the bytes of a message with its length prefix"""
+    # Seats drawn by the session's numpy rng are numpy integers
+    data = json.dumps(message, separators=(",", ":"),
+                      default=operator.index).encode()
+    return HEADER.pack(len(data)) + data
+
+
+async def read_message(reader):
+    """
+    Read the next message of a stream
+
+    Returns:
+        message (dict) - decoded message, None at the end of the stream
+
+    Raises:
+        ProtocolError - if the message is too large or not JSON
+    """
+    try:
+        header = await reader.readexactly(HEADER.size)
+        size, = HEADER.unpack(header)
+        check(size <= MAX_MESSAGE, "Message too large")
+        data = await reader.readexactly(size)
+    except asyncio.IncompleteReadError:
+        return None
+    try:
+        return json.loads(data)
+    except ValueError as error:
+        raise ProtocolError(str(error))
+
+
+class Connection:
+    """
+    This class holds the stream of a client and the seat it has taken
+
+    Attributes:
+        table (Table) - table the client is seated at, None if not seated
+        seat (int) - index of the client's player at the table
+        created (list) - tables created by the client
+    """
+    def __init__(self, writer):
+        self.writer = writer
+        self.table = None
+        self.seat = None
+        self.created = []
+
+    def send(self, message):
+        """Queue a message to the client"""
+        self.send_bytes(encode(message))
+
+    def send_bytes(self, data):
+        """Queue an encoded message, a client too slow to read is closed"""
+        if self.writer.is_closing():
+            return
+        self.writer.write(data)
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFER:
+            self.writer.close()
+
+
+class Table:
+    """
+    This class plays a game session for the clients seated at it. Every
+    move of a client is checked against the rules of the round and the
+    events of the session are sent to the clients, the deal and the
+    trump only to the players who may see them. The seats not taken by
+    clients are played by bots on the server. A table starts once every
+    client seat is taken and deals the next round as soon as a round is
+    scored.
+
+    Attributes:
+        table_id (str) - name of the table
+        session (GameSession) - game session played at the table
+        bots (set) - seats played by the server
+        clients (dict) - maps the seats to the Connection of their client
+        phase (str) - WAITING, BID, TRUMP or PLAY
+        moves (int) - number of moves made by the clients
+    """
+    def __init__(self, table_id, no_players, bots=(), policies=None,
+                 seed=None):
+        """
+        Constructor for the Table class
+
+        Parameters:
+            table_id (str) - name of the table
+            no_players (int) - number of players in the game
+            bots (list) - seats played by the server
+            policies (list) - Player subclass used for each seat
+            seed - seed of the game session
+        """
+        self.session = GameSession(no_players, player_types=policies,
+                                   seed=seed)
+        check(isinstance(bots, (list, tuple)), "Invalid bot seats")
+        for seat in bots:
+            check(is_int(seat) and 0 <= seat < no_players, "Invalid bot seat")
+        check(len(set(bots)) < no_players, "A table needs a client seat")
+        self.table_id = table_id
+        self.bots = set(bots)
+        self.clients = {}
+        self.phase = WAITING
+        self.round = None
+        self.moves = 0
+        self._bid_order = []
+        self.session.events.subscribe(self._on_event)
+
+    def __getstate__(self):
+        """Leave out the clients when the table is moved to a process"""
+        state = self.__dict__.copy()
+        state["clients"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.session.events.subscribe(self._on_event)
+
+    def attach(self, seat, conn):
+        """Seat a client without sending it the state of the table"""
+        check(is_int(seat) and 0 <= seat < self.session.no_players,
+              "Invalid seat")
+        check(seat not in self.bots, "Seat is played by a bot")
+        check(seat not in self.clients, "Seat is taken")
+        self.clients[seat] = conn
+
+    def join(self, seat, conn):
+        """Seat a client and start the game once every seat is taken"""
+        self.attach(seat, conn)
+        try:
+            self._greet(seat, conn)
+        except BaseException:
+            # The client is not left half seated
+            del self.clients[seat]
+            raise
+
+    def _greet(self, seat, conn):
+        """Send the state to a new client and start the game if full"""
+        conn.send(self.view(seat))
+        if self.phase == WAITING:
+            if len(self.clients) + len(self.bots) < self.session.no_players:
+                return
+            self._start_round()
+        self._advance()
+
+    def leave(self, seat):
+        """Free the seat of a client, the game waits for it to return"""
+        del self.clients[seat]
+
+    def handle(self, seat, message):
+        """Apply the move of a client and let the bots play"""
+        kind = message.get("type")
+        if kind == "state":
+            self.clients[seat].send(self.view(seat))
+            return
+        if kind == "bid":
+            self._bid(seat, message.get("wager"))
+        elif kind == "trump":
+            self._set_trump(seat, message.get("suit"))
+        elif kind == "play":
+            self._play(seat, message.get("card"))
+        elif kind == "goat":
+            self._goat(seat)
+        else:
+            raise ProtocolError("Unknown message type")
+        self.moves += 1
+        self._advance()
+
+    def view(self, seat):
+        """Return the state of the table seen from a seat"""
+        message = {"type": "state", "table": self.table_id, "seat": seat,
+                   "phase": self.phase,
+                   "hand": self.session.players[seat].cards,
+                   "score": self.session.score}
+        round_ = self.round
+        if round_ is not None:
+            visible = (round_.trump_open or
+                       self.session.players[seat].stake_player)
+            message["round"] = {
+                "wager": round_.wager,
+                "wager_player": round_.wager_player,
+                "open_goat": round_.open_goat,
+                "goat": round_.goat,
+                "trump": round_.trump if visible else None,
+                "trump_open": round_.trump_open,
+                "next_player": self._turn_seat(),
+                "trick": round_.play_history[-1],
+                "team_pts": round_.team_pts}
+        return message
+
+    def _turn_seat(self):
+        """Return the seat which has to act"""
+        if self.phase == BID:
+            return self._bid_order[0]
+        if self.phase == TRUMP:
+            return self.round.wager_player
+        if self.phase == PLAY:
+            return self.round.next_player
+        return None
+
+    def _start_round(self):
+        """Deal a new round"""
+        session = self.session
+        if session.get_start_player() is None:
+            session.select_start_player()
+        # Only the round being played is kept
+        session.rounds.clear()
+        session.start_round()
+        self.round = session.rounds[-1]
+        deal_cards_after_jack(session)
+        start = session.start_player
+        self._bid_order = [(start + i) % session.no_players
+                           for i in range(session.no_players)]
+        self.phase = BID
+
+    def _advance(self):
+        """Let the bots act until a client has to act"""
+        while self.phase != WAITING:
+            seat = self._turn_seat()
+            if seat not in self.bots:
+                if seat in self.clients:
+                    self._prompt(seat)
+                return
+            self._bot_act(seat)
+
+    def _prompt(self, seat):
+        """Ask a client for its move"""
+        message = {"type": "turn", "action": self.phase, "seat": seat}
+        if self.phase == BID:
+            message["wager"] = self.round.wager
+        elif self.phase == TRUMP:
+            message["suits"] = GameSession.suits_map
+        else:
+            moves, _ = self._legal(seat)
+            message["legal"] = mask_to_cards(moves)
+            message["goat"] = self._can_goat(seat)
+        self.clients[seat].send(message)
+
+    def _bot_act(self, seat):
+        """Let the bot of a seat make its move"""
+        plr = self.session.players[seat]
+        round_ = self.round
+        if self.phase == BID:
+            set_wager, value = plr.get_wager(round_.wager_history)
+            if set_wager:
+                round_.update_wager(plr.ID, value)
+            self._next_bid()
+        elif self.phase == TRUMP:
+            round_.trump = plr.get_trump()
+            self.phase = PLAY
+        else:
+            plr.get_play_card(round_)
+            self._card_played()
+
+    def _bid(self, seat, wager):
+        """Raise the wager or pass, wager is None to pass"""
+        check(self.phase == BID and self._turn_seat() == seat,
+              "Not your turn to bid")
+        if wager is not None:
+            check(wager == "Open Goat" or
+                  (is_int(wager) and
+                   self.round.wager < wager <= GameSession.total_points),
+                  "Invalid wager")
+            self.round.update_wager(self.session.players[seat].ID, wager)
+        self._next_bid()
+
+    def _next_bid(self):
+        """Move to the next bidder or to the choice of the trump"""
+        self._bid_order.pop(0)
+        if self.round.open_goat or not self._bid_order:
+            self.session.players[self.round.wager_player].set_wager_player()
+            self.phase = TRUMP
+
+    def _set_trump(self, seat, suit):
+        """Set the trump chosen by the wager player"""
+        check(self.phase == TRUMP and self.round.wager_player == seat,
+              "Not your turn to set the trump")
+        check(isinstance(suit, str) and suit in GameSession.suits_map,
+              "Invalid suit")
+        self.round.trump = suit
+        self.phase = PLAY
+
+    def _legal(self, seat):
+        """Return the mask of the cards a seat can play and if it asks"""
+        round_ = self.round
+        suits = GameSession.suits
+        suit_in_play = (None if round_.suit_in_play is None
+                        else suits[round_.suit_in_play])
+        return legal_moves(cards_to_mask(self.session.players[seat].cards),
+                           suit_in_play, suits[round_.trump],
+                           round_.trump_open, seat == round_.wager_player)
+
+    def _play(self, seat, card):
+        """Play a card of a client"""
+        check(self.phase == PLAY and self.round.next_player == seat,
+              "Not your turn to play")
+        plr = self.session.players[seat]
+        check(isinstance(card, list) and tuple(card) in plr.cards,
+              "Card not in hand")
+        card = tuple(card)
+        moves, ask_trump = self._legal(seat)
+        check(moves >> card_id(card) & 1, "Card can not be played")
+        if ask_trump:
+            self.round.ask_trump(seat)
+        plr.cards.remove(card)
+        self.round.set_play_card(seat, card)
+        self._card_played()
+
+    def _card_played(self):
+        """Resolve a complete pass and deal again when the round is over"""
+        if self.round.next_player is None:
+            if self.round.process_pass()[0]:
+                self._start_round()
+
+    def _can_goat(self, seat):
+        """Return if a seat can go for goat before leading the pass"""
+        round_ = self.round
+        team = self.session.players[seat].team[2]
+        return (self.phase == PLAY and round_.next_player == seat and
+                not round_.play_history[-1] and team == round_.wager_team and
+                round_.team_pts[(team + 1) % 2] == 0 and
+                not round_.goat and not round_.open_goat)
+
+    def _goat(self, seat):
+        """Go for goat for the wager team"""
+        check(self._can_goat(seat), "Goat can not be called")
+        self.round.set_goat()
+
+    def _on_event(self, event):
+        """Send an event of the session to the clients who may see it"""
+        if isinstance(event, events.Deal):
+            for seat, conn in self.clients.items():
+                conn.send({"type": "event", "event": "Deal",
+                           "round_no": event.round_no,
+                           "hand": event.hands[seat]})
+            return
+        message = dict(event._asdict(), type="event",
+                       event=type(event).__name__)
+        if isinstance(event, events.TrumpSet):
+            seats = [event.player]
+        else:
+            seats = list(self.clients)
+        data = encode(message)
+        for seat in seats:
+            if seat in self.clients:
+                self.clients[seat].send_bytes(data)
+
+
+class GameServer:
+    """
+    This class hosts many tables in one asyncio event loop. Clients
+    connect over TCP or a Unix socket and exchange length prefixed JSON
+    messages. A client creates a table, joins a seat and then sends its
+    bids, trump choice, cards and goat calls when it gets a "turn".
+    An invalid message is answered with an "error" message.
+
+    A table is closed once its last client leaves. The tables a client
+    creates are capped and the ones nobody joined are closed when the
+    client leaves or after join_timeout seconds.
+
+    Attributes:
+        tables (dict) - maps the table names to their Table
+        policy (type) - Player subclass playing the bot seats
+    """
+    # Connections waiting to be accepted, a load run opens many at once
+    backlog = 1024
+    # Open tables a client may have created at once
+    max_created = 8
+    # Seconds a table without clients is kept open
+    join_timeout = 60.0
+
+    def __init__(self, policy=Player):
+        """
+        Constructor for the GameServer class
+
+        Parameters:
+            policy (type) - Player subclass playing the bot seats
+        """
+        self.tables = {}
+        self.policy = policy
+
+    async def serve_tcp(self, host="127.0.0.1", port=0):
+        """Accept clients on a TCP port, 0 for a free port"""
+        return await asyncio.start_server(self.handle_client, host, port,
+                                          backlog=self.backlog)
+
+    async def serve_unix(self, path):
+        """Accept clients on a Unix socket"""
+        return await asyncio.start_unix_server(self.handle_client, path,
+                                               backlog=self.backlog)
+
+    async def handle_client(self, reader, writer):
+        """Read and apply the messages of a client until it leaves"""
+        conn = Connection(writer)
+        try:
+            while not writer.is_closing():
+                try:
+                    message = await read_message(reader)
+                except ProtocolError as error:
+                    # The stream can not be read any further
+                    conn.send({"type": "error", "message": str(error)})
+                    break
+                if message is None:
+                    break
+                try:
+                    self.dispatch(conn, message)
+                except ProtocolError as error:
+                    conn.send({"type": "error", "message": str(error)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._leave(conn)
+            for table in conn.created:
+                self._close_empty(table)
+            writer.close()
+
+    def dispatch(self, conn, message):
+        """
+        Apply a message of a client
+
+        Raises:
+            ProtocolError - if the message is invalid, nothing is changed
+        """
+        check(isinstance(message, dict), "Message must be an object")
+        kind = message.get("type")
+        if kind == "create":
+            table_id = read_table_id(message)
+            check(table_id not in self.tables, "Table already exists")
+            conn.created = [table for table in conn.created
+                            if self.tables.get(table.table_id) is table]
+            check(len(conn.created) < self.max_created,
+                  "Too many open tables")
+            no_players = message.get("players", 4)
+            check(is_int(no_players) and
+                  no_players in GameSession.allowed_players,
+                  "Invalid number of players")
+            seed = message.get("seed")
+            check(seed is None or (is_int(seed) and seed >= 0),
+                  "Invalid seed")
+            table = Table(table_id, no_players, message.get("bots", ()),
+                          [self.policy] * no_players, seed)
+            self.add_table(table)
+            conn.created.append(table)
+            conn.send({"type": "created", "table": table_id})
+        elif kind == "join":
+            check(conn.table is None, "Already seated")
+            table = self.tables.get(read_table_id(message))
+            check(table is not None, "Unknown table")
+            seat = message.get("seat")
+            table.join(seat, conn)
+            conn.table, conn.seat = table, seat
+        elif kind == "leave":
+            self._leave(conn)
+        else:
+            check(conn.table is not None, "Not seated at a table")
+            conn.table.handle(conn.seat, message)
+
+    def _leave(self, conn):
+        """Free the seat of a client, a table without clients is closed"""
+        table = conn.table
+        if table is None:
+            return
+        table.leave(conn.seat)
+        self._close_empty(table)
+        conn.table = conn.seat = None
+
+    def add_table(self, table):
+        """Open a table, it is closed if nobody joins it in time"""
+        self.tables[table.table_id] = table
+        asyncio.get_running_loop().call_later(
+                            self.join_timeout, self._close_empty, table)
+
+    def _close_empty(self, table):
+        """Close a table if it is open and has no clients"""
+        if self.tables.get(table.table_id) is table and not table.clients:
+            del self.tables[table.table_id]
+
+
+class StubClient:
+    """
+    This class is a minimal client of the game server for tests and
+    load runs. It answers every turn with the first legal option.
+    """
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=None, path=None):
+        """Connect to a server on a TCP port or on a Unix socket path"""
+        if path is not None:
+            streams = await asyncio.open_unix_connection(path)
+        else:
+            streams = await asyncio.open_connection(host, port)
+        return cls(*streams)
+
+    async def send(self, message):
+        """Send a message to the server"""
+        self.writer.write(encode(message))
+        await self.writer.drain()
+
+    async def receive(self, *kinds):
+        """
+        Return the next message from the server, skipping the messages
+        which are not of the given types if any are given
+        """
+        while True:
+            message = await read_message(self.reader)
+            if message is None:
+                raise ConnectionError("Connection closed by the server")
+            if not kinds or message["type"] in kinds:
+                return message
+
+    async def autoplay(self, no_rounds):
+        """
+        Answer the turns of the client's seat until no_rounds are scored
+
+        Returns:
+            moves (int) - number of moves sent
+        """
+        moves = 0
+        scored = 0
+        while scored < no_rounds:
+            message = await self.receive()
+            if message["type"] == "turn":
+                await self.send(self.answer(message))
+                moves += 1
+            elif message["type"] == "error":
+                raise ProtocolError(message["message"])
+            elif message.get("event") == "RoundScored":
+                scored += 1
+        return moves
+
+    @staticmethod
+    def answer(turn):
+        """Return the first legal answer to a turn"""
+        if turn["action"] == BID:
+            return {"type": "bid", "wager": None}
+        if turn["action"] == TRUMP:
+            return {"type": "trump", "suit": turn["suits"][0]}
+        return {"type": "play", "card": turn["legal"][0]}
+
+    async def close(self):
+        """Close the connection"""
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play_tables(address, no_tables, no_rounds, no_players, clients):
+    """
+    Play rounds at many tables with stub clients
+
+    Parameters:
+        address (dict) - "port" or "path" of the server to connect to
+        no_tables (int) - number of tables played at once
+        no_rounds (int) - rounds played at each table
+        no_players (int) - number of players at a table
+        clients (int) - seats taken by stub clients, the rest are bots
+
+    Returns:
+        moves (int) - moves made by the clients
+    """
+    async def run_table(table_no):
+        table = str(table_no)
+        stubs = [await StubClient.connect(**address) for _ in range(clients)]
+        await stubs[0].send({"type": "create", "table": table,
+                             "players": no_players, "seed": table_no,
+                             "bots": list(range(clients, no_players))})
+        await stubs[0].receive("created")
+        for seat, stub in enumerate(stubs):
+            await stub.send({"type": "join", "table": table, "seat": seat})
+        moves = await asyncio.gather(*(stub.autoplay(no_rounds)
+                                       for stub in stubs))
+        for stub in stubs:
+            await stub.close()
+        return sum(moves)
+
+    moves = await asyncio.gather(*(run_table(i) for i in range(no_tables)))
+    return sum(moves)
+
+
+async def _load_run(no_tables, no_rounds, no_players, clients, path=None):
+    """Play rounds at many tables with stub clients on a local server"""
+    server = GameServer()
+    if path is not None:
+        listener = await server.serve_unix(path)
+        address = {"path": path}
+    else:
+        listener = await server.serve_tcp()
+        address = {"port": listener.sockets[0].getsockname()[1]}
+    start = time.perf_counter()
+    moves = await play_tables(address, no_tables, no_rounds, no_players,
+                              clients)
+    elapsed = time.perf_counter() - start
+    listener.close()
+    await listener.wait_closed()
+    return moves, elapsed
+
+
+def load_run(no_tables=100, no_rounds=10, no_players=4, clients=1,
+             path=None):
+    """
+    Measure the server with stub clients at many tables in one process
+
+    Parameters:
+        no_tables (int) - number of tables played at once
+        no_rounds (int) - rounds played at each table
+        no_players (int) - number of players at a table
+        clients (int) - seats taken by stub clients, the rest are bots
+        path (str) - Unix socket path, TCP on the loopback if None
+
+    Returns:
+        moves (int) - moves made by the clients
+        elapsed (float) - time taken in seconds
+    """
+    return asyncio.run(_load_run(no_tables, no_rounds, no_players, clients,
+                                 path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the game server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7700)
+    parser.add_argument("--unix", help="serve on a Unix socket path")
+    parser.add_argument("--load", type=int, metavar="TABLES",
+                        help="play TABLES tables with stub clients instead")
+    args = parser.parse_args()
+    if args.load:
+        moves, elapsed = load_run(args.load, path=args.unix)
+        print("{} client moves in {:.2f}s, {:.0f} moves/s".format(
+                                        moves, elapsed, moves / elapsed))
+    else:
+        async def main():
+            server = GameServer()
+            if args.unix:
+                listener = await server.serve_unix(args.unix)
+            else:
+                listener = await server.serve_tcp(args.host, args.port)
+            async with listener:
+                await listener.serve_forever()
+        asyncio.run(main())
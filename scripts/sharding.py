@@ -0,0 +1,675 @@
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+from game import Player
+from server import (HEADER, Connection, GameServer, ProtocolError, check,
+                    encode, is_int, play_tables, read_message,
+                    read_table_id)
+
+# Points of every worker on the hash ring
+REPLICAS = 160
+# A worker answers a sync once the messages sent before it are applied
+SYNC = {"type": "sync"}
+SYNCED = encode({"type": "synced"})
+# Messages only the supervisor sends to the workers
+SUPERVISOR_MESSAGES = ("route", "sync", "attach")
+
+
+def _hash(key):
+    """Return the position of a key on the hash ring"""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    This class maps table ids to workers with consistent hashing. Every
+    worker has REPLICAS points on the ring and a table belongs to the
+    worker of the first point after the hash of its id, so removing a
+    worker only moves the tables it owned.
+
+    Attributes:
+        nodes (set) - workers on the ring
+    """
+    def __init__(self, nodes=(), replicas=REPLICAS):
+        """
+        Constructor for the HashRing class
+
+        Parameters:
+            nodes (list) - workers on the ring
+            replicas (int) - points of every worker on the ring
+        """
+        self.replicas = replicas
+        self.nodes = set()
+        self.__points = []      # Sorted (hash, node) pairs
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        """Place a worker on the ring"""
+        assert node not in self.nodes, "Worker already on the ring"
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            bisect.insort(self.__points, (_hash("{}:{}".format(node, i)),
+                                          node))
+
+    def remove(self, node):
+        """Take a worker off the ring"""
+        self.nodes.remove(node)
+        self.__points = [point for point in self.__points
+                         if point[1] != node]
+
+    def owner(self, key):
+        """Return the worker owning a table id"""
+        assert self.__points, "No worker on the ring"
+        i = bisect.bisect(self.__points, (_hash(key),))
+        return self.__points[i % len(self.__points)][1]
+
+
+class WorkerServer(GameServer):
+    """
+    This class is the game server of a worker process. Besides the
+    client messages it answers the commands of the supervisor, which
+    read its load and move its tables to another worker. Only the
+    supervisor connects to a worker, on a Unix socket in a directory
+    private to the user running it.
+
+    Attributes:
+        messages (int) - client messages handled
+        busy (float) - time in seconds spent handling client messages
+    """
+    def __init__(self, policy=Player):
+        super().__init__(policy)
+        self.messages = 0
+        self.busy = 0.0
+
+    def dispatch(self, conn, message):
+        """
+        Apply a client message. The supervisor names the "route" of the
+        client on a stream, "attach"es the clients of a moved table and
+        "sync"s the streams of a table it moves.
+        """
+        start = time.perf_counter()
+        kind = message.get("type") if isinstance(message, dict) else None
+        try:
+            if kind == "route":
+                check(is_int(message.get("route")), "Invalid route")
+                conn.route = message["route"]
+            elif kind == "sync":
+                conn.send_bytes(SYNCED)
+            elif kind == "attach":
+                check(conn.table is None, "Already seated")
+                table = self.tables.get(read_table_id(message))
+                check(table is not None, "Unknown table")
+                seat = message.get("seat")
+                table.attach(seat, conn)
+                conn.table, conn.seat = table, seat
+            else:
+                super().dispatch(conn, message)
+        finally:
+            self.messages += 1
+            self.busy += time.perf_counter() - start
+
+    def _seats(self, table):
+        """Return the route of the supervisor stream of each seat"""
+        return {seat: getattr(conn, "route", None)
+                for seat, conn in table.clients.items()}
+
+    def control(self, command, arg=None):
+        """
+        Run a command of the supervisor
+
+        Parameters:
+            command (str) - "metrics", "tables", "seats", "export" or
+                            "import"
+            arg - table id for "seats" and "export", pickled table to
+                  import
+
+        Returns:
+            result - load of the worker for "metrics", table ids for
+                     "tables", seats taken at the table for "seats", the
+                     pickled table and its seats for "export"
+        """
+        if command == "metrics":
+            return {"pid": os.getpid(),
+                    "tables": len(self.tables),
+                    "clients": sum(len(table.clients)
+                                   for table in self.tables.values()),
+                    "moves": sum(table.moves
+                                 for table in self.tables.values()),
+                    "messages": self.messages,
+                    "busy": self.busy,
+                    "cpu": time.process_time()}
+        if command == "tables":
+            return list(self.tables)
+        if command == "import":
+            table = pickle.loads(arg)
+            check(table.table_id not in self.tables, "Table already exists")
+            self.add_table(table)
+            return None
+        table = self.tables.get(arg)
+        check(table is not None, "Unknown table")
+        if command == "seats":
+            return self._seats(table)
+        if command == "export":
+            seats = self._seats(table)
+            for conn in table.clients.values():
+                conn.table = conn.seat = None
+            del self.tables[arg]
+            return pickle.dumps(table), seats
+        raise ProtocolError("Unknown command")
+
+
+def _worker_main(control, policy, path):
+    """Run a worker process until the supervisor stops it"""
+    asyncio.run(_serve_worker(control, policy, path))
+
+
+async def _serve_worker(control, policy, path):
+    """Serve the supervisor on a socket path and answer its commands"""
+    server = WorkerServer(policy)
+    listener = await server.serve_unix(path)
+    os.chmod(path, 0o600)
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+
+    async def run(command, arg):
+        return server.control(command, arg)
+
+    def read_commands():
+        control.send(None)
+        while True:
+            try:
+                command, arg = control.recv()
+            except EOFError:
+                command = "stop"
+            if command == "stop":
+                loop.call_soon_threadsafe(stopped.set_result, None)
+                return
+            try:
+                result = asyncio.run_coroutine_threadsafe(
+                                        run(command, arg), loop).result()
+                control.send((True, result))
+            except ProtocolError as error:
+                control.send((False, str(error)))
+
+    threading.Thread(target=read_commands, daemon=True).start()
+    await stopped
+    listener.close()
+
+
+class Worker:
+    """
+    This class is the supervisor's handle of a worker process
+
+    Attributes:
+        index (int) - number of the worker
+        process (Process) - process running the WorkerServer
+        path (str) - Unix socket path the worker serves the supervisor on
+    """
+    def __init__(self, index, policy, context, path):
+        """
+        Constructor for the Worker class, the process is started
+
+        Parameters:
+            index (int) - number of the worker
+            policy (type) - Player subclass playing the bot seats
+            context - multiprocessing context used to start the process
+            path (str) - Unix socket path the worker serves on
+        """
+        self.index = index
+        self.path = path
+        self.__control, child = context.Pipe()
+        self.process = context.Process(target=_worker_main,
+                                       args=(child, policy, path),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.__lock = asyncio.Lock()
+
+    async def started(self):
+        """Wait for the worker to serve clients"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.__control.recv)
+
+    async def call(self, command, arg=None):
+        """
+        Run a command in the worker and return its result
+
+        Raises:
+            ProtocolError - if the worker rejects the command
+        """
+        async with self.__lock:
+            loop = asyncio.get_running_loop()
+            ok, result = await loop.run_in_executor(None, self._exchange,
+                                                    command, arg)
+        if not ok:
+            raise ProtocolError(result)
+        return result
+
+    def _exchange(self, command, arg):
+        self.__control.send((command, arg))
+        return self.__control.recv()
+
+    def stop(self):
+        """Stop the process of the worker"""
+        try:
+            self.__control.send(("stop", None))
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class Route(Connection):
+    """
+    This class is a client of the supervisor. Its messages are sent on
+    to the worker owning their table over one stream per worker, and the
+    messages of the workers are relayed back unchanged.
+
+    Attributes:
+        route_id (int) - number of the client, sent to the workers
+        upstreams (dict) - maps the workers to the (writer, relay task)
+                           of the client's stream to them
+        current (int) - worker of the table the client joined last
+        lock (asyncio.Lock) - held while a message is sent on or while
+                              the client's table is moved
+        synced (asyncio.Event) - set when a worker answers a sync
+        closed (bool) - whether the client has left
+    """
+    def __init__(self, writer, route_id):
+        super().__init__(writer)
+        self.route_id = route_id
+        self.upstreams = {}
+        self.current = None
+        self.lock = asyncio.Lock()
+        self.synced = asyncio.Event()
+        self.closed = False
+
+
+class Supervisor:
+    """
+    This class shards the tables of the game server over worker
+    processes which share nothing. A table lives in the worker its id is
+    hashed to on a HashRing and the supervisor routes the messages of
+    the clients to it. Draining a worker takes it off the ring and moves
+    each of its tables, with its seated clients, to the table's new
+    owner. The commands are sent to the workers over pipes and the
+    workers serve the supervisor on Unix sockets in a private temporary
+    directory, so no broker is needed and no other user can reach them.
+
+    Attributes:
+        workers (list) - Worker handle of every worker
+        ring (HashRing) - workers taking tables, the drained ones are
+                          left out
+    """
+    def __init__(self, no_workers=None, policy=Player,
+                 replicas=REPLICAS):
+        """
+        Constructor for the Supervisor class
+
+        Parameters:
+            no_workers (int) - number of worker processes, one per core
+                               by default
+            policy (type) - Player subclass playing the bot seats
+            replicas (int) - points of every worker on the hash ring
+        """
+        self.no_workers = no_workers or os.cpu_count()
+        self.policy = policy
+        self.workers = []
+        self.ring = HashRing(replicas=replicas)
+        self.__routes = {}      # (worker, route id) -> Route
+        self.__route_ids = itertools.count()
+        self.__moving = {}      # table id -> Event set once it is moved
+        self.__drains = {}      # worker -> (ring before, Event when done)
+        self.__migration = None
+        self.__socket_dir = None
+
+    async def start(self):
+        """Start the worker processes"""
+        context = multiprocessing.get_context("spawn")
+        self.__migration = asyncio.Lock()
+        # mkdtemp makes a directory only the user can enter
+        self.__socket_dir = tempfile.mkdtemp(prefix="jackie-workers-")
+        self.workers = [Worker(i, self.policy, context,
+                               os.path.join(self.__socket_dir,
+                                            "worker{}.sock".format(i)))
+                        for i in range(self.no_workers)]
+        await asyncio.gather(*(worker.started() for worker in self.workers))
+        for worker in self.workers:
+            self.ring.add(worker.index)
+
+    async def serve_tcp(self, host="127.0.0.1", port=0):
+        """Accept clients on a TCP port, 0 for a free port"""
+        return await asyncio.start_server(self.handle_client, host, port,
+                                          backlog=GameServer.backlog)
+
+    async def serve_unix(self, path):
+        """Accept clients on a Unix socket"""
+        return await asyncio.start_unix_server(self.handle_client, path,
+                                               backlog=GameServer.backlog)
+
+    async def handle_client(self, reader, writer):
+        """Route the messages of a client until it leaves"""
+        route = Route(writer, next(self.__route_ids))
+        try:
+            while not writer.is_closing():
+                try:
+                    message = await read_message(reader)
+                except ProtocolError as error:
+                    route.send({"type": "error", "message": str(error)})
+                    break
+                if message is None:
+                    break
+                try:
+                    await self._forward(route, message)
+                except ProtocolError as error:
+                    route.send({"type": "error", "message": str(error)})
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            async with route.lock:
+                route.closed = True
+                for worker in list(route.upstreams):
+                    await self._detach(route, worker)
+            writer.close()
+
+    async def _forward(self, route, message):
+        """Send a client message to the worker owning its table"""
+        check(isinstance(message, dict), "Message must be an object")
+        kind = message.get("type")
+        check(kind not in SUPERVISOR_MESSAGES, "Unknown message type")
+        if kind in ("create", "join"):
+            table_id = read_table_id(message)
+            event = self._moving_event(table_id)
+            while event is not None:
+                await event.wait()
+                event = self._moving_event(table_id)
+        async with route.lock:
+            if kind in ("create", "join"):
+                worker = self.ring.owner(table_id)
+                if kind == "join":
+                    route.current = worker
+            else:
+                worker = route.current
+                check(worker is not None, "Not seated at a table")
+            upstream = await self._upstream(route, worker)
+            upstream.write(encode(message))
+
+    def _moving_event(self, table_id):
+        """
+        Return the Event to wait for before routing to a table, None if
+        it is not moved. The tables of a drained worker wait until it is
+        emptied, a table created meanwhile would be left behind.
+        """
+        if table_id in self.__moving:
+            return self.__moving[table_id]
+        for index, (ring, done) in self.__drains.items():
+            if ring.owner(table_id) == index:
+                return done
+        return None
+
+    async def _upstream(self, route, worker):
+        """Return the writer of the client's stream to a worker"""
+        if worker not in route.upstreams:
+            reader, writer = await asyncio.open_unix_connection(
+                                                self.workers[worker].path)
+            writer.write(encode({"type": "route", "route": route.route_id}))
+            self.__routes[worker, route.route_id] = route
+            task = asyncio.ensure_future(self._relay(route, worker, reader))
+            route.upstreams[worker] = (writer, task)
+        return route.upstreams[worker][0]
+
+    async def _relay(self, route, worker, reader):
+        """Send the messages of a worker back to the client"""
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                size, = HEADER.unpack(header)
+                data = header + await reader.readexactly(size)
+                if data == SYNCED:
+                    route.synced.set()
+                else:
+                    route.send_bytes(data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        route.synced.set()
+        if worker in route.upstreams:
+            # The worker closed the stream, not the supervisor
+            route.writer.close()
+
+    async def _detach(self, route, worker):
+        """Close the client's stream to a worker once it is answered"""
+        writer, task = route.upstreams.pop(worker)
+        try:
+            # The worker reads the messages sent so far before the end
+            writer.write_eof()
+            await task
+        except ConnectionError:
+            task.cancel()
+        writer.close()
+        del self.__routes[worker, route.route_id]
+
+    async def migrate(self, table_id, source, target):
+        """
+        Move a table and its seated clients to another worker. The
+        messages of the clients wait until the table is moved.
+
+        Parameters:
+            table_id (str) - id of the table
+            source (int) - worker the table is in
+            target (int) - worker the table is moved to
+        """
+        async with self.__migration:
+            self.__moving.setdefault(table_id, asyncio.Event())
+            seats = {}
+            try:
+                # The table is exported once the moves of its clients
+                # sent so far are applied and answered
+                while True:
+                    routes = await self.workers[source].call("seats",
+                                                             table_id)
+                    routes = {seat: route_id
+                              for seat, route_id in routes.items()
+                              if seat not in seats}
+                    if not routes:
+                        break
+                    await self._pause(source, routes, seats)
+                table, routes = await self.workers[source].call("export",
+                                                                table_id)
+                await self._pause(source, routes, seats)
+                await self.workers[target].call("import", table)
+                attached = []
+                for seat, route in seats.items():
+                    if source in route.upstreams:
+                        await self._detach(route, source)
+                    if route.closed:
+                        continue
+                    upstream = await self._upstream(route, target)
+                    upstream.write(encode({"type": "attach",
+                                           "table": table_id, "seat": seat}))
+                    route.current = target
+                    attached.append(route)
+                # Every seat is attached before a client moves again,
+                # else the events of a move miss the seats not attached
+                await self._sync(target, attached)
+            finally:
+                for route in seats.values():
+                    route.lock.release()
+                self.__moving.pop(table_id).set()
+
+    async def _pause(self, worker, route_ids, seats):
+        """Stop the clients of the seats and sync their streams"""
+        routes = []
+        for seat, route_id in route_ids.items():
+            route = self.__routes.get((worker, route_id))
+            if route is None or seat in seats:
+                continue
+            await route.lock.acquire()
+            seats[seat] = route
+            if worker in route.upstreams:
+                routes.append(route)
+        await self._sync(worker, routes)
+
+    async def _sync(self, worker, routes):
+        """Wait until a worker has applied the messages of the routes"""
+        for route in routes:
+            route.synced.clear()
+            route.upstreams[worker][0].write(encode(SYNC))
+        for route in routes:
+            await route.synced.wait()
+
+    async def drain(self, index):
+        """
+        Take a worker off the ring and move its tables to their new
+        owners. The clients creating or joining a table of the worker
+        wait until it is drained.
+
+        Returns:
+            moved (int) - number of tables moved
+        """
+        assert len(self.ring.nodes) > 1, "Can not drain the last worker"
+        done = asyncio.Event()
+        self.__drains[index] = (HashRing(self.ring.nodes,
+                                         self.ring.replicas), done)
+        self.ring.remove(index)
+        moved = 0
+        try:
+            tables = await self.workers[index].call("tables")
+            while tables:
+                for table_id in tables:
+                    try:
+                        await self.migrate(table_id, index,
+                                           self.ring.owner(table_id))
+                    except ProtocolError:
+                        # The table was closed by its clients meanwhile
+                        continue
+                    moved += 1
+                tables = await self.workers[index].call("tables")
+        finally:
+            # The clients waiting for the worker's tables are let through
+            # even if the drain failed
+            del self.__drains[index]
+            done.set()
+        return moved
+
+    async def metrics(self):
+        """
+        Return the load of every worker
+
+        Returns:
+            metrics (list) - per worker the pid, tables, clients, moves of
+                             the clients, messages handled, busy and cpu
+                             time in seconds and whether it is drained
+        """
+        loads = await asyncio.gather(*(worker.call("metrics")
+                                       for worker in self.workers))
+        for worker, load in zip(self.workers, loads):
+            load["worker"] = worker.index
+            load["drained"] = worker.index not in self.ring.nodes
+        return loads
+
+    def close(self):
+        """Stop the worker processes"""
+        for worker in self.workers:
+            worker.stop()
+        if self.__socket_dir is not None:
+            shutil.rmtree(self.__socket_dir, ignore_errors=True)
+            self.__socket_dir = None
+
+
+async def _load_run(no_workers, no_tables, no_rounds, no_players, clients,
+                    drain_after):
+    """Play tables with stub clients through a local supervisor"""
+    supervisor = Supervisor(no_workers)
+    await supervisor.start()
+    listener = await supervisor.serve_tcp()
+    address = {"port": listener.sockets[0].getsockname()[1]}
+
+    async def drain():
+        await asyncio.sleep(drain_after)
+        return await supervisor.drain(0)
+
+    start = time.perf_counter()
+    play = play_tables(address, no_tables, no_rounds, no_players, clients)
+    if drain_after is None:
+        moves, moved = await play, 0
+    else:
+        moves, moved = await asyncio.gather(play, drain())
+    elapsed = time.perf_counter() - start
+    metrics = await supervisor.metrics()
+    listener.close()
+    await listener.wait_closed()
+    supervisor.close()
+    return moves, elapsed, moved, metrics
+
+
+def load_run(no_workers=None, no_tables=100, no_rounds=10, no_players=4,
+             clients=1, drain_after=None):
+    """
+    Measure the sharded server with stub clients at many tables
+
+    Parameters:
+        no_workers (int) - number of worker processes
+        no_tables (int) - number of tables played at once
+        no_rounds (int) - rounds played at each table
+        no_players (int) - number of players at a table
+        clients (int) - seats taken by stub clients, the rest are bots
+        drain_after (float) - seconds after which worker 0 is drained
+                              while the tables play, None to not drain
+
+    Returns:
+        moves (int) - moves made by the clients
+        elapsed (float) - time taken in seconds
+        moved (int) - tables moved off the drained worker
+        metrics (list) - load of every worker at the end of the run
+    """
+    return asyncio.run(_load_run(no_workers, no_tables, no_rounds,
+                                 no_players, clients, drain_after))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        description="Run the game server on worker processes")
+    parser.add_argument("-w", "--workers", type=int,
+                        help="number of worker processes, one per core")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7700)
+    parser.add_argument("--unix", help="serve on a Unix socket path")
+    parser.add_argument("--load", type=int, metavar="TABLES",
+                        help="play TABLES tables with stub clients instead")
+    parser.add_argument("--drain", type=float, metavar="SECONDS",
+                        help="drain worker 0 after SECONDS of the load run")
+    args = parser.parse_args()
+    if args.load:
+        moves, elapsed, moved, metrics = load_run(
+                        args.workers, args.load, drain_after=args.drain)
+        print("{} client moves in {:.2f}s, {:.0f} moves/s, {} tables "
+              "moved".format(moves, elapsed, moves / elapsed, moved))
+        for load in metrics:
+            print("worker {worker}: {tables} tables, {messages} messages, "
+                  "{busy:.2f}s busy, {cpu:.2f}s cpu".format(**load))
+    else:
+        async def main():
+            supervisor = Supervisor(args.workers)
+            await supervisor.start()
+            if args.unix:
+                listener = await supervisor.serve_unix(args.unix)
+            else:
+                listener = await supervisor.serve_tcp(args.host, args.port)
+            try:
+                async with listener:
+                    await listener.serve_forever()
+            finally:
+                supervisor.close()
+        asyncio.run(main())
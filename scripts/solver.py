@@ -0,0 +1,214 @@
+from game import GameSession
+from bitboard import NO_KEYS, CARD_POINTS, iter_ids, mask_points
+from searchstate import SearchState
+
+# Value of each outcome for the wager team
+OUTCOME_VALUE = {'W': 1, 'N': 0, 'L': -1}
+VALUE_OUTCOME = {1: 'W', 0: 'N', -1: 'L'}
+# Keys whose card is worth the same as the next higher card in the suit.
+# Such a pair in one hand is equivalent and only the higher is searched.
+_TWIN_KEYS = tuple(k for k in range(NO_KEYS - 1)
+                   if CARD_POINTS[k] == CARD_POINTS[k + 1])
+
+
+class DoubleDummySolver:
+    """
+    This class solves a round with all the hands known. The search is an
+    alpha-beta search over single card plays on a SearchState, with a
+    transposition table keyed on the hands and the trick state at the
+    start of every pass. Moves are searched from the highest card of the
+    heirarchy down. The rules of play are the same as Round.process_pass.
+
+    Attributes:
+        nodes (int) - number of states visited by the last solve
+        max_entries (int) - size at which the table is cleared
+    """
+    max_entries = 1 << 20
+
+    def __init__(self):
+        self.nodes = 0
+        self._tt = {}
+        self._context = None
+
+    def _prepare(self, state, mode):
+        """Clear the table if it was filled for another kind of round"""
+        context = (mode, state.no_players, state.trump, state.wager,
+                   state.wager_player, state.goat, state.open_goat)
+        if context != self._context or len(self._tt) > self.max_entries:
+            self._tt = {}
+            self._context = context
+        self.nodes = 0
+
+    def solve_points(self, state):
+        """
+        Find the points each team ends with when all the remaining cards
+        are played, the wager team maximising its points
+
+        Parameters:
+            state (SearchState) - state to solve, it is left unchanged
+
+        Returns:
+            points (tuple) - final points of (wager team, other team)
+        """
+        self._prepare(state, 'points')
+        team = state.wager_team
+        remaining = sum(mask_points(hand) for hand in state.hands)
+        remaining += sum(CARD_POINTS[card] for _, card in state.trick)
+        future = self._points(state, 0, remaining + 1)
+        current = state.team_pts
+        return (current[team] + future,
+                current[1 - team] + remaining - future)
+
+    def solve_outcome(self, state):
+        """
+        Find the result of the round against the wager with the round
+        ending as soon as it is won or lost
+
+        Parameters:
+            state (SearchState) - state to solve, it is left unchanged
+
+        Returns:
+            outcome (str) - 'W' or 'L' for the wager team, 'N' if invalid
+        """
+        self._prepare(state, 'outcome')
+        if state.outcome is not None:
+            return state.outcome
+        return VALUE_OUTCOME[self._outcome(state, -1, 1)]
+
+    def _moves(self, state):
+        """
+        Return the moves of the next player. Cards which take the pass
+        are tried first from the top of the heirarchy, then the others
+        from the bottom.
+        """
+        mask, _ = state.legal_moves()
+        plr = state.next_player
+        trick = state.trick
+        winning, losing = [], []
+        for card in iter_ids(mask):
+            if card % NO_KEYS in _TWIN_KEYS and mask >> (card + 1) & 1:
+                continue
+            if not trick or state.pass_winner(trick + ((plr, card),)) == plr:
+                winning.append(card)
+            else:
+                losing.append(card)
+        winning.reverse()
+        return winning + losing
+
+    def _points(self, state, alpha, beta):
+        """Return the points the wager team gains from the state on"""
+        self.nodes += 1
+        hands = state.hands
+        key = None
+        if not state.trick:
+            if not any(hands):
+                return 0
+            key = (tuple(hands), state.next_player, state.trump_open)
+            bounds = self._tt.get(key)
+            if bounds is None:
+                # The points left in the hands bound the value
+                bounds = (0, sum(mask_points(hand) for hand in hands))
+            low, high = bounds
+            if low >= beta or low == high:
+                return low
+            if high <= alpha:
+                return high
+            alpha = max(alpha, low)
+            beta = min(beta, high)
+        alpha_orig, beta_orig = alpha, beta
+        team = state.wager_team
+        maximise = state.next_player % GameSession.no_teams == team
+        before = state.team_pts[team]
+        best = None
+        for card in self._moves(state):
+            state.play(card)
+            gained = state.team_pts[team] - before
+            value = gained + self._points(state, alpha - gained,
+                                          beta - gained)
+            state.undo()
+            if maximise:
+                if best is None or value > best:
+                    best = value
+                alpha = max(alpha, value)
+            else:
+                if best is None or value < best:
+                    best = value
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        if key is not None:
+            low, high = self._tt.get(key, bounds)
+            if best <= alpha_orig:
+                high = min(high, best)
+            elif best >= beta_orig:
+                low = max(low, best)
+            else:
+                low = high = best
+            self._tt[key] = (low, high)
+        return best
+
+    def _outcome(self, state, alpha, beta):
+        """Return the value of the outcome of the round for the wager team"""
+        self.nodes += 1
+        if state.outcome is not None:
+            return OUTCOME_VALUE[state.outcome]
+        hands = state.hands
+        key = None
+        if not state.trick:
+            if not any(hands):
+                return 0
+            key = (tuple(hands), state.next_player, state.trump_open,
+                   state.team_pts, state.team_trumps)
+            bounds = self._tt.get(key)
+            if bounds is not None:
+                low, high = bounds
+                if low >= beta or low == high:
+                    return low
+                if high <= alpha:
+                    return high
+                alpha = max(alpha, low)
+                beta = min(beta, high)
+        alpha_orig, beta_orig = alpha, beta
+        maximise = (state.next_player % GameSession.no_teams ==
+                    state.wager_team)
+        best = None
+        for card in self._moves(state):
+            state.play(card)
+            value = self._outcome(state, alpha, beta)
+            state.undo()
+            if maximise:
+                if best is None or value > best:
+                    best = value
+                alpha = max(alpha, value)
+            else:
+                if best is None or value < best:
+                    best = value
+                beta = min(beta, value)
+            if alpha >= beta:
+                break
+        if key is not None:
+            low, high = self._tt.get(key, (-1, 1))
+            if best <= alpha_orig:
+                high = min(high, best)
+            elif best >= beta_orig:
+                low = max(low, best)
+            else:
+                low = high = best
+            self._tt[key] = (low, high)
+        return best
+
+
+def solve_round(round_, mode='outcome'):
+    """
+    Solve a Round with the hands held by the players of its session
+
+    Parameters:
+        round_ (Round) - round to solve
+        mode (str) - 'outcome' for the result against the wager or
+                     'points' for the final points of the teams
+    """
+    state = SearchState.from_round(round_)
+    solver = DoubleDummySolver()
+    if mode == 'points':
+        return solver.solve_points(state)
+    return solver.solve_outcome(state)
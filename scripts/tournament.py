@@ -0,0 +1,193 @@
+import argparse
+import itertools
+import multiprocessing as mp
+import numpy as np
+from game import GameSession, Player
+from headless import HeadlessGame
+
+# Counters collected for every strategy
+STAT_KEYS = ("matches", "match_wins", "rounds", "round_wins", "points",
+             "bids", "bid_wins", "jackies")
+
+
+class TournamentResult:
+    """
+    This class accumulates the statistics of the strategies in a tournament.
+    Results of the workers are merged into it as they arrive.
+
+    Attributes:
+        stats (dict) - maps (strategy name, no of players) to a dict of
+                       the counters in STAT_KEYS
+    """
+    def __init__(self):
+        self.stats = {}
+
+    def add(self, name, no_players, key, value=1):
+        """Add a value to a counter of a strategy"""
+        counters = self.stats.setdefault(
+                            (name, no_players), dict.fromkeys(STAT_KEYS, 0))
+        counters[key] += value
+
+    def merge(self, other):
+        """Merge the statistics of another result into this one"""
+        for (name, no_players), counters in other.stats.items():
+            for key, value in counters.items():
+                self.add(name, no_players, key, value)
+        return self
+
+    def summary(self):
+        """
+        Return the win rates and averages of every strategy
+
+        Returns:
+            summary (dict) - maps (strategy name, no of players) to a dict
+                             with the match/round win rates, the average
+                             points per round, the bid success rate and
+                             the jackies received per match
+        """
+        summary = {}
+        for entry, cnt in sorted(self.stats.items()):
+            summary[entry] = {
+                "matches": cnt["matches"],
+                "match_win_rate": cnt["match_wins"] / max(cnt["matches"], 1),
+                "round_win_rate": cnt["round_wins"] / max(cnt["rounds"], 1),
+                "points_per_round": cnt["points"] / max(cnt["rounds"], 1),
+                "bid_success": cnt["bid_wins"] / max(cnt["bids"], 1),
+                "jackies_per_match": cnt["jackies"] / max(cnt["matches"], 1)}
+        return summary
+
+
+def _play_matches(task):
+    """
+    Worker function that plays a chunk of matches between two strategies.
+    Every match is played twice with the strategies swapping teams.
+
+    Parameters:
+        task (tuple) - (no_players, strategies, no_matches,
+                        max_rounds, seed_seq)
+    """
+    no_players, strategies, no_matches, max_rounds, seed_seq = task
+    rng = np.random.default_rng(seed_seq)
+    result = TournamentResult()
+    for _ in range(no_matches):
+        for swap in range(GameSession.no_teams):
+            # Name and Player class of the strategy used by each team
+            team_strat = [strategies[(team + swap) % 2]
+                          for team in range(GameSession.no_teams)]
+            policies = [team_strat[i % 2][1] for i in range(no_players)]
+            game = HeadlessGame(no_players, policies, seed=rng)
+            game_sess = game.game_sess
+            for _ in range(max_rounds):
+                jackies = list(game_sess.score[1])
+                outcome = game.play_round()
+                round_ = game.last_round
+                pts = game_sess.round_points(
+                        round_.wager, outcome, round_.goat, round_.open_goat)
+                for team, (name, _) in enumerate(team_strat):
+                    result.add(name, no_players, "rounds")
+                    if team == round_.wager_team:
+                        result.add(name, no_players, "bids")
+                        result.add(name, no_players, "points", pts)
+                        if outcome == 'W':
+                            result.add(name, no_players, "bid_wins")
+                            result.add(name, no_players, "round_wins")
+                    else:
+                        result.add(name, no_players, "points", -pts)
+                        if outcome == 'L':
+                            result.add(name, no_players, "round_wins")
+                if game_sess.jackie_given:
+                    # The team whose count went up has received the jackie
+                    for team, (name, _) in enumerate(team_strat):
+                        if game_sess.score[1][team] > jackies[team]:
+                            result.add(name, no_players, "jackies")
+                        else:
+                            result.add(name, no_players, "match_wins")
+                    break
+            for name, _ in team_strat:
+                result.add(name, no_players, "matches")
+    return result
+
+
+class Tournament:
+    """
+    This class plays matches between bot strategies over a process pool.
+    Every pair of strategies meets on each table size and the matches
+    are split into tasks with independent and reproducible seeds.
+
+    Attributes:
+        strategies (dict) - maps a strategy name to a Player subclass
+        table_sizes (tuple) - number of players in the tables played
+        result (TournamentResult) - statistics merged so far
+    """
+    def __init__(self, strategies, table_sizes=GameSession.allowed_players,
+                 max_rounds=100, seed=0):
+        """
+        Constructor for the Tournament class
+
+        Parameters:
+            strategies (dict) - maps a strategy name to a Player subclass.
+                                Classes must be importable by the workers
+            table_sizes (tuple) - number of players in the tables played
+            max_rounds (int) - rounds after which a match is a draw
+            seed (int) - seed of the whole tournament
+        """
+        assert len(strategies) >= 1, "No strategies to compare"
+        for no_players in table_sizes:
+            assert no_players in GameSession.allowed_players, \
+                "Invalid number of players"
+        self.strategies = strategies
+        self.table_sizes = tuple(table_sizes)
+        self.max_rounds = max_rounds
+        self.seed = seed
+        self.result = TournamentResult()
+
+    def _tasks(self, no_matches, chunk_size):
+        """Generate the tasks of the tournament with their seeds"""
+        names = sorted(self.strategies)
+        pairs = list(itertools.combinations(names, 2)) or [(names[0],) * 2]
+        chunks = []
+        for pair, no_players in itertools.product(pairs, self.table_sizes):
+            for start in range(0, no_matches, chunk_size):
+                chunks.append((no_players, pair,
+                               min(chunk_size, no_matches - start)))
+        seeds = np.random.SeedSequence(self.seed).spawn(len(chunks))
+        for (no_players, pair, count), seed_seq in zip(chunks, seeds):
+            strategies = tuple((name, self.strategies[name])
+                               for name in pair)
+            yield (no_players, strategies, count, self.max_rounds, seed_seq)
+
+    def run(self, no_matches, processes=None, chunk_size=50, callback=None):
+        """
+        Play the tournament and merge the results as they arrive
+
+        Parameters:
+            no_matches (int) - matches per pair of strategies and table size
+            processes (int) - size of the process pool, defaults to the
+                              number of cores
+            chunk_size (int) - matches played by a worker per task
+            callback (function) - called with the merged result after
+                                  every task
+
+        Returns:
+            result (TournamentResult) - statistics of the tournament
+        """
+        tasks = self._tasks(no_matches, chunk_size)
+        with mp.Pool(processes) as pool:
+            for partial in pool.imap_unordered(_play_matches, tasks):
+                self.result.merge(partial)
+                if callback is not None:
+                    callback(self.result)
+        return self.result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+                        description="Compare bot strategies over all cores")
+    parser.add_argument("-m", "--matches", type=int, default=100)
+    parser.add_argument("-j", "--processes", type=int, default=None)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    args = parser.parse_args()
+    tournament = Tournament({"base": Player}, seed=args.seed)
+    result = tournament.run(args.matches, args.processes)
+    for (name, no_players), stats in result.summary().items():
+        print(name, no_players, stats)
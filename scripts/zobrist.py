@@ -0,0 +1,64 @@
+import numpy as np
+import game
+
+# Limits of the games covered by the keys
+MAX_PLAYERS = 8
+NO_CARDS = 24
+NO_SUITS = 4
+MAX_PASSES = NO_CARDS // 4
+# The keys are fixed so that hashes are the same in every process
+_rng = np.random.default_rng(0x5A0B9157)
+
+
+def _keys(*shape):
+    """Return random 64 bit keys as nested lists of Python integers"""
+    return _rng.integers(0, 2**64, size=shape, dtype=np.uint64).tolist()
+
+
+# Card held by a player, card played by a player in the current pass
+OWNER = _keys(MAX_PLAYERS, NO_CARDS)
+TRICK = _keys(MAX_PLAYERS, NO_CARDS)
+TRUMP = _keys(NO_SUITS)
+TRUMP_OPEN = _keys(1)[0]
+# Pass (starting from 1) and player at which the trump was revealed
+TRUMP_OPEN_AT = _keys(MAX_PASSES + 1, MAX_PLAYERS)
+GOAT = _keys(1)[0]
+OPEN_GOAT = _keys(1)[0]
+TO_MOVE = _keys(MAX_PLAYERS)
+
+
+def round_hash(round_):
+    """
+    Compute the Zobrist hash of a Round from scratch. The hash covers the
+    cards held by every player, the cards of the current pass, the trump
+    suit, when the trump was revealed, the goat flags and the player to
+    move. The points of the teams are not part of the hash.
+
+    Parameters:
+        round_ (Round) - round whose session holds the player's hands
+
+    Returns:
+        key (int) - 64 bit hash of the round
+    """
+    session = round_.session
+    # game imports this module, its tables are read when a hash is made
+    card_index = game.CARD_INDEX
+    key = 0
+    for plr in session.players:
+        owner = OWNER[plr.index]
+        for card in plr.cards:
+            key ^= owner[card_index[card]]
+    for plr, card in round_.play_history[-1]:
+        key ^= TRICK[plr][card_index[card]]
+    if round_.trump is not None:
+        key ^= TRUMP[session.suits[round_.trump]]
+    if round_.trump_open:
+        pass_, plr = round_.trump_open_at
+        key ^= TRUMP_OPEN ^ TRUMP_OPEN_AT[pass_][plr]
+    if round_.goat:
+        key ^= GOAT
+    if round_.open_goat:
+        key ^= OPEN_GOAT
+    if round_.next_player is not None:
+        key ^= TO_MOVE[round_.next_player]
+    return key
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules of the game import each other from the scripts directory
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir,
+                                "scripts"))
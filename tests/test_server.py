@@ -0,0 +1,146 @@
+import asyncio
+import pytest
+from server import (BID, HEADER, MAX_MESSAGE, PLAY, TRUMP, GameServer,
+                    StubClient)
+
+
+def run_server(test, tmp_path):
+    """Run a test coroutine against a server on a temporary socket"""
+    path = str(tmp_path / "server.sock")
+
+    async def main():
+        server = GameServer()
+        listener = await server.serve_unix(path)
+        try:
+            return await test(server, path)
+        finally:
+            listener.close()
+            await listener.wait_closed()
+    return asyncio.run(main())
+
+
+async def seat_clients(path, no_clients, table="t", seed=1):
+    """Return the clients seated at a table played by bots otherwise"""
+    clients = [await StubClient.connect(path=path)
+               for _ in range(no_clients)]
+    await clients[0].send({"type": "create", "table": table, "seed": seed,
+                           "bots": list(range(no_clients, 4))})
+    await clients[0].receive("created")
+    for seat, client in enumerate(clients):
+        await client.send({"type": "join", "table": table, "seat": seat})
+        await client.receive("state")
+    return clients
+
+
+async def state(client):
+    """Return the state of the client's table"""
+    await client.send({"type": "state"})
+    return await client.receive("state")
+
+
+async def rejected(client, message):
+    """Send a message and return the error it is answered with"""
+    await client.send(message)
+    reply = await asyncio.wait_for(client.receive("error"), 5)
+    return reply["message"]
+
+
+def test_full_table(tmp_path):
+    async def test(server, path):
+        clients = await seat_clients(path, 2, seed=3)
+        moves = await asyncio.gather(*(client.autoplay(3)
+                                       for client in clients))
+        assert all(moves)
+        assert server.tables["t"].moves == sum(moves)
+        for client in clients:
+            await client.close()
+        await asyncio.sleep(0.05)
+        assert not server.tables
+    run_server(test, tmp_path)
+
+
+def test_illegal_moves(tmp_path):
+    async def test(server, path):
+        client, = await seat_clients(path, 1)
+        while True:
+            turn = await client.receive("turn")
+            if turn["action"] == PLAY:
+                break
+            await client.send(client.answer(turn))
+        before = await state(client)
+        moves = server.tables["t"].moves
+        absent = [[suit, 1] for suit in "HDSC"
+                  if [suit, 1] not in before["hand"]]
+        illegal = [card for card in before["hand"]
+                   if card not in turn["legal"]]
+        messages = [{"type": "bid", "wager": 20},
+                    {"type": "trump", "suit": "H"},
+                    {"type": "play", "card": "H1"},
+                    {"type": "play", "card": absent[0]},
+                    {"type": "play"},
+                    {"type": "fold"},
+                    {"type": "join", "table": "t", "seat": 1},
+                    {"type": "create", "table": 5},
+                    {"type": "create"},
+                    [1, 2]] + [{"type": "play", "card": card}
+                               for card in illegal]
+        for message in messages:
+            await rejected(client, message)
+        assert await state(client) == before
+        assert server.tables["t"].moves == moves
+        # The table goes on with a legal move
+        await client.send(client.answer(turn))
+        await client.receive("event")
+        assert server.tables["t"].moves == moves + 1
+        await client.close()
+    run_server(test, tmp_path)
+
+
+def test_out_of_turn(tmp_path):
+    async def test(server, path):
+        clients = await seat_clients(path, 2)
+        before = await state(clients[0])
+        to_act = before["round"]["next_player"]
+        waiting = clients[1 - to_act]
+        moves = server.tables["t"].moves
+        for action in (BID, TRUMP, PLAY):
+            turn = {"action": action, "suits": ["H"],
+                    "legal": [before["hand"][0]]}
+            error = await rejected(waiting, StubClient.answer(turn))
+            assert error.startswith("Not your turn")
+        assert await state(clients[0]) == before
+        assert server.tables["t"].moves == moves
+        for client in clients:
+            await client.close()
+    run_server(test, tmp_path)
+
+
+@pytest.mark.parametrize("frame", [HEADER.pack(3) + b"{x}",
+                                   HEADER.pack(MAX_MESSAGE + 1)])
+def test_malformed_frames(tmp_path, frame):
+    async def test(server, path):
+        client, = await seat_clients(path, 1)
+        before = await state(client)
+        intruder = await StubClient.connect(path=path)
+        intruder.writer.write(frame)
+        assert (await intruder.receive())["type"] == "error"
+        # The stream can not be read any further and is closed
+        with pytest.raises(ConnectionError):
+            await intruder.receive()
+        assert await state(client) == before
+        await client.close()
+    run_server(test, tmp_path)
+
+
+def test_created_tables(tmp_path):
+    async def test(server, path):
+        client = await StubClient.connect(path=path)
+        for i in range(server.max_created):
+            await client.send({"type": "create", "table": str(i)})
+            await client.receive("created")
+        error = await rejected(client, {"type": "create", "table": "x"})
+        assert error == "Too many open tables"
+        await client.close()
+        await asyncio.sleep(0.05)
+        assert not server.tables
+    run_server(test, tmp_path)
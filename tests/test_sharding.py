@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from server import GameServer, StubClient
+from sharding import Supervisor
+
+NO_TABLES = 12
+NO_ROUNDS = 6
+
+
+def run_supervisor(test, tmp_path):
+    """Run a test coroutine against two workers on a temporary socket"""
+    path = str(tmp_path / "supervisor.sock")
+
+    async def main():
+        supervisor = Supervisor(2)
+        await supervisor.start()
+        listener = await supervisor.serve_unix(path)
+        try:
+            return await test(supervisor, {"path": path})
+        finally:
+            listener.close()
+            await listener.wait_closed()
+            supervisor.close()
+    return asyncio.run(main())
+
+
+async def play(address, supervisor=None):
+    """
+    Play tables of two stub clients and two bots, the worker of the
+    first table is drained once every table is playing
+
+    Returns:
+        moves (int) - moves made by the clients
+        moved (int) - tables moved off the drained worker
+    """
+    tables = []
+    for i in range(NO_TABLES):
+        stubs = [await StubClient.connect(**address) for _ in range(2)]
+        await stubs[0].send({"type": "create", "table": str(i), "seed": i,
+                             "bots": [2, 3]})
+        await stubs[0].receive("created")
+        for seat, stub in enumerate(stubs):
+            await stub.send({"type": "join", "table": str(i), "seat": seat})
+            await stub.receive("state")
+        tables += stubs
+    games = asyncio.gather(*(stub.autoplay(NO_ROUNDS) for stub in tables))
+    moved = 0
+    if supervisor is not None:
+        moved = await supervisor.drain(supervisor.ring.owner("0"))
+    moves = await asyncio.wait_for(games, 120)
+    for stub in tables:
+        await stub.close()
+    return sum(moves), moved
+
+
+def test_drain_with_live_tables(tmp_path):
+    async def test(supervisor, address):
+        moves, moved = await play(address, supervisor)
+        assert moved
+        path = str(tmp_path / "server.sock")
+        listener = await GameServer().serve_unix(path)
+        assert moves == (await play({"path": path}))[0]
+        listener.close()
+        await listener.wait_closed()
+        await asyncio.sleep(0.05)
+        metrics = await supervisor.metrics()
+        assert [load["tables"] for load in metrics] == [0, 0]
+    run_supervisor(test, tmp_path)
+
+
+def test_failed_drain_releases_tables(tmp_path):
+    async def test(supervisor, address):
+        client = await StubClient.connect(**address)
+        for i in range(4):
+            await client.send({"type": "create", "table": str(i),
+                               "bots": [1, 2, 3]})
+            await client.receive("created")
+        index = supervisor.ring.owner("0")
+
+        async def migrate(table_id, source, target):
+            raise ConnectionError("Worker died")
+        supervisor.migrate = migrate
+        with pytest.raises(ConnectionError):
+            await supervisor.drain(index)
+        # Joining a table which was not moved is answered at once
+        await client.send({"type": "join", "table": "0", "seat": 0})
+        await asyncio.wait_for(client.receive("state", "error"), 5)
+        await client.close()
+    run_supervisor(test, tmp_path)